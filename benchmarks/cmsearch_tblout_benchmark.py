@@ -0,0 +1,97 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# Copyright 2018 EMBL - European Bioinformatics Institute
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""
+    Compares the former cmsearch tblout parsing approaches with read_tblout on a generated table.
+
+    Usage:
+        PYTHONPATH=. python benchmarks/cmsearch_tblout_benchmark.py --lines 10000000
+"""
+import argparse
+import csv
+import os
+import random
+import re
+import sys
+import tempfile
+import time
+
+from mgnify_util.parser.cmsearch_deoverlap_parser import remove_empty_elements
+from mgnify_util.parser.cmsearch_tblout import read_tblout
+
+LINE = '{:<24} -         {:<20} {}   cm   {:>6} {:>6} {:>8} {:>8}      {}    no    1 0.52   0.1  {:>5.1f}   {:.2g} {}   -\n'
+PROJECTION = ('target_name', 'query_name', 'query_accession', 'mdl_from', 'mdl_to', 'seq_from', 'seq_to', 'strand')
+
+
+def write_table(filename, n_lines):
+    rnd = random.Random(1)
+    with open(filename, 'w') as out:
+        for i in range(n_lines):
+            seq_from = rnd.randint(1, 5000)
+            out.write(LINE.format('TRINITY-DN{}-c0-g1-i1'.format(i // 3), 'SSU_rRNA_bacteria', 'RF00177',
+                                  rnd.randint(1, 100), rnd.randint(100, 1500), seq_from, seq_from + rnd.randint(50, 900),
+                                  rnd.choice('+-'), rnd.uniform(10, 1000), rnd.uniform(1e-30, 1),
+                                  rnd.choice('!?')))
+
+
+def csv_reader(filename):
+    # Former DeoverlapResultParser approach
+    with open(filename) as file:
+        for row in csv.reader(file, delimiter=" ", quotechar='"'):
+            row = remove_empty_elements(row)
+            yield row[0], row[2], row[3], row[5], row[6], int(row[7]), int(row[8]), row[9]
+
+
+def regex_reader(filename):
+    # Former parse_matches approach
+    with open(filename) as file:
+        for line in file:
+            chunks = re.findall(r'(\S+)', line.rstrip("\n\r"))
+            yield (chunks[0], chunks[2], chunks[3], int(chunks[5]), int(chunks[6]), int(chunks[7]), int(chunks[8]),
+                   chunks[9])
+
+
+def split_reader(filename):
+    with open(filename) as file:
+        yield from read_tblout(file, PROJECTION)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark of cmsearch tblout readers')
+    parser.add_argument('--lines', type=int, default=10000000, help='Number of lines of the generated table')
+    parser.add_argument('--table', help='Existing tblout file to use instead of a generated one')
+    args = parser.parse_args(argv)
+
+    filename = args.table
+    if filename is None:
+        filename = os.path.join(tempfile.mkdtemp(), 'benchmark.tbl')
+        write_table(filename, args.lines)
+
+    timings = {}
+    for name, reader in (('csv', csv_reader), ('re.findall', regex_reader), ('read_tblout', split_reader)):
+        start = time.perf_counter()
+        count = sum(1 for _ in reader(filename))
+        timings[name] = time.perf_counter() - start
+        print('{:<12} {:>10} rows {:>8.2f}s'.format(name, count, timings[name]))
+    for name in ('csv', 're.findall'):
+        print('read_tblout is {:.1f}x faster than {}'.format(timings[name] / timings['read_tblout'], name))
+
+    if args.table is None:
+        os.remove(filename)
+        os.rmdir(os.path.dirname(filename))
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
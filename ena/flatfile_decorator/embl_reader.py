@@ -0,0 +1,169 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# Copyright 2018 EMBL - European Bioinformatics Institute
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+from mgnify_util.compression import open_input
+
+__author__ = "Maxim Scheremetjew"
+__version__ = "0.1"
+__status__ = "Development"
+
+RECORD_TERMINATOR = '\n//\n'
+READ_SIZE = 4 * 1024 * 1024
+FEATURE_PREFIX = 'FT   '
+# Feature keys start at column 6, qualifiers and locations at column 22
+QUALIFIER_COLUMN = 21
+
+
+class EmblFeature:
+    """
+        Feature table entry, e.g.
+
+            FT   CDS             complement(216..>920)
+            FT                   /codon_start=1
+            FT                   /translation="FWLKWLAQTSAADRSPCDLPPKSSRGRMADSAVSTADSSEWDLLD
+            FT                   ARDASILDWEVLSSIRWAPTDDDTRSVAESLASSASLCTAIGWPSLSHAARAARSGELL"
+    """
+
+    def __init__(self, key: str, location: str, qualifier_lines: list):
+        self.key = key
+        self.location = location
+        self._qualifier_lines = qualifier_lines
+        self._qualifiers = None
+
+    @property
+    def qualifiers(self):
+        """
+            Continuation lines are joined with a space, except for /translation.
+        :return: list of (name, value) tuples, value is None for qualifiers without value and unquoted otherwise
+        """
+        if self._qualifiers is None:
+            self._qualifiers = []
+            name = None
+            parts = []
+            for line in self._qualifier_lines + ['/']:
+                if line.startswith('/'):
+                    if name is not None:
+                        value = ('' if name == 'translation' else ' ').join(parts) if parts else None
+                        if value is not None and len(value) > 1 and value[0] == '"' and value[-1] == '"':
+                            value = value[1:-1]
+                        self._qualifiers.append((name, value))
+                    name, _, value = line[1:].partition('=')
+                    parts = [value] if value else []
+                else:
+                    parts.append(line)
+        return self._qualifiers
+
+    def get_qualifiers(self, name: str):
+        return [value for qualifier, value in self.qualifiers if qualifier == name]
+
+
+class EmblRecord:
+    """
+        Text of one EMBL flatfile record, including its // terminator line. The accession and the feature
+        table are only parsed when asked for.
+    """
+
+    __slots__ = ('text', '_features')
+
+    def __init__(self, text: str):
+        self.text = text
+        self._features = None
+
+    def _find_line(self, prefix: str):
+        if self.text.startswith(prefix):
+            index = 0
+        else:
+            index = self.text.find('\n' + prefix)
+            if index < 0:
+                return None
+            index += 1
+        end = self.text.find('\n', index)
+        return self.text[index:end if end >= 0 else len(self.text)]
+
+    @property
+    def accession(self):
+        """
+            Sequence accession of the 'AC * ' line written by EMBLmyGFF3, e.g. AC * _TRINITY-DN10011-c0-g1-i1
+            gives TRINITY-DN10011-c0-g1-i1, or None.
+        """
+        line = self._find_line('AC * ')
+        return line.replace('AC * _', '').rstrip() if line is not None else None
+
+    @property
+    def features(self):
+        """
+        :return: list of EmblFeature
+        """
+        if self._features is None:
+            self._features = []
+            feature = None
+            for line in self.text.splitlines():
+                if not line.startswith(FEATURE_PREFIX):
+                    if feature is not None and not line.startswith('FT'):
+                        # The feature table is one block of FT lines
+                        break
+                    continue
+                content = line[QUALIFIER_COLUMN:].rstrip()
+                key = line[len(FEATURE_PREFIX):QUALIFIER_COLUMN].strip()
+                if key:
+                    feature = EmblFeature(key, content, [])
+                    self._features.append(feature)
+                elif feature is not None:
+                    if content.startswith('/') or feature._qualifier_lines:
+                        feature._qualifier_lines.append(content)
+                    else:
+                        # Location continuation line
+                        feature.location += content
+        return self._features
+
+    def __str__(self):
+        return self.text
+
+
+def iter_records(file, read_size=READ_SIZE):
+    """
+        Splits an EMBL flatfile into records on // terminator lines, reading read_size characters at a time.
+
+    :param file: file object opened in text mode
+    :return: generator of EmblRecord
+    """
+    pending = ''
+    while True:
+        chunk = file.read(read_size)
+        if not chunk:
+            break
+        # The terminator may start in the previous chunk
+        search_start = max(len(pending) - len(RECORD_TERMINATOR) + 1, 0)
+        data = pending + chunk if pending else chunk
+        start = 0
+        while True:
+            end = data.find(RECORD_TERMINATOR, search_start)
+            if end < 0:
+                break
+            end += len(RECORD_TERMINATOR)
+            yield EmblRecord(data[start:end])
+            start = search_start = end
+        pending = data[start:]
+    if pending.strip():
+        # Last record without terminator or without trailing newline
+        yield EmblRecord(pending)
+
+
+def iter_records_file(embl_file, read_size=READ_SIZE):
+    """
+        Same as iter_records for a (possibly compressed) EMBL flatfile.
+    """
+    with open_input(embl_file) as file:
+        yield from iter_records(file, read_size)
@@ -15,15 +15,23 @@
 # limitations under the License.
 import argparse
 import logging
+import multiprocessing
 import os
 import sys
+from collections import deque
 
+from ena.flatfile_decorator.embl_reader import EmblRecord, iter_records
+from mgnify_util.compression import open_input, is_compressed
+from mgnify_util.parser.interproscan_cache import InterProScanCache, CachedAnnotationMap
 from mgnify_util.parser.interproscan_parser import InterProScanTSVResultParser
 
 __author__ = "Maxim Scheremetjew"
 __version__ = "0.1"
 __status__ = "Development"
 
+# Number of records collected before a write, also the number of records per worker task
+WRITE_BATCH_SIZE = 1000
+
 
 def parse_accession(aline):
     return aline.replace('AC * _', '').rstrip()
@@ -45,49 +53,130 @@ class FlatfileDecorator:
                 return None
         return annotations.get(identifier)
 
+    @staticmethod
+    def decorate_record(record, annotation_map: dict, i5_version: str, tag_name: str) -> str:
+        """
+            Adds the functional annotations of the record's sequence after each line containing the tag. As before,
+            tag lines of sequences without annotations are left out.
+        :return: text of the decorated record
+        """
+        text = record.text
+        index = text.find(tag_name)
+        if index < 0:
+            return text
+        acc = record.accession
+        annotations = FlatfileDecorator.lookup_seq_id(acc, annotation_map) if acc is not None else None
+        annotation_lines = None
+        if annotations:
+            annotation_lines = [f'/inference="protein motif:{annot.database}:{annot.identifier}"\n'
+                                for annot in annotations.get_all_annotations()]
+            # Add prediction tool line
+            annotation_lines.append(f'/inference="ab initio prediction:InterProScan:{i5_version}"\n')
+
+        pieces = []
+        position = 0
+        while index >= 0:
+            line_start = text.rfind('\n', 0, index) + 1
+            line_end = text.find('\n', index) + 1 or len(text)
+            pieces.append(text[position:line_start])
+            if annotation_lines:
+                new_line_start = text[line_start:index - 1]
+                pieces.append(text[line_start:line_end])
+                pieces.extend(new_line_start + line for line in annotation_lines)
+            position = line_end
+            index = text.find(tag_name, position)
+        pieces.append(text[position:])
+        return ''.join(pieces)
+
     def add_func_annotations(self, annotation_map: dict,
                              i5_version: str,
-                             tag_name: str):
+                             tag_name: str,
+                             threads: int = 1):
         """
             This method call will perform the actual decoration with functional
-            annotations.
+            annotations. The flatfile is processed in chunks of records, the
+            annotations of a chunk are looked up at once.
 
             List of databases can be found here:
             https://www.ncbi.nlm.nih.gov/genbank/collab/db_xref/
+        :param threads: number of worker processes, with more than one the
+                        records are decorated in chunks by a process pool
         :return:
         """
-        infile = open(self._input_embl_flatfile, "r")
-        outfile = open(self._output_file, "w")
-        aline = infile.readline()
-        while aline:
-            if 'AC *' in aline:
-                acc = parse_accession(aline)
-                annotations = self.lookup_seq_id(acc, annotation_map)
-            if tag_name in aline:
-                index = aline.index(tag_name)
-                new_line_start = aline[0:index - 1]
-                if annotations:
-                    new_lines = [aline]
-                    for annot in annotations.get_all_annotations():
-                        database = annot.database
-                        identifier = annot.identifier
-                        new_line = ''.join(
-                            [new_line_start,
-                             f'/inference="protein motif:{database}:{identifier}"\n'])
-                        new_lines.append(new_line)
-                    # Add prediction tool line
-                    new_lines.append(''.join(
-                        [new_line_start,
-                         f'/inference="ab initio prediction:InterProScan:{i5_version}"\n']))
-
-                    outfile.writelines(new_lines)
-            else:
-                outfile.write(aline)
-
-            aline = infile.readline()
-
-        infile.close()
-        outfile.close()
+        with open_input(self._input_embl_flatfile) as infile, open(self._output_file, "w") as outfile:
+            if threads and threads > 1:
+                self._add_func_annotations_parallel(iter_records(infile), outfile, annotation_map, i5_version,
+                                                    tag_name, threads)
+                return
+            for texts, chunk_annotations in self._iter_chunks(iter_records(infile), annotation_map, WRITE_BATCH_SIZE):
+                outfile.write(_decorate_chunk(texts, chunk_annotations, i5_version, tag_name))
+
+    @classmethod
+    def _iter_chunks(cls, records, annotation_map: dict, chunk_size: int):
+        """
+            Groups records into chunks together with the annotations of their sequences only.
+        :return: generator of (list of record texts, dict of sequence identifier -> annotations)
+        """
+        texts = []
+        accessions = []
+        for record in records:
+            texts.append(record.text)
+            accessions.append(record.accession)
+            if len(texts) >= chunk_size:
+                yield texts, cls._lookup_chunk(accessions, annotation_map)
+                texts = []
+                accessions = []
+        if texts:
+            yield texts, cls._lookup_chunk(accessions, annotation_map)
+
+    @classmethod
+    def _lookup_chunk(cls, accessions: list, annotation_map: dict):
+        """
+            Looks up the annotations of a chunk of sequences, with a single get_many call if the map supports it
+            (see CachedAnnotationMap).
+        :return: dict of sequence identifier -> annotations
+        """
+        if hasattr(annotation_map, 'get_many'):
+            annotation_map = annotation_map.get_many([f'{acc}.p{peptide}' for acc in accessions if acc is not None
+                                                      for peptide in (1, 2)])
+        chunk_annotations = {}
+        for acc in accessions:
+            annotations = cls.lookup_seq_id(acc, annotation_map) if acc is not None else None
+            if annotations is not None:
+                # Stored under the identifier lookup_seq_id tries first. Sets are not guaranteed to iterate in the
+                # same order once unpickled, the order of this process is kept so that output matches threads=1
+                chunk_annotations[f'{acc}.p1'] = _AnnotationList(annotations.get_all_annotations())
+        return chunk_annotations
+
+    def _add_func_annotations_parallel(self, records, outfile, annotation_map: dict, i5_version: str, tag_name: str,
+                                       threads: int, chunk_size: int = WRITE_BATCH_SIZE):
+        """
+            Decorates chunks of records in a process pool and writes them in the original order. At most two chunks
+            per worker are in flight, so memory use does not depend on the size of the flatfile.
+        """
+        with multiprocessing.Pool(threads) as pool:
+            pending = deque()
+            for texts, chunk_annotations in self._iter_chunks(records, annotation_map, chunk_size):
+                pending.append(pool.apply_async(_decorate_chunk, (texts, chunk_annotations, i5_version, tag_name)))
+                if len(pending) >= 2 * threads:
+                    outfile.write(pending.popleft().get())
+            while pending:
+                outfile.write(pending.popleft().get())
+
+
+class _AnnotationList:
+    __slots__ = ('_annotations',)
+
+    def __init__(self, annotations):
+        self._annotations = tuple(annotations)
+
+    def get_all_annotations(self):
+        return self._annotations
+
+
+def _decorate_chunk(texts: list, annotation_map: dict, i5_version: str, tag_name: str) -> str:
+    return ''.join(FlatfileDecorator.decorate_record(EmblRecord(text), annotation_map, i5_version, tag_name)
+                   for text in texts)
 
 
 def parse_args(args):
@@ -101,6 +190,11 @@ def parse_args(args):
     parser.add_argument('--tag-name', help='Name of the tag to search for in the CDS feature section.',
                         default='transl_table')
     parser.add_argument('-o', '--out_flatfile', help='EMBL flatfile output')
+    parser.add_argument('--cache', help='SQLite cache of InterProScan annotations keyed by protein MD5. '
+                                        'Annotations of already cached proteins are reused instead of parsed.')
+    parser.add_argument('--cache-size', type=int, help='Maximum number of proteins kept in the cache')
+    parser.add_argument('--threads', type=int, default=1,
+                        help='Number of worker processes decorating chunks of records in parallel')
     parser.add_argument('-v', '--verbose', action='store_true')
     return parser.parse_args(args)
 
@@ -122,11 +216,23 @@ def main(argv=None):
     if os.path.exists(input_file) and not args.out_flatfile:
         dir_name, file_name = os.path.split(input_file)
         output_file_name = file_name.replace('.embl', '.new.embl')
+        if is_compressed(input_file):
+            # Output is written uncompressed
+            output_file_name = os.path.splitext(output_file_name)[0]
         output_file = os.path.join(dir_name, output_file_name)
     else:
         logging.ERROR(f'File {input_file} does not exist!')
         sys.exit(1)
 
+    if args.cache:
+        with InterProScanCache(args.cache, i5_version, args.cache_size) as cache:
+            ipro_parser = InterProScanTSVResultParser(annotation_file)
+            ipro_parser.parse_file_cached(cache)
+            flatfile_decorator = FlatfileDecorator(input_file, output_file)
+            flatfile_decorator.add_func_annotations(CachedAnnotationMap(ipro_parser.md5s, cache), i5_version,
+                                                    tag_name, args.threads)
+        return
+
     # Step 1: Parse InterProScan annotation file
     ipro_parser = InterProScanTSVResultParser(annotation_file)
     ipro_parser.parse_file()
@@ -143,7 +249,7 @@ def main(argv=None):
     # Step 2: Decorate flaffile with db_xrefs
     flatfile_decorator = FlatfileDecorator(input_file, output_file)
 
-    flatfile_decorator.add_func_annotations(ipro_parser.annotations, i5_version, tag_name)
+    flatfile_decorator.add_func_annotations(ipro_parser.annotations, i5_version, tag_name, args.threads)
 
     # TODO: Factor this out into another script
     # flatfile_decorator.add_rna_annotations(ipro_parser.annotations)
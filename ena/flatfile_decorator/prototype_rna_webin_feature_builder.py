@@ -1,9 +1,11 @@
 import argparse
 import csv
 import logging
-import re
 import sys
-from enum import Enum
+
+from mgnify_util.compression import open_input
+from mgnify_util.parser.cmsearch_tblout import read_tblout_file
+from mgnify_util.parser.rfam_catalogue import RNAType, classify_rna_type, load_catalogue
 
 
 def parse_args(args):
@@ -13,24 +15,12 @@ def parse_args(args):
                         help='tbl formatted deoverlapped output file')
     parser.add_argument('--rfam_lookup_file',
                         help='tsv formatted file mapping RFAMs accessions to name, description, '
-                             'RNA type and model length',
-                        default='rfam_family_lookup.tsv')
+                             'RNA type and model length, defaults to the Rfam catalogue shipped with the package')
     parser.add_argument('-o', '--output-file', help='report')
     parser.add_argument('-v', '--verbose', action='store_true')
     return parser.parse_args(args)
 
 
-class RNAType(Enum):
-    R_RNA = 'rRNA'
-    T_RNA = 'tRNA'
-    M_RNA = 'mRNA'
-    TM_RNA = 'tmRNA'
-    NC_RNA = 'ncRNA'
-    MISC_RNA = 'misc_RNA'
-    SN_RNA = 'snRNA'
-    SRP_RNA = 'ncRNA'
-
-
 UNRESOLVED_RFAM_LOOKUP = {
     'RF01849': RNAType.TM_RNA,
     'RF01854': RNAType.SRP_RNA,
@@ -146,81 +136,18 @@ class CMSearchMatch:
         self.forward = forward
 
 
+MATCH_COLUMNS = ('target_name', 'query_name', 'query_accession', 'mdl', 'mdl_from', 'mdl_to', 'seq_from', 'seq_to',
+                 'strand')
+
+
 def parse_matches(input_file):
     matches = []
-    with open(input_file, "r") as fp:
-        cnt = 0
-        for line in fp:
-            line = line.rstrip("\n\r")
-            chunks = re.findall(r'(\S+)', line)
-            if len(chunks) != 18:
-                raise ValueError("Unexpected number of chunks: {}".format(len(chunks)))
-            forward = True if chunks[9] == '+' else False
-            match = CMSearchMatch(chunks[0], chunks[2], chunks[3], chunks[4], int(chunks[5]), int(chunks[6]),
-                                  int(chunks[7]), int(chunks[8]), forward)
-            matches.append(match)
-            cnt += 1
-        logging.info("Processed {} matches.".format(cnt))
+    for row in read_tblout_file(input_file, MATCH_COLUMNS):
+        matches.append(CMSearchMatch(*row[:-1], row[-1] == '+'))
+    logging.info("Processed {} matches.".format(len(matches)))
     return matches
 
 
-def __process_rna_type(rfam_name, rna_type):
-    """
-        Possible RNA type values are:
-            - Gene;
-            - Gene; rRNA;
-            - Gene; snRNA; splicing;
-            - Cis-reg; riboswitch;
-
-        Ribosomal RNA will go in as rRNA and transfer RNA will go in as tRNA. All remaining will go in as ncRNA.
-
-        Controlled vocabulary for ncRNA classes:
-        http://www.insdc.org/documents/ncrna-vocabulary
-
-    :param param:
-    :return:
-    """
-    non_coding_rna_class = None
-    rna_type_result = None
-    if 'tRNA' in rna_type:
-        rna_type_result = RNAType.T_RNA
-    elif 'rRNA' in rna_type:
-        rna_type_result = RNAType.R_RNA
-    else:
-        rna_type_result = RNAType.NC_RNA
-        if 'antisense' in rna_type:
-            non_coding_rna_class = 'antisense_RNA'
-        elif rna_type.startswith('Intron;'):
-            non_coding_rna_class = 'autocatalytically_spliced_intron'
-        elif 'ribozyme' in rna_type:
-            if 'Hammerhead' in rfam_name:
-                non_coding_rna_class = 'hammerhead_ribozyme'
-            elif 'RNase_MRP' in rfam_name:
-                non_coding_rna_class = 'RNase_MRP_RNA'
-            else:
-                non_coding_rna_class = 'ribozyme'
-        elif 'lncRNA' in rna_type:
-            non_coding_rna_class = 'lncRNA'
-        elif 'RNase' in rfam_name:
-            non_coding_rna_class = 'RNase_P_RNA'
-        elif 'Telomerase' in rfam_name:
-            non_coding_rna_class = 'telomerase_RNA'
-        elif 'miRNA' in rna_type:
-            non_coding_rna_class = 'miRNA'
-        elif rna_type.startswith('Gene; snRNA'):
-            non_coding_rna_class = 'snRNA'
-        elif 'Vault' in rfam_name:
-            non_coding_rna_class = 'vault_RNA'
-        elif 'Y_RNA' in rfam_name:
-            non_coding_rna_class = 'Y_RNA'
-        elif '_SRP' in rfam_name:
-            non_coding_rna_class = 'SRP_RNA'
-        else:
-            non_coding_rna_class = 'other'
-
-    return rna_type_result, non_coding_rna_class
-
-
 def parse_rfam_lookup_file(input_file):
     """
         Maps RFAMs accessions to name, description, RNA type and model length
@@ -229,7 +156,7 @@ def parse_rfam_lookup_file(input_file):
     :return:
     """
     rfam_lookup = {}
-    with open(input_file, "r") as tsv_file:
+    with open_input(input_file) as tsv_file:
         reader = csv.reader(tsv_file, delimiter='\t')
         cnt = 0
         for row in reader:
@@ -238,8 +165,8 @@ def parse_rfam_lookup_file(input_file):
             accession = row[0]
             name = row[1]
             desc = row[2]
-            rna_type, non_coding_rna_class = __process_rna_type(name, row[3])
-            clength = row[4]
+            rna_type, non_coding_rna_class = classify_rna_type(name, row[3])
+            clength = int(row[4])
             new_entry = RfamEntry(accession, name, desc, rna_type, clength, non_coding_rna_class)
             rfam_lookup[accession] = new_entry
             cnt += 1
@@ -303,8 +230,12 @@ def create_webin_feature(match, model_lengths):
     return new_feature
 
 
-def build_rfam_lookup(infile):
-    return parse_rfam_lookup_file(infile)
+def build_rfam_lookup(infile=None):
+    if infile:
+        return parse_rfam_lookup_file(infile)
+    return {family.accession: RfamEntry(family.accession, family.name, family.description, RNAType(family.rna_type),
+                                        family.length, family.nc_rna_class)
+            for family in load_catalogue()}
 
 
 def main(argv=None):
@@ -0,0 +1,227 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# Copyright 2018 EMBL - European Bioinformatics Institute
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+import argparse
+import csv
+import gzip
+import json
+import logging
+import sys
+from itertools import islice
+
+COLUMNS = ['job_type', 'job_id', 'study', 'accession', 'pipeline', 'status', 'priority', 'directory']
+# Low cardinality columns are dictionary encoded in the columnar format
+DICTIONARY_COLUMNS = ['job_type', 'study', 'pipeline', 'status']
+
+ANNOTATION_JOB = 'annotation'
+ASSEMBLY_JOB = 'assembly'
+
+# Columns which can be changed by an import, edits to other columns are rejected
+EDITABLE_COLUMNS = {
+    ANNOTATION_JOB: ['status', 'priority', 'directory'],
+    ASSEMBLY_JOB: ['status', 'priority'],
+}
+
+
+def iter_job_rows(handler, job_types, study_accessions=None, job_ids=None):
+    if ANNOTATION_JOB in job_types:
+        for job_id, study, accession, version, status, priority, directory in \
+                handler.get_annotation_job_states(study_accessions, job_ids=job_ids):
+            yield [ANNOTATION_JOB, job_id, study, accession, version, status, priority, directory or '']
+    if ASSEMBLY_JOB in job_types:
+        for job_id, study, accession, assembler, version, status, priority in \
+                handler.get_assembly_job_states(study_accessions, job_ids=job_ids):
+            yield [ASSEMBLY_JOB, job_id, study, accession, '{}-{}'.format(assembler, version), status, priority, '']
+
+
+def chunked(iterable, size):
+    iterator = iter(iterable)
+    chunk = list(islice(iterator, size))
+    while chunk:
+        yield chunk
+        chunk = list(islice(iterator, size))
+
+
+class TSVJobStateFormat:
+    @staticmethod
+    def write(fh, rows):
+        writer = csv.writer(fh, delimiter='\t', lineterminator='\n')
+        writer.writerow(COLUMNS)
+        writer.writerows(rows)
+
+    @staticmethod
+    def read(fh):
+        reader = csv.DictReader(fh, delimiter='\t')
+        for row in reader:
+            yield row
+
+
+class ColumnarJobStateFormat:
+    """
+        Gzipped JSON lines, one line per block of rows. Each block stores one list per column,
+        low cardinality columns are stored as a list of distinct values plus integer codes.
+    """
+
+    def __init__(self, block_size=10000):
+        self.block_size = block_size
+
+    def write(self, fh, rows):
+        for block in chunked(rows, self.block_size):
+            columns = {}
+            for index, column in enumerate(COLUMNS):
+                values = [row[index] for row in block]
+                if column in DICTIONARY_COLUMNS:
+                    vocabulary = {}
+                    codes = [vocabulary.setdefault(value, len(vocabulary)) for value in values]
+                    columns[column] = {'values': list(vocabulary), 'codes': codes}
+                else:
+                    columns[column] = values
+            fh.write(json.dumps(columns, default=str))
+            fh.write('\n')
+
+    @staticmethod
+    def read(fh):
+        for line in fh:
+            columns = json.loads(line)
+            decoded = []
+            for column in COLUMNS:
+                values = columns[column]
+                if column in DICTIONARY_COLUMNS:
+                    vocabulary = values['values']
+                    values = [vocabulary[code] for code in values['codes']]
+                decoded.append(values)
+            for row in zip(*decoded):
+                yield dict(zip(COLUMNS, row))
+
+
+def open_job_state_file(filename, file_format, mode):
+    if file_format == 'columnar':
+        return gzip.open(filename, mode + 't')
+    return open(filename, mode, newline='')
+
+
+def get_format(file_format):
+    return ColumnarJobStateFormat() if file_format == 'columnar' else TSVJobStateFormat()
+
+
+def export_job_states(handler, filename, file_format='tsv', job_types=(ANNOTATION_JOB, ASSEMBLY_JOB),
+                      study_accessions=None):
+    with open_job_state_file(filename, file_format, 'w') as fh:
+        get_format(file_format).write(fh, iter_job_rows(handler, job_types, study_accessions))
+
+
+def _format_cell(value):
+    return '' if value is None else str(value)
+
+
+def get_job_state_changes(handler, rows):
+    """
+        Compares rows of an edited export with the current state of their jobs. Empty cells are treated as
+        unchanged and jobs which no longer exist are skipped.
+    :return: dict of job type -> list of (job id, dict of changed fields)
+    """
+    job_ids = {ANNOTATION_JOB: set(), ASSEMBLY_JOB: set()}
+    for row in rows:
+        if row['job_type'] not in job_ids:
+            raise ValueError('Unknown job type {}'.format(row['job_type']))
+        job_ids[row['job_type']].add(int(row['job_id']))
+
+    current_rows = {}  # (job type, job id, accession) -> formatted current row
+    for job_type, ids in job_ids.items():
+        if ids:
+            for current_row in iter_job_rows(handler, [job_type], job_ids=ids):
+                current_rows[(job_type, current_row[1], current_row[3])] = [_format_cell(v) for v in current_row]
+
+    changes = {ANNOTATION_JOB: {}, ASSEMBLY_JOB: {}}
+    for row in rows:
+        job_type = row['job_type']
+        job_id = int(row['job_id'])
+        current_row = current_rows.get((job_type, job_id, row['accession']))
+        if current_row is None:
+            logging.warning('{} job {} of {} not found, skipped'.format(job_type, job_id, row['accession']))
+            continue
+        fields = changes[job_type].setdefault(job_id, {})
+        for column, current_value in zip(COLUMNS, current_row):
+            value = _format_cell(row[column])
+            if value == '' or value == current_value:
+                continue
+            if column not in EDITABLE_COLUMNS[job_type]:
+                raise ValueError('Column {} of {} job {} cannot be changed from {} to {}'.format(
+                    column, job_type, job_id, current_value, value))
+            fields[column] = int(value) if column == 'priority' else value
+    return {job_type: [(job_id, fields) for job_id, fields in job_changes.items() if fields]
+            for job_type, job_changes in changes.items()}
+
+
+def import_job_states(handler, filename, file_format='tsv', chunk_size=5000):
+    """
+        Applies changed status, priority and directory values from an exported (and edited) file.
+        Rows are processed in chunks and compared with the current state of their jobs, only changed fields
+        are written. Jobs sharing the same changes within a chunk are updated at once. The file is applied in
+        a single transaction, edits to other columns are rejected with a ValueError and nothing is updated.
+    :return: number of updated jobs
+    """
+    updated = 0
+    with open_job_state_file(filename, file_format, 'r') as fh, handler.atomic():
+        for chunk in chunked(get_format(file_format).read(fh), chunk_size):
+            changes = get_job_state_changes(handler, chunk)
+            if changes[ANNOTATION_JOB]:
+                updated += handler.update_annotation_job_states(changes[ANNOTATION_JOB])
+            if changes[ASSEMBLY_JOB]:
+                updated += handler.update_assembly_job_states(changes[ASSEMBLY_JOB])
+            logging.info('Updated {} job(s)'.format(updated))
+    return updated
+
+
+def parse_args(args):
+    parser = argparse.ArgumentParser(description='Tool to export and import backlog job state in bulk')
+    parser.add_argument('--database', help='Backlog database', default='default')
+    parser.add_argument('--format', choices=['tsv', 'columnar'], default='tsv',
+                        help='Flat TSV or gzipped columnar JSON blocks')
+    parser.add_argument('-v', '--verbose', action='store_true')
+    subparsers = parser.add_subparsers(dest='command')
+
+    export_parser = subparsers.add_parser('export', help='Export job state')
+    export_parser.add_argument('output_file')
+    export_parser.add_argument('--studies', nargs='+', help='Primary or secondary study accessions')
+    export_parser.add_argument('--job-types', nargs='+', choices=[ANNOTATION_JOB, ASSEMBLY_JOB],
+                               default=[ANNOTATION_JOB, ASSEMBLY_JOB])
+
+    import_parser = subparsers.add_parser('import', help='Apply job state from an edited export')
+    import_parser.add_argument('input_file')
+    import_parser.add_argument('--chunk-size', type=int, default=5000)
+    return parser.parse_args(args)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+
+    logging.basicConfig(level=logging.DEBUG if args.verbose else logging.INFO)
+
+    from mgnify_backlog.mgnify_handler import MgnifyHandler
+    handler = MgnifyHandler(args.database)
+
+    if args.command == 'export':
+        export_job_states(handler, args.output_file, args.format, args.job_types, args.studies)
+    elif args.command == 'import':
+        updated = import_job_states(handler, args.input_file, args.format, args.chunk_size)
+        logging.info('Updated {} job(s) in total'.format(updated))
+    else:
+        logging.error('Please specify a command: export or import')
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
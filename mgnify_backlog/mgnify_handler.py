@@ -15,13 +15,14 @@
 # limitations under the License.
 
 from datetime import datetime
+import json
 import os
 import logging
-import re
 
 import django.db
+from django.db import connections, transaction
 from django.core.exceptions import ObjectDoesNotExist
-from django.db.models import Q
+from django.db.models import Q, Count, Max
 
 os.environ['DJANGO_SETTINGS_MODULE'] = 'backlog_cli.settings'
 
@@ -31,7 +32,7 @@ from backlog.models import Study, Run, AssemblyJob, RunAssembly, Assembler, Asse
     User, Pipeline, \
     UserRequest, AnnotationJobStatus, Assembly, AnnotationJob, AssemblyAnnotationJob, RunAnnotationJob
 
-run_reg = r'([E|S|D]RR\d{5,})_?'
+from mgnify_util.accession_parsers import parse_alias_runs
 
 
 def summarise_description(description):
@@ -42,9 +43,214 @@ def summarise_description(description):
     return fmt_description
 
 
+# One row per study, maintained by the handler on create and status change, rebuilt by backlog_study_summary
+STUDY_SUMMARY_TABLE = 'study_backlog_summary'
+STUDY_SUMMARY_SCHEMA = """
+    CREATE TABLE IF NOT EXISTS {} (
+        study_id INTEGER NOT NULL PRIMARY KEY,
+        runs INTEGER NOT NULL,
+        assemblies INTEGER NOT NULL,
+        jobs TEXT NOT NULL
+    )""".format(STUDY_SUMMARY_TABLE)
+STUDY_SUMMARY_CHUNK_SIZE = 1000
+
+
+def _empty_study_summary():
+    return {
+        'runs': 0,
+        'assemblies': 0,
+        'annotation_jobs': {},  # (pipeline version, status description) -> count
+        'assembly_jobs': {},  # (assembler name, assembler version, status description) -> count
+    }
+
+
+def _encode_summary_jobs(summary):
+    jobs = {field: [list(key) + [count] for key, count in sorted(summary[field].items(), key=str)]
+            for field in ('annotation_jobs', 'assembly_jobs')}
+    # Pipeline versions may be decimals
+    return json.dumps(jobs, default=str)
+
+
+def _decode_summary(runs, assemblies, jobs):
+    summary = _empty_study_summary()
+    summary['runs'] = runs
+    summary['assemblies'] = assemblies
+    jobs = json.loads(jobs)
+    to_version = Pipeline._meta.get_field('version').to_python
+    for version, status, count in jobs['annotation_jobs']:
+        summary['annotation_jobs'][(to_version(version), status)] = count
+    for assembler, version, status, count in jobs['assembly_jobs']:
+        summary['assembly_jobs'][(assembler, version, status)] = count
+    return summary
+
+
 class MgnifyHandler:
     def __init__(self, database):
         self.database = database
+        self._study_summary_table_created = False
+
+    def atomic(self):
+        """
+            Transaction on the backlog database for changes which must be applied together. The summary table
+            is created beforehand, as MySQL commits on CREATE TABLE.
+        """
+        self._get_study_summary_cursor().close()
+        return transaction.atomic(using=self.database)
+
+    def _get_study_summary_cursor(self):
+        if not self._study_summary_table_created:
+            # Only called outside transactions, MySQL commits on CREATE TABLE
+            with connections[self.database].cursor() as cursor:
+                cursor.execute(STUDY_SUMMARY_SCHEMA)
+            self._study_summary_table_created = True
+        return connections[self.database].cursor()
+
+    def _count_study_summaries(self, study_ids=None):
+        """
+            Counts runs, assemblies, annotation jobs (by pipeline version and status) and assembly jobs
+            (by assembler and status) of many studies with one grouped query per count.
+
+        :param study_ids: defaults to every study in the backlog
+        :return: dict of study pk -> dict
+        """
+        study_filter = {}
+        if study_ids is None:
+            study_ids = Study.objects.using(self.database).values_list('pk', flat=True)
+        else:
+            study_filter = {'study_id__in': list(study_ids)}
+        summaries = {study_id: _empty_study_summary() for study_id in study_ids}
+
+        # Studies created while counting get a summary too
+        for model, field in ((Run, 'runs'), (Assembly, 'assemblies')):
+            counts = model.objects.using(self.database).filter(**study_filter) \
+                .values('study_id').annotate(count=Count('pk'))
+            for row in counts:
+                summaries.setdefault(row['study_id'], _empty_study_summary())[field] = row['count']
+
+        for link_model, target in ((RunAnnotationJob, 'run'), (AssemblyAnnotationJob, 'assembly')):
+            study_field = target + '__study_id'
+            counts = link_model.objects.using(self.database) \
+                .filter(**{target + '__' + key: value for key, value in study_filter.items()}) \
+                .values(study_field, 'annotation_job__pipeline__version', 'annotation_job__status__description') \
+                .annotate(count=Count('annotation_job_id', distinct=True))
+            for row in counts:
+                annotation_jobs = summaries.setdefault(row[study_field], _empty_study_summary())['annotation_jobs']
+                key = (row['annotation_job__pipeline__version'], row['annotation_job__status__description'])
+                annotation_jobs[key] = annotation_jobs.get(key, 0) + row['count']
+
+        counts = RunAssemblyJob.objects.using(self.database) \
+            .filter(**{'run__' + key: value for key, value in study_filter.items()}) \
+            .values('run__study_id', 'assembly_job__assembler__name', 'assembly_job__assembler__version',
+                    'assembly_job__status__description') \
+            .annotate(count=Count('assembly_job_id', distinct=True))
+        for row in counts:
+            key = (row['assembly_job__assembler__name'], row['assembly_job__assembler__version'],
+                   row['assembly_job__status__description'])
+            summaries.setdefault(row['run__study_id'], _empty_study_summary())['assembly_jobs'][key] = row['count']
+        return summaries
+
+    def _write_study_summaries(self, summaries):
+        rows = [(study_id, summary['runs'], summary['assemblies'], _encode_summary_jobs(summary))
+                for study_id, summary in summaries.items()]
+        with self._get_study_summary_cursor() as cursor, transaction.atomic(using=self.database):
+            # REPLACE is understood by both MySQL and SQLite
+            cursor.executemany('REPLACE INTO {} (study_id, runs, assemblies, jobs) VALUES (%s, %s, %s, %s)'
+                               .format(STUDY_SUMMARY_TABLE), rows)
+
+    def refresh_study_summaries(self, study_ids):
+        """
+            Recounts the summary rows of the given studies. Called by the create and status update methods of
+            the handler, changes made outside the handler need a rebuild (see backlog_study_summary).
+        """
+        study_ids = set(study_ids) - {None}
+        if study_ids:
+            self._write_study_summaries(self._count_study_summaries(study_ids))
+
+    def _increment_study_summary(self, study_id, field):
+        # Studies without a row are counted when their summary is first read
+        with self._get_study_summary_cursor() as cursor:
+            cursor.execute('UPDATE {0} SET {1} = {1} + 1 WHERE study_id = %s'.format(STUDY_SUMMARY_TABLE, field),
+                           [study_id])
+
+    def rebuild_study_summaries(self, studies=None):
+        """
+            Recounts the summary rows from scratch, for the given studies or for every study in the backlog.
+        :param studies: Study objects, defaults to every study in the backlog
+        :return: number of studies
+        """
+        if studies is None:
+            summaries = self._count_study_summaries()
+            with self._get_study_summary_cursor() as cursor, transaction.atomic(using=self.database):
+                cursor.execute('DELETE FROM {}'.format(STUDY_SUMMARY_TABLE))
+                self._write_study_summaries(summaries)
+        else:
+            summaries = self._count_study_summaries([study.pk for study in studies])
+            self._write_study_summaries(summaries)
+        return len(summaries)
+
+    def get_study_summaries(self, studies=None):
+        """
+            Reads the maintained summary rows of many studies. Studies without a row yet are counted and stored.
+
+        :param studies: Study objects, defaults to every study in the backlog
+        :return: dict of study pk -> dict
+        """
+        query = 'SELECT study_id, runs, assemblies, jobs FROM {}'.format(STUDY_SUMMARY_TABLE)
+        summaries = {}
+        with self._get_study_summary_cursor() as cursor:
+            if studies is None:
+                study_ids = set(Study.objects.using(self.database).values_list('pk', flat=True))
+                cursor.execute(query)
+                summaries.update((row[0], _decode_summary(*row[1:])) for row in cursor.fetchall())
+            else:
+                study_ids = {study.pk for study in studies}
+                ids = list(study_ids)
+                for i in range(0, len(ids), STUDY_SUMMARY_CHUNK_SIZE):
+                    chunk = ids[i:i + STUDY_SUMMARY_CHUNK_SIZE]
+                    cursor.execute('{} WHERE study_id IN ({})'.format(query, ', '.join(['%s'] * len(chunk))), chunk)
+                    summaries.update((row[0], _decode_summary(*row[1:])) for row in cursor.fetchall())
+
+        missing = study_ids - summaries.keys()
+        if missing:
+            counted = self._count_study_summaries(missing)
+            self._write_study_summaries(counted)
+            summaries.update(counted)
+        return summaries
+
+    def get_studies(self, study_accessions=None):
+        """
+        :param study_accessions: primary or secondary study accessions, defaults to every study in the backlog
+        """
+        studies = Study.objects.using(self.database)
+        if study_accessions:
+            studies = studies.filter(Q(primary_accession__in=study_accessions) |
+                                     Q(secondary_accession__in=study_accessions))
+        return studies
+
+    def get_study_summary(self, study):
+        """
+            Returns run, assembly, annotation job and assembly job counts for a study, read from its summary row.
+        :param study: Study object
+        :return: dict
+        """
+        with self._get_study_summary_cursor() as cursor:
+            cursor.execute('SELECT runs, assemblies, jobs FROM {} WHERE study_id = %s'.format(STUDY_SUMMARY_TABLE),
+                           [study.pk])
+            row = cursor.fetchone()
+        if row is not None:
+            return _decode_summary(*row)
+        return self.get_study_summaries([study])[study.pk]
+
+    def _get_annotation_job_study_ids(self, annotation_jobs):
+        study_ids = set(RunAnnotationJob.objects.using(self.database).filter(annotation_job__in=annotation_jobs)
+                        .values_list('run__study_id', flat=True))
+        study_ids.update(AssemblyAnnotationJob.objects.using(self.database).filter(annotation_job__in=annotation_jobs)
+                         .values_list('assembly__study_id', flat=True))
+        return study_ids
+
+    def _get_assembly_job_study_ids(self, assembly_jobs):
+        return set(RunAssemblyJob.objects.using(self.database).filter(assembly_job__in=assembly_jobs)
+                   .values_list('run__study_id', flat=True))
 
     def set_biome(self, obj_data, obj):
         if 'inferred_lineage' in obj_data:
@@ -66,6 +272,7 @@ class MgnifyHandler:
                   ena_last_update=get_date(data, 'last_updated')
                   )
         s.save(using=self.database)
+        self.refresh_study_summaries([s.pk])
         return s
 
     def update_study_obj(self, data):
@@ -103,6 +310,7 @@ class MgnifyHandler:
         self.set_biome(run, r)
         r.clean_fields()
         r.save(using=self.database)
+        self._increment_study_summary(study.pk, 'runs')
         return r
 
     def update_run_obj(self, run_data):
@@ -127,21 +335,49 @@ class MgnifyHandler:
         return r
 
     def create_assembly_obj(self, ena_handler, study, assembly_data, public):
-
+        run_ids = parse_alias_runs(assembly_data['analysis_alias'])
         assembly = Assembly(study=study,
                             primary_accession=assembly_data['analysis_accession'],
                             ena_last_update=assembly_data['last_updated'],
                             public=public)
         self.set_biome(assembly_data, assembly)
         assembly.save(using=self.database)
-        alias = assembly_data['analysis_alias']
-        if re.match(run_reg, alias):
-            run_ids = re.findall(run_reg, assembly_data['analysis_alias'])
-            for run_id in run_ids:
-                run = self.get_or_save_run(ena_handler, run_id)
-                RunAssembly(run=run, assembly=assembly).save()
+        self._increment_study_summary(study.pk, 'assemblies')
+        if run_ids:
+            self.create_assembly_run_links(ena_handler, {assembly.primary_accession: run_ids})
         return assembly
 
+    def create_assembly_run_links(self, ena_handler, assembly_runs):
+        """
+            Links many assemblies to the runs they were built from. Assemblies and runs are looked up with a
+            single query each, missing runs are fetched from ENA and links which already exist are skipped.
+            Assemblies which are not in the backlog are skipped with a warning.
+
+        :param assembly_runs: dict of assembly accession -> list of run accessions, as returned by
+                              resolve_assembly_aliases
+        :return: list of created RunAssembly objects
+        """
+        assemblies = {assembly.primary_accession: assembly for assembly in
+                      Assembly.objects.using(self.database).filter(primary_accession__in=list(assembly_runs))}
+        for assembly_accession in assembly_runs.keys() - assemblies.keys():
+            logging.warning('Assembly {} not found, its runs are not linked'.format(assembly_accession))
+        assembly_runs = {assemblies[accession]: run_ids for accession, run_ids in assembly_runs.items()
+                         if accession in assemblies}
+
+        run_accessions = {run_id for run_ids in assembly_runs.values() for run_id in run_ids}
+        runs = {run.primary_accession: run for run in
+                Run.objects.using(self.database).filter(primary_accession__in=run_accessions)}
+        for run_id in run_accessions - runs.keys():
+            runs[run_id] = self.get_or_save_run(ena_handler, run_id)
+
+        existing_links = set(RunAssembly.objects.using(self.database).filter(assembly__in=list(assembly_runs))
+                             .values_list('assembly_id', 'run_id'))
+        links = [RunAssembly(run=runs[run_id], assembly=assembly)
+                 for assembly, run_ids in assembly_runs.items() for run_id in run_ids
+                 if (assembly.pk, runs[run_id].pk) not in existing_links]
+        RunAssembly.objects.using(self.database).bulk_create(links)
+        return links
+
     def update_assembly_obj(self, assembly_data):
         assembly = Assembly.objects.using(self.database).get(primary_accession=assembly_data['analysis_accession'])
         if 'last_updated' in assembly_data:
@@ -257,8 +493,100 @@ class MgnifyHandler:
         elif isinstance(assembly_or_run, Assembly):
             assembly_annotation_job = AssemblyAnnotationJob(assembly=assembly_or_run, annotation_job=job)
             assembly_annotation_job.save(using=self.database)
+        self.refresh_study_summaries([assembly_or_run.study_id])
         return job
 
+    def create_annotation_jobs_bulk(self, request, runs_or_assemblies, priority, pipeline_version=None,
+                                    batch_size=1000):
+        """
+            Schedules annotation jobs for many runs and/or assemblies at once. Pipeline and status are resolved
+            once, runs and assemblies which already have a job for the pipeline are skipped.
+
+        :param runs_or_assemblies: iterable of Run and Assembly objects
+        :param pipeline_version:
+        :type pipeline_version: float
+        :return: list of created AnnotationJob objects
+        """
+        if pipeline_version:
+            pipeline = self.get_pipeline_by_version(pipeline_version)
+        else:
+            pipeline = self.get_latest_pipeline()
+        status = AnnotationJobStatus.objects.using(self.database).get(description='SCHEDULED')
+
+        # Without repeated runs or assemblies, which would get several jobs
+        unique = []
+        seen = set()
+        for obj in runs_or_assemblies:
+            key = (type(obj), obj.pk)
+            if key not in seen:
+                seen.add(key)
+                unique.append(obj)
+        runs_or_assemblies = unique
+        runs = [obj for obj in runs_or_assemblies if isinstance(obj, Run)]
+        assemblies = [obj for obj in runs_or_assemblies if isinstance(obj, Assembly)]
+
+        existing = AnnotationJob.objects.using(self.database).filter(
+            Q(runannotationjob__run__in=runs) | Q(assemblyannotationjob__assembly__in=assemblies),
+            pipeline=pipeline).values_list('runannotationjob__run_id', 'assemblyannotationjob__assembly_id')
+        existing_run_ids = set()
+        existing_assembly_ids = set()
+        for run_id, assembly_id in existing:
+            existing_run_ids.add(run_id)
+            existing_assembly_ids.add(assembly_id)
+
+        runs = [run for run in runs if run.pk not in existing_run_ids]
+        assemblies = [assembly for assembly in assemblies if assembly.pk not in existing_assembly_ids]
+        logging.info('Skipping {} run(s) and {} assembly(ies) with existing {} jobs'.format(
+            len(existing_run_ids - {None}), len(existing_assembly_ids - {None}), pipeline.version))
+
+        targets = runs + assemblies
+        jobs = [AnnotationJob(request=request, pipeline=pipeline, priority=priority, status=status)
+                for _ in targets]
+        with transaction.atomic(using=self.database):
+            jobs = self._bulk_create_annotation_jobs(request, jobs, batch_size)
+            RunAnnotationJob.objects.using(self.database).bulk_create(
+                [RunAnnotationJob(run=run, annotation_job=job) for run, job in zip(runs, jobs)],
+                batch_size=batch_size)
+            AssemblyAnnotationJob.objects.using(self.database).bulk_create(
+                [AssemblyAnnotationJob(assembly=assembly, annotation_job=job)
+                 for assembly, job in zip(assemblies, jobs[len(runs):])],
+                batch_size=batch_size)
+        self.refresh_study_summaries({target.study_id for target in targets})
+
+        logging.info('Created {} annotation job(s)'.format(len(jobs)))
+        return jobs
+
+    def _can_return_bulk_insert_ids(self):
+        features = connections[self.database].features
+        # Named can_return_ids_from_bulk_insert before Django 3.0
+        return getattr(features, 'can_return_rows_from_bulk_insert',
+                       getattr(features, 'can_return_ids_from_bulk_insert', False))
+
+    def _bulk_create_annotation_jobs(self, request, jobs, batch_size):
+        """
+            Bulk inserts the annotation jobs of one request and sets their primary keys, which are needed to link
+            them. Must run in a transaction. Backends such as MySQL do not return primary keys from bulk inserts,
+            the jobs of the request above its previous highest id are then selected back in insertion order.
+        """
+        manager = AnnotationJob.objects.using(self.database)
+        if self._can_return_bulk_insert_ids():
+            return manager.bulk_create(jobs, batch_size=batch_size)
+
+        # Locking the request keeps concurrent transactions from adding jobs to it in between
+        UserRequest.objects.using(self.database).select_for_update().get(pk=request.pk)
+        previous_max_id = manager.filter(request=request).aggregate(Max('pk'))['pk__max'] or 0
+        manager.bulk_create(jobs, batch_size=batch_size)
+        job_ids = list(manager.filter(request=request, pk__gt=previous_max_id).order_by('pk')
+                       .values_list('pk', flat=True))
+        if len(job_ids) != len(jobs):
+            raise ValueError('Inserted {} annotation job(s) for request {} but found {}'.format(
+                len(jobs), request.pk, len(job_ids)))
+        for job, job_id in zip(jobs, job_ids):
+            job.pk = job_id
+            job._state.adding = False
+            job._state.db = self.database
+        return jobs
+
     # Status can be AssemblyJobStatus or string description of status
     def create_assembly_job(self, run, total_size, status, assembler_name, assembler_version=None, priority=0):
         try:
@@ -274,6 +602,7 @@ class MgnifyHandler:
         job = AssemblyJob(assembler=assembler, status=status, input_size=total_size, priority=priority)
         job.save(using=self.database)
         RunAssemblyJob(assembly_job=job, run=run).save(using=self.database)
+        self.refresh_study_summaries([run.study_id])
         return job
 
     def save_assembly_job(self, run, total_size, assembler_name, assembler_version, status, priority=0):
@@ -282,6 +611,7 @@ class MgnifyHandler:
             job.status = status
             job.priority = max(priority, job.priority or 0)
             job.save()
+            self.refresh_study_summaries([run.study_id])
         else:
             logging.info('Creating new assembly job for run {}'.format(run.primary_accession))
             job = self.create_assembly_job(run, total_size, status, assembler_name, assembler_version, priority)
@@ -296,6 +626,7 @@ class MgnifyHandler:
         for job in jobs:
             job.status = status
             job.save()
+        self.refresh_study_summaries(self._get_assembly_job_study_ids(jobs))
 
     def set_assembly_job_pending(self, run_accession, assembler_name,
                                  assembler_version):
@@ -308,6 +639,7 @@ class MgnifyHandler:
         for job in jobs:
             job.status = status
             job.save()
+        self.refresh_study_summaries(self._get_assembly_job_study_ids(jobs))
 
     def filter_active_runs(self, runs, assembler, version=None):
         return list(filter(lambda r: not self.is_assembly_job_in_backlog(r['run_accession'], assembler, version), runs))
@@ -356,6 +688,7 @@ class MgnifyHandler:
             runannotationjob__run__primary_accession__in=excluded_runs).exclude(
             assemblyannotationjob__assembly__primary_accession__in=excluded_runs)
         jobs.update(status=completed_status)
+        self.refresh_study_summaries([study.pk])
 
     def set_annotation_jobs_failed(self, study, rt_ticket, failed_runs):
         failed_status = AnnotationJobStatus.objects.using(self.database).get(description='FAILED')
@@ -366,6 +699,7 @@ class MgnifyHandler:
                 assemblyannotationjob__assembly__primary_accession__in=failed_runs))
 
         jobs.update(status=failed_status)
+        self.refresh_study_summaries([study.pk])
 
     def set_assembly_annotation_job_protein_db(self, assembly_accessions, value=True):
         jobs = AssemblyAnnotationJob.objects.using(self.database).filter(
@@ -421,22 +755,99 @@ class MgnifyHandler:
         return jobs
 
     def update_annotation_jobs_status(self, annotation_jobs, status_description):
+        # Before the update, which may change the jobs matched by annotation_jobs
+        study_ids = self._get_annotation_job_study_ids(annotation_jobs)
         try:
             status = self.get_annotation_job_status(status_description)
             annotation_jobs.update(status=status)
         except ObjectDoesNotExist:
             statuses = ','.join(AnnotationJobStatus.objects.using(self.database).values_list('description', flat=True))
             raise ValueError('Status {} is invalid. Valid choices are: {}'.format(status_description, statuses))
+        self.refresh_study_summaries(study_ids)
 
     def update_annotation_job(self, job, field_dict):
         for k, v in field_dict.items():
             setattr(job, k, v)
         job.save()
+        if field_dict.keys() & {'status', 'status_id', 'pipeline', 'pipeline_id'}:
+            self.refresh_study_summaries(self._get_annotation_job_study_ids([job.pk]))
+
+    def get_annotation_job_states(self, study_accessions=None, chunk_size=2000, job_ids=None):
+        """
+            Streams the state of run and assembly annotation jobs as tuples of
+            (job id, study, run/assembly accession, pipeline version, status, priority, directory).
+        """
+        for link_model, target in ((RunAnnotationJob, 'run'), (AssemblyAnnotationJob, 'assembly')):
+            links = link_model.objects.using(self.database)
+            if study_accessions:
+                links = links.filter(Q(**{target + '__study__primary_accession__in': study_accessions}) |
+                                     Q(**{target + '__study__secondary_accession__in': study_accessions}))
+            if job_ids is not None:
+                links = links.filter(annotation_job_id__in=list(job_ids))
+            rows = links.values_list('annotation_job_id', target + '__study__secondary_accession',
+                                     target + '__primary_accession', 'annotation_job__pipeline__version',
+                                     'annotation_job__status__description', 'annotation_job__priority',
+                                     'annotation_job__directory')
+            yield from rows.iterator(chunk_size=chunk_size)
+
+    def get_assembly_job_states(self, study_accessions=None, chunk_size=2000, job_ids=None):
+        """
+            Streams the state of assembly jobs as tuples of
+            (job id, study, run accession, assembler name, assembler version, status, priority).
+        """
+        links = RunAssemblyJob.objects.using(self.database)
+        if study_accessions:
+            links = links.filter(Q(run__study__primary_accession__in=study_accessions) |
+                                 Q(run__study__secondary_accession__in=study_accessions))
+        if job_ids is not None:
+            links = links.filter(assembly_job_id__in=list(job_ids))
+        rows = links.values_list('assembly_job_id', 'run__study__secondary_accession', 'run__primary_accession',
+                                 'assembly_job__assembler__name', 'assembly_job__assembler__version',
+                                 'assembly_job__status__description', 'assembly_job__priority')
+        yield from rows.iterator(chunk_size=chunk_size)
+
+    def _update_job_states(self, job_model, status_model, states, get_study_ids):
+        statuses = dict(status_model.objects.using(self.database).values_list('description', 'pk'))
+        groups = {}  # field values -> job ids, so that jobs sharing the same values are updated at once
+        for job_id, fields in states:
+            fields = dict(fields)
+            if 'status' in fields:
+                status_description = fields.pop('status')
+                if status_description not in statuses:
+                    raise ValueError('Status {} is invalid. Valid choices are: {}'.format(status_description,
+                                                                                         ','.join(statuses)))
+                fields['status_id'] = statuses[status_description]
+            groups.setdefault(tuple(sorted(fields.items())), []).append(job_id)
+
+        updated = 0
+        status_job_ids = []
+        for fields, job_ids in groups.items():
+            updated += job_model.objects.using(self.database).filter(pk__in=job_ids).update(**dict(fields))
+            if 'status_id' in dict(fields):
+                status_job_ids.extend(job_ids)
+        if status_job_ids:
+            self.refresh_study_summaries(get_study_ids(status_job_ids))
+        return updated
+
+    def update_annotation_job_states(self, states):
+        """
+        :param states: iterable of (job id, dict of fields) where fields can be status (description),
+                       priority and directory.
+        :return: number of updated jobs
+        """
+        return self._update_job_states(AnnotationJob, AnnotationJobStatus, states, self._get_annotation_job_study_ids)
+
+    def update_assembly_job_states(self, states):
+        """
+        :param states: iterable of (job id, dict of fields) where fields can be status (description) and priority.
+        :return: number of updated jobs
+        """
+        return self._update_job_states(AssemblyJob, AssemblyJobStatus, states, self._get_assembly_job_study_ids)
 
     def update_annotation_jobs_from_accessions(self, run_or_assembly_accessions=None, study_accessions=None,
                                                status_description=None, priority=None, pipeline_version=None,
                                                directory=None, delete=False, auto_confirm=False, result_status=None,
-                                               library_strategy=None):
+                                               library_strategy=None, chunk_size=None):
         jobs = self.get_annotation_jobs(run_or_assembly_accessions=run_or_assembly_accessions,
                                         study_accessions=study_accessions, pipeline_version=pipeline_version)
 
@@ -460,14 +871,36 @@ class MgnifyHandler:
 
         if delete:
             if auto_confirm or input('Please confirm you wish to delete {} jobs (yes/no): '.format(len(jobs))) == 'yes':
+                study_ids = self._get_annotation_job_study_ids(jobs)
                 jobs.delete()
+                self.refresh_study_summaries(study_ids)
                 logging.info('Deleting annotation jobs')
 
         if library_strategy:
-            runs = Run.objects.using(self.database).filter(annotationjobs__in=jobs)
-            runs.update(library_strategy=library_strategy)
-            # filtered out assembly accessions (no library strategy)
-            logging.info('Updated library strategy for {} runs'.format(len(runs)))
+            updated = self.update_runs_library_strategy(jobs, library_strategy, chunk_size)
+            logging.info('Updated library strategy for {} runs'.format(updated))
+
+    def update_runs_library_strategy(self, annotation_jobs, library_strategy, chunk_size=None):
+        """
+            Sets the library strategy of all runs linked to the annotation jobs with a single
+            UPDATE ... WHERE id IN (subquery). Assemblies have no library strategy and are skipped.
+
+            If chunk_size is given, or the database cannot update a table selected from in a subquery (MySQL),
+            the run ids are fetched first and updated in chunks instead.
+        :return: number of updated runs
+        """
+        run_ids = RunAnnotationJob.objects.using(self.database).filter(annotation_job__in=annotation_jobs) \
+            .values('run_id')
+        runs = Run.objects.using(self.database)
+        if not chunk_size and connections[self.database].features.update_can_self_select:
+            return runs.filter(pk__in=run_ids).update(library_strategy=library_strategy)
+
+        chunk_size = chunk_size or 10000
+        run_ids = sorted(set(run_ids.values_list('run_id', flat=True)))
+        updated = 0
+        for i in range(0, len(run_ids), chunk_size):
+            updated += runs.filter(pk__in=run_ids[i:i + chunk_size]).update(library_strategy=library_strategy)
+        return updated
 
 
 def sanitise_string(text):
@@ -0,0 +1,215 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# Copyright 2018 EMBL - European Bioinformatics Institute
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+import argparse
+import logging
+import multiprocessing
+import multiprocessing.connection
+import sys
+import time
+from collections import deque
+
+import django.db
+from django.core.exceptions import ObjectDoesNotExist
+
+from ena_portal_api import ena_handler
+
+from mgnify_backlog.mgnify_handler import MgnifyHandler
+from mgnify_util.accession_parsers import is_primary_study_acc
+
+
+def ingest_study(mgnify, ena, study_accession):
+    """
+        Saves a study together with its runs and assemblies, skipping any objects already in the backlog.
+    """
+    if is_primary_study_acc(study_accession):
+        study = mgnify.get_or_save_study(ena, primary_accession=study_accession)
+    else:
+        study = mgnify.get_or_save_study(ena, secondary_accession=study_accession)
+
+    for run in ena.get_study_runs(study.secondary_accession):
+        try:
+            mgnify.get_backlog_run(run['run_accession'])
+        except ObjectDoesNotExist:
+            mgnify.create_run_obj(study, run, study.public)
+
+    for assembly in ena.get_study_assemblies(study.secondary_accession):
+        mgnify.get_or_save_assembly(ena, assembly['analysis_accession'], assembly, study=study,
+                                    public=study.public)
+    return study
+
+
+def _ingestion_worker(worker_id, database, connection):
+    # Connections inherited from the parent process must not be shared
+    django.db.connections.close_all()
+    mgnify = MgnifyHandler(database)
+    ena = ena_handler.EnaApiHandler()
+    while True:
+        study_accession = connection.recv()
+        if study_accession is None:
+            break
+        start = time.time()
+        error = None
+        try:
+            ingest_study(mgnify, ena, study_accession)
+        except Exception as e:
+            error = '{}: {}'.format(type(e).__name__, e)
+            # Start the next task on a fresh connection in case this one is broken
+            django.db.connections.close_all()
+        connection.send((error, time.time() - start))
+
+
+class WorkerStats:
+    def __init__(self):
+        self.ingested = 0
+        self.failed = 0
+        self.elapsed = 0.0
+
+    def throughput(self):
+        return self.ingested / self.elapsed if self.elapsed else 0.0
+
+
+def ingest_studies(study_accessions, database='default', processes=4, max_attempts=3):
+    """
+        Distributes study accessions over worker processes. Each worker owns its database connection and
+        MgnifyHandler and is handed one study at a time over its own pipe, so the study of a worker which dies
+        (e.g. killed when out of memory) is known: it counts as a failed attempt and the worker is replaced.
+        Failed studies are retried until max_attempts is reached.
+
+    :return: tuple of (dict of worker id -> WorkerStats, dict of failed study accession -> error)
+    """
+    if processes < 1:
+        raise ValueError('At least one worker process is required, got {}'.format(processes))
+    tasks = deque((study_accession, 1) for study_accession in dict.fromkeys(study_accessions))
+    workers = {}  # worker id -> (process, connection)
+    in_flight = {}  # worker id -> (study accession, attempt, start time)
+    stats = {worker_id: WorkerStats() for worker_id in range(processes)}
+    failed = {}
+
+    def start_worker(worker_id):
+        connection, worker_connection = multiprocessing.Pipe()
+        process = multiprocessing.Process(target=_ingestion_worker, args=(worker_id, database, worker_connection))
+        process.start()
+        # Only the worker holds its end, so the pipe is closed when the worker dies
+        worker_connection.close()
+        workers[worker_id] = (process, connection)
+
+    def restart_worker(worker_id):
+        process, connection = workers[worker_id]
+        process.join()
+        connection.close()
+        start_worker(worker_id)
+
+    def assign_tasks():
+        for worker_id in list(workers):
+            while tasks and worker_id not in in_flight:
+                study_accession, attempt = tasks.popleft()
+                try:
+                    workers[worker_id][1].send(study_accession)
+                except (ConnectionError, EOFError):
+                    # Worker died while idle, the study was not started and goes to its replacement
+                    logging.warning('Worker {} exited with code {} while idle, restarting it'.format(
+                        worker_id, workers[worker_id][0].exitcode))
+                    tasks.appendleft((study_accession, attempt))
+                    restart_worker(worker_id)
+                    continue
+                in_flight[worker_id] = (study_accession, attempt, time.time())
+
+    def finish_task(worker_id, error, elapsed):
+        study_accession, attempt, _ = in_flight.pop(worker_id)
+        worker_stats = stats[worker_id]
+        worker_stats.elapsed += elapsed
+        if error is None:
+            worker_stats.ingested += 1
+            logging.debug('Worker {} ingested {} in {:.1f}s'.format(worker_id, study_accession, elapsed))
+            return
+
+        worker_stats.failed += 1
+        if attempt < max_attempts:
+            logging.warning('Retrying {} (attempt {}): {}'.format(study_accession, attempt, error))
+            tasks.append((study_accession, attempt + 1))
+        else:
+            logging.error('Failed to ingest {} after {} attempts: {}'.format(study_accession, attempt, error))
+            failed[study_accession] = error
+
+    for worker_id in range(processes):
+        start_worker(worker_id)
+    assign_tasks()
+    while in_flight:
+        # Wakes up on a result, or on the exit of a worker
+        multiprocessing.connection.wait([workers[worker_id][1] for worker_id in in_flight] +
+                                        [workers[worker_id][0].sentinel for worker_id in in_flight])
+        for worker_id in list(in_flight):
+            process, connection = workers[worker_id]
+            try:
+                if connection.poll():
+                    error, elapsed = connection.recv()
+                    finish_task(worker_id, error, elapsed)
+                    continue
+            except EOFError:
+                pass
+            if not process.is_alive():
+                process.join()
+                error = 'Worker exited with code {}'.format(process.exitcode)
+                finish_task(worker_id, error, time.time() - in_flight[worker_id][2])
+                restart_worker(worker_id)
+        assign_tasks()
+
+    for process, connection in workers.values():
+        try:
+            connection.send(None)
+        except (ConnectionError, EOFError):
+            # Worker died while idle
+            pass
+    for process, _ in workers.values():
+        process.join()
+
+    for worker_id, worker_stats in sorted(stats.items()):
+        logging.info('Worker {}: {} studies ingested, {} failures, {:.2f} studies/s'.format(
+            worker_id, worker_stats.ingested, worker_stats.failed, worker_stats.throughput()))
+    return stats, failed
+
+
+def parse_args(args):
+    parser = argparse.ArgumentParser(description='Tool to ingest ENA studies into the backlog in parallel')
+    parser.add_argument('studies', nargs='*', help='Primary or secondary study accessions')
+    parser.add_argument('-f', '--file', help='File of study accessions, one per line')
+    parser.add_argument('--database', help='Backlog database', default='default')
+    parser.add_argument('-p', '--processes', type=int, default=4, help='Number of worker processes')
+    parser.add_argument('--max-attempts', type=int, default=3, help='Attempts per study before giving up')
+    parser.add_argument('-v', '--verbose', action='store_true')
+    return parser.parse_args(args)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+
+    logging.basicConfig(level=logging.DEBUG if args.verbose else logging.INFO)
+
+    study_accessions = list(args.studies)
+    if args.file:
+        with open(args.file) as f:
+            study_accessions.extend(line.strip() for line in f if line.strip())
+    if not study_accessions:
+        logging.error('No study accessions given')
+        sys.exit(1)
+
+    _, failed = ingest_studies(study_accessions, args.database, args.processes, args.max_attempts)
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
@@ -0,0 +1,112 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# Copyright 2018 EMBL - European Bioinformatics Institute
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+import argparse
+import csv
+import logging
+import os
+import sys
+import tempfile
+
+COLUMNS = ['study', 'runs', 'assemblies', 'job_type', 'pipeline', 'status', 'jobs']
+
+ANNOTATION_JOB = 'annotation'
+ASSEMBLY_JOB = 'assembly'
+
+
+def iter_summary_rows(handler, study_accessions=None):
+    """
+        One row per study and job group, read from the maintained summary rows, with the run and assembly counts
+        of the study repeated on each row. Studies without jobs get a single row with empty job columns.
+    """
+    studies = list(handler.get_studies(study_accessions))
+    summaries = handler.get_study_summaries(studies if study_accessions else None)
+    for study in sorted(studies, key=lambda study: study.secondary_accession):
+        summary = summaries.get(study.pk)
+        if summary is None:
+            # Created after the studies were listed
+            continue
+        study_columns = [study.secondary_accession, summary['runs'], summary['assemblies']]
+        job_rows = []
+        for (version, status), count in sorted(summary['annotation_jobs'].items(), key=str):
+            job_rows.append([ANNOTATION_JOB, version, status, count])
+        for (assembler, version, status), count in sorted(summary['assembly_jobs'].items(), key=str):
+            job_rows.append([ASSEMBLY_JOB, '{}-{}'.format(assembler, version), status, count])
+        for job_row in job_rows or [['', '', '', '']]:
+            yield study_columns + job_row
+
+
+def rebuild_study_summary(handler, study_accessions=None):
+    """
+        Recounts the maintained per-study summary rows from scratch, e.g. after changes made outside of
+        MgnifyHandler.
+    :return: number of studies
+    """
+    studies = list(handler.get_studies(study_accessions)) if study_accessions else None
+    return handler.rebuild_study_summaries(studies)
+
+
+def write_study_summary(handler, filename, study_accessions=None):
+    """
+        Exports the per-study summary to a TSV file. The file is written next to filename first and then
+        replaces it, so readers never see a partial summary.
+    :return: number of rows written
+    """
+    directory = os.path.dirname(os.path.abspath(filename))
+    fd, tmp_filename = tempfile.mkstemp(dir=directory, suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'w', newline='') as fh:
+            writer = csv.writer(fh, delimiter='\t', lineterminator='\n')
+            writer.writerow(COLUMNS)
+            rows = 0
+            for row in iter_summary_rows(handler, study_accessions):
+                writer.writerow(row)
+                rows += 1
+        # mkstemp creates the file readable by its owner only
+        os.chmod(tmp_filename, 0o644)
+        os.replace(tmp_filename, filename)
+    except BaseException:
+        os.remove(tmp_filename)
+        raise
+    return rows
+
+
+def parse_args(args):
+    parser = argparse.ArgumentParser(description='Tool to rebuild the per-study backlog summary (runs, assemblies '
+                                                 'and jobs by pipeline and status) from scratch')
+    parser.add_argument('-o', '--output-file', help='Also export the summary to this TSV file, replaced atomically')
+    parser.add_argument('--database', help='Backlog database', default='default')
+    parser.add_argument('--studies', nargs='+', help='Primary or secondary study accessions, defaults to all')
+    parser.add_argument('-v', '--verbose', action='store_true')
+    return parser.parse_args(args)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+
+    logging.basicConfig(level=logging.DEBUG if args.verbose else logging.INFO)
+
+    from mgnify_backlog.mgnify_handler import MgnifyHandler
+    handler = MgnifyHandler(args.database)
+
+    studies = rebuild_study_summary(handler, args.studies)
+    logging.info('Rebuilt the summary of {} study(ies)'.format(studies))
+    if args.output_file:
+        rows = write_study_summary(handler, args.output_file, args.studies)
+        logging.info('Wrote {} summary row(s) to {}'.format(rows, args.output_file))
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
@@ -14,11 +14,32 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import logging
 import re
 
-primary_study_accession_re = re.compile('(PRJ(EB|DB|NA|DA)\d+)')
-secondary_study_accession_re = re.compile('([ESD]RP\d{5,})')
-run_accession_re = re.compile('([ESD]RR\d{5,})')
+primary_study_accession_pattern = r'PRJ(?:EB|DB|NA|DA)\d+'
+secondary_study_accession_pattern = r'[ESD]RP\d{5,}'
+run_accession_pattern = r'[ESD]RR\d{5,}'
+assembly_accession_pattern = r'ERZ\d{5,}'
+sample_accession_pattern = r'SAM(?:EA|N|D)\d+|[ESD]RS\d{5,}'
+
+primary_study_accession_re = re.compile('({})'.format(primary_study_accession_pattern))
+secondary_study_accession_re = re.compile('({})'.format(secondary_study_accession_pattern))
+run_accession_re = re.compile('({})'.format(run_accession_pattern))
+
+# Run accession, optionally followed by a range end, e.g. ERR164407-ERR164409 or ERR164407-164409
+alias_run_re = re.compile(r'([ESD]RR)(\d{5,})(?:-([ESD]RR)?(\d+))?')
+
+ACCESSION_TYPES = ['primary_study', 'secondary_study', 'run', 'assembly', 'sample']
+UNKNOWN_ACCESSION_TYPE = 'unknown'
+
+# Single alternation over all accession types, the name of the matching group gives the type
+accession_type_re = re.compile('|'.join('(?P<{}>{})'.format(accession_type, pattern) for accession_type, pattern in
+                                        zip(ACCESSION_TYPES, [primary_study_accession_pattern,
+                                                              secondary_study_accession_pattern,
+                                                              run_accession_pattern,
+                                                              assembly_accession_pattern,
+                                                              sample_accession_pattern])))
 
 
 def is_ena_study_accession(accession):
@@ -35,3 +56,72 @@ def is_secondary_study_acc(accession):
 
 def is_run_accession(accession):
     return run_accession_re.match(accession)
+
+
+def classify_accessions(accessions):
+    """
+        Buckets accessions by type using one compiled pattern. Surrounding whitespace is ignored,
+        duplicates are removed and input order is kept.
+
+        Example:
+            {'primary_study': ['PRJEB1787'], 'secondary_study': ['ERP001736'], 'run': ['ERR164407'],
+             'assembly': ['ERZ795049'], 'sample': ['SAMN05720147'], 'unknown': ['foo']}
+
+    :param accessions: iterable of accession strings
+    :return: dict of accession type -> list of accessions, which can be passed to __in queries directly
+    """
+    buckets = {accession_type: {} for accession_type in ACCESSION_TYPES + [UNKNOWN_ACCESSION_TYPE]}
+    fullmatch = accession_type_re.fullmatch
+    for accession in accessions:
+        accession = accession.strip()
+        match = fullmatch(accession)
+        buckets[match.lastgroup if match else UNKNOWN_ACCESSION_TYPE][accession] = None
+    return {accession_type: list(bucket) for accession_type, bucket in buckets.items()}
+
+
+def parse_alias_runs(alias, max_range=10000):
+    """
+        Extracts the run accessions an assembly was built from out of its alias. Aliases which do not start with
+        a run accession are not parsed. Runs can be separated by any delimiter and ranges are expanded.
+        A suffix only ends a range if it is a full run accession or has as many digits as the start, other
+        suffixes such as dates are ignored. Ranges which are reversed or longer than max_range are skipped
+        with a warning and only their first run is kept.
+
+        Examples:
+            ERR164407 -> [ERR164407]
+            ERR164407_ERR164408 or ERR164407,ERR164408 -> [ERR164407, ERR164408]
+            ERR164407-ERR164409 or ERR164407-164409 -> [ERR164407, ERR164408, ERR164409]
+            ERR164407-20190101 -> [ERR164407]
+
+    :param alias: analysis alias
+    :param max_range: maximum number of runs a single range may expand to
+    :return: list of run accessions
+    """
+    if not alias or not alias_run_re.match(alias):
+        return []
+    runs = {}
+    for prefix, start, end_prefix, end in alias_run_re.findall(alias):
+        runs[prefix + start] = None
+        if not end or (not end_prefix and len(end) != len(start)):
+            continue
+        if (end_prefix and end_prefix != prefix) or int(end) < int(start) or int(end) - int(start) >= max_range:
+            logging.warning('Skipped run range {}{}-{}{} in alias {}'.format(prefix, start, end_prefix, end, alias))
+            continue
+        for number in range(int(start) + 1, int(end) + 1):
+            runs[prefix + str(number).zfill(len(start))] = None
+    return list(runs)
+
+
+def resolve_assembly_aliases(assemblies, max_range=10000):
+    """
+        Parses the aliases of many ENA assembly records at once.
+
+    :param assemblies: iterable of ENA assembly dicts with analysis_accession and analysis_alias
+    :return: dict of assembly accession -> list of run accessions, assemblies without runs are left out
+    """
+    assembly_runs = {}
+    for assembly in assemblies:
+        runs = parse_alias_runs(assembly.get('analysis_alias'), max_range)
+        if runs:
+            assembly_runs[assembly['analysis_accession']] = runs
+    return assembly_runs
@@ -0,0 +1,201 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# Copyright 2018 EMBL - European Bioinformatics Institute
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+import gzip
+import io
+import os
+import queue
+import struct
+import threading
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+from itertools import islice
+
+GZIP = 'gzip'
+BGZIP = 'bgzip'
+ZSTD = 'zstd'
+
+GZIP_MAGIC = b'\x1f\x8b'
+ZSTD_MAGIC = b'\x28\xb5\x2f\xfd'
+
+CHUNK_SIZE = 1 << 20
+
+
+def detect_compression(filename):
+    """
+        Detects the compression of a file from its magic bytes.
+    :return: GZIP, BGZIP, ZSTD or None for uncompressed files
+    """
+    with open(filename, 'rb') as f:
+        header = f.read(18)
+    if header.startswith(GZIP_MAGIC):
+        # BGZF blocks are gzip members with a 'BC' extra subfield holding the block size
+        if len(header) >= 14 and header[3] & 4 and header[12:14] == b'BC':
+            return BGZIP
+        return GZIP
+    if header.startswith(ZSTD_MAGIC):
+        return ZSTD
+    return None
+
+
+def is_compressed(filename):
+    return detect_compression(filename) is not None
+
+
+class _BackgroundReader(io.RawIOBase):
+    """
+        Raw stream fed by a background thread which pulls decompressed chunks from an iterator,
+        so that decompression overlaps with parsing.
+    """
+
+    def __init__(self, chunks, closeables, max_chunks=8):
+        super().__init__()
+        self._chunks = chunks
+        self._closeables = closeables
+        self._queue = queue.Queue(max_chunks)
+        self._stop = threading.Event()
+        self._buffer = memoryview(b'')
+        self._eof = False
+        self._error = None
+        self._thread = threading.Thread(target=self._fill, daemon=True)
+        self._thread.start()
+
+    def _put(self, chunk):
+        while not self._stop.is_set():
+            try:
+                self._queue.put(chunk, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def _fill(self):
+        try:
+            for chunk in self._chunks:
+                if not self._put(chunk):
+                    return
+        except Exception as e:
+            self._error = e
+        self._put(b'')
+
+    def readable(self):
+        return True
+
+    def readinto(self, b):
+        if not self._buffer:
+            if self._eof:
+                return 0
+            chunk = self._queue.get()
+            if not chunk:
+                self._eof = True
+                if self._error:
+                    raise self._error
+                return 0
+            self._buffer = memoryview(chunk)
+        n = min(len(b), len(self._buffer))
+        b[:n] = self._buffer[:n]
+        self._buffer = self._buffer[n:]
+        return n
+
+    def close(self):
+        if self.closed:
+            return
+        self._stop.set()
+        self._thread.join()
+        for closeable in self._closeables:
+            closeable.close()
+        super().close()
+
+
+def _iter_stream_chunks(stream):
+    chunk = stream.read(CHUNK_SIZE)
+    while chunk:
+        yield chunk
+        chunk = stream.read(CHUNK_SIZE)
+
+
+def _iter_bgzf_blocks(raw):
+    while True:
+        header = raw.read(12)
+        if not header:
+            return
+        if len(header) < 12 or not header.startswith(GZIP_MAGIC):
+            raise ValueError('Invalid or truncated BGZF block')
+        xlen = struct.unpack('<H', header[10:12])[0]
+        extra = raw.read(xlen)
+        block_size = None
+        i = 0
+        while i + 4 <= len(extra):
+            subfield_length = struct.unpack('<H', extra[i + 2:i + 4])[0]
+            if extra[i:i + 2] == b'BC':
+                block_size = struct.unpack('<H', extra[i + 4:i + 6])[0] + 1
+            i += 4 + subfield_length
+        if block_size is None:
+            raise ValueError('Gzip member without BGZF block size')
+        yield header + extra + raw.read(block_size - 12 - xlen)
+
+
+def _decompress_gzip_member(block):
+    return zlib.decompress(block, 16 + zlib.MAX_WBITS)
+
+
+def _iter_bgzf_chunks(raw, threads):
+    # zlib releases the GIL, so independent BGZF blocks are decompressed concurrently
+    with ThreadPoolExecutor(threads) as executor:
+        blocks = _iter_bgzf_blocks(raw)
+        batch = list(islice(blocks, threads * 16))
+        while batch:
+            for data in executor.map(_decompress_gzip_member, batch):
+                if data:
+                    yield data
+            batch = list(islice(blocks, threads * 16))
+
+
+def _open_zstd(raw):
+    try:
+        import zstandard
+    except ImportError:
+        raise ImportError('Reading zstd compressed input requires the zstandard package')
+    return zstandard.ZstdDecompressor().stream_reader(raw, read_across_frames=True)
+
+
+def open_input(filename, mode='r', encoding=None, threads=None):
+    """
+        Opens plain, gzip, bgzip or zstd compressed files for reading, the compression is detected from
+        the file content. Compressed input is decompressed in background threads, bgzip blocks using
+        up to threads workers.
+
+    :param mode: 'r'/'rt' for text or 'rb' for binary
+    :param threads: Number of bgzip decompression threads, defaults to the number of CPUs
+    :return: file object
+    """
+    compression = detect_compression(filename)
+    if compression is None:
+        return open(filename, mode, encoding=encoding)
+
+    raw = open(filename, 'rb')
+    if compression == BGZIP:
+        reader = _BackgroundReader(_iter_bgzf_chunks(raw, threads or os.cpu_count() or 1), [raw])
+    elif compression == GZIP:
+        stream = gzip.GzipFile(fileobj=raw)
+        reader = _BackgroundReader(_iter_stream_chunks(stream), [stream, raw])
+    else:
+        stream = _open_zstd(raw)
+        reader = _BackgroundReader(_iter_stream_chunks(stream), [stream, raw])
+
+    buffered = io.BufferedReader(reader, CHUNK_SIZE)
+    if 'b' in mode:
+        return buffered
+    return io.TextIOWrapper(buffered, encoding=encoding)
@@ -0,0 +1,130 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# Copyright 2018 EMBL - European Bioinformatics Institute
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+import argparse
+import logging
+import multiprocessing
+import os
+import sys
+from array import array
+from collections import Counter
+from itertools import repeat
+
+from mgnify_util.parser.interproscan_parser import InterProScanTSVResultParser, AnnotationVocabulary, \
+    ANNOTATION_TYPES
+
+__author__ = "Maxim Scheremetjew"
+__version__ = "0.1"
+__status__ = "Development"
+
+
+def count_annotations(input_tsv_file):
+    """
+        Counts, in a single pass, the number of sequences annotated with each InterPro, GO, KEGG, MetaCyc and
+        Reactome term of an i5 TSV file.
+    :return: dict of annotation type -> Counter of identifier -> number of sequences
+    """
+    vocabulary = AnnotationVocabulary()
+    counts = array('Q')  # annotation id -> number of sequences
+    parser = InterProScanTSVResultParser(input_tsv_file)
+    for _, annotation_ids in parser.iter_sequence_annotation_ids(vocabulary):
+        counts.extend(repeat(0, len(vocabulary) - len(counts)))
+        for annotation_id in annotation_ids:
+            counts[annotation_id] += 1
+    result = {annotation_type: Counter() for annotation_type in ANNOTATION_TYPES}
+    for annotation, count in zip(vocabulary.annotations, counts):
+        result[annotation.database][annotation.identifier] = count
+    return result
+
+
+def get_sample_name(input_tsv_file):
+    name = os.path.basename(input_tsv_file)
+    for suffix in ['.gz', '.bgz', '.zst', '.tsv', '.i5_annotations']:
+        if name.endswith(suffix):
+            name = name[:-len(suffix)]
+    return name
+
+
+def build_abundance_matrices(input_tsv_files, processes=None):
+    """
+        Counts the annotations of many i5 TSV files (one per run or assembly) in a process pool.
+    :return: dict of annotation type -> (sorted list of terms, dict of (term index, sample index) -> count)
+    """
+    with multiprocessing.Pool(processes or multiprocessing.cpu_count()) as pool:
+        sample_counts = pool.map(count_annotations, input_tsv_files)
+
+    matrices = {}
+    for annotation_type in ANNOTATION_TYPES:
+        terms = sorted(set().union(*(counts[annotation_type] for counts in sample_counts)))
+        term_index = {term: i for i, term in enumerate(terms)}
+        entries = {}
+        for sample_index, counts in enumerate(sample_counts):
+            for term, count in counts[annotation_type].items():
+                entries[(term_index[term], sample_index)] = count
+        matrices[annotation_type] = (terms, entries)
+    return matrices
+
+
+def write_matrix_market(output_file, n_rows, n_columns, entries):
+    """
+        Writes a sparse integer matrix in Matrix Market coordinate format, which can be read with
+        scipy.io.mmread or R Matrix::readMM.
+    """
+    with open(output_file, 'w') as out:
+        out.write('%%MatrixMarket matrix coordinate integer general\n')
+        out.write('{} {} {}\n'.format(n_rows, n_columns, len(entries)))
+        for (row, column), value in sorted(entries.items()):
+            out.write('{} {} {}\n'.format(row + 1, column + 1, value))
+
+
+def write_abundance_matrices(output_prefix, samples, matrices):
+    """
+        Writes <prefix>.samples.tsv (matrix columns) and, per annotation type, <prefix>.<type>.mtx with
+        <prefix>.<type>.terms.tsv (matrix rows).
+    """
+    with open(output_prefix + '.samples.tsv', 'w') as out:
+        out.writelines(sample + '\n' for sample in samples)
+    for annotation_type, (terms, entries) in matrices.items():
+        write_matrix_market('{}.{}.mtx'.format(output_prefix, annotation_type), len(terms), len(samples), entries)
+        with open('{}.{}.terms.tsv'.format(output_prefix, annotation_type), 'w') as out:
+            out.writelines(term + '\n' for term in terms)
+
+
+def parse_args(args):
+    parser = argparse.ArgumentParser(
+        description='Tool to build sample x term abundance matrices from many InterProScan TSV files')
+    parser.add_argument('i5_annotation_files', nargs='+', help='TSV formatted I5 annotation files, one per sample')
+    parser.add_argument('-o', '--output-prefix', required=True, help='Prefix of the output files')
+    parser.add_argument('-p', '--processes', type=int, help='Number of worker processes')
+    parser.add_argument('-v', '--verbose', action='store_true')
+    return parser.parse_args(args)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+
+    logging.basicConfig(level=logging.DEBUG if args.verbose else logging.INFO)
+
+    samples = [get_sample_name(input_file) for input_file in args.i5_annotation_files]
+    if len(set(samples)) != len(samples):
+        samples = args.i5_annotation_files
+    matrices = build_abundance_matrices(args.i5_annotation_files, args.processes)
+    write_abundance_matrices(args.output_prefix, samples, matrices)
+    for annotation_type, (terms, entries) in matrices.items():
+        logging.info('{}: {} terms, {} non-zero counts'.format(annotation_type, len(terms), len(entries)))
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
@@ -0,0 +1,254 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# Copyright 2018 EMBL - European Bioinformatics Institute
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+import argparse
+import bisect
+import heapq
+import itertools
+import logging
+import sys
+import tempfile
+
+from mgnify_util.compression import open_input
+
+__author__ = "Maxim Scheremetjew"
+__version__ = "0.1"
+__status__ = "Development"
+
+DEOVERLAPPED_SUFFIX = '.deoverlapped'
+# Lines held in memory when sorting unsorted input, larger inputs are sorted in runs spilled to temporary files
+DEFAULT_BUFFER_LINES = 1000000
+
+
+class IntervalUnion:
+    """
+        Union of closed intervals, kept as sorted, disjoint start and end lists.
+    """
+
+    def __init__(self):
+        self.starts = []
+        self.ends = []
+
+    def overlaps(self, start: int, end: int) -> bool:
+        lo = bisect.bisect_left(self.ends, start)
+        return lo < len(self.starts) and self.starts[lo] <= end
+
+    def add(self, start: int, end: int):
+        lo = bisect.bisect_left(self.ends, start)
+        hi = bisect.bisect_right(self.starts, end)
+        if lo < hi:
+            start = min(start, self.starts[lo])
+            end = max(end, self.ends[hi - 1])
+        self.starts[lo:hi] = [start]
+        self.ends[lo:hi] = [end]
+
+
+def parse_clan_file(clan_file):
+    """
+        Reads a clanin file as used by cmsearch-deoverlap.pl, one clan per line followed by its models:
+
+            CL00111 SSU_rRNA_bacteria SSU_rRNA_archaea SSU_rRNA_eukarya
+    :return: dict of model name -> clan
+    """
+    clans = {}
+    with open_input(clan_file) as file:
+        for line in file:
+            fields = line.split()
+            if not fields or fields[0].startswith('#'):
+                continue
+            for model in fields[1:]:
+                clans[model] = fields[0]
+    return clans
+
+
+def _sort_key(hit):
+    # Same order as "sort -k15,15rn -k16,16g" in cmsearch-deoverlap.pl: highest bit score first, then lowest
+    # e-value, then the whole line
+    return -hit[0], hit[1], hit[-1]
+
+
+def deoverlap_sequence_hits(lines, clans=None, max_keep=False):
+    """
+        Removes the hits of one sequence which overlap a higher scoring hit on the same strand.
+
+    :param lines: tblout lines of a single sequence
+    :param clans: optional dict of model name -> clan, if given only hits of models in the same clan are compared
+    :param max_keep: only compare hits with the hits which are kept, by default a hit is removed if it overlaps
+                     any higher scoring hit
+    :return: list of the kept lines, sorted by descending score
+    """
+    hits = []
+    for line in lines:
+        row = line.split(None, 16)
+        seq_from = int(row[7])
+        seq_to = int(row[8])
+        strand = row[9]
+        hits.append((float(row[14]), float(row[15]),
+                     min(seq_from, seq_to), max(seq_from, seq_to), strand, row[2], line))
+    hits.sort(key=_sort_key)
+
+    intervals = {}  # (strand, clan or None) -> IntervalUnion
+    kept = []
+    for score, evalue, start, end, strand, model, line in hits:
+        if clans is None:
+            key = (strand, None)
+        else:
+            clan = clans.get(model)
+            key = (strand, clan) if clan is not None else None
+        union = intervals.setdefault(key, IntervalUnion()) if key is not None else None
+        if union is not None and union.overlaps(start, end):
+            if not max_keep:
+                union.add(start, end)
+            continue
+        kept.append(line)
+        if union is not None:
+            union.add(start, end)
+    return kept
+
+
+def _sequence_id(line):
+    return line.split(None, 1)[0]
+
+
+def _write_run(buffer, temp_dir=None):
+    buffer.sort(key=_sequence_id)
+    run = tempfile.TemporaryFile('w+', dir=temp_dir)
+    run.writelines(line if line.endswith('\n') else line + '\n' for line in buffer)
+    run.seek(0)
+    return run
+
+
+def _iter_sorted_lines(lines, buffer_lines=DEFAULT_BUFFER_LINES, temp_dir=None):
+    """
+        External merge sort of tblout lines by sequence accession. Every buffer_lines lines are sorted and written
+        to a temporary file, the runs are then merged. The sort is stable, so the lines of a sequence keep their
+        input order.
+    """
+    runs = []
+    buffer = []
+    try:
+        for line in lines:
+            if line.startswith('#') or not line.strip():
+                continue
+            buffer.append(line)
+            if len(buffer) >= buffer_lines:
+                runs.append(_write_run(buffer, temp_dir))
+                buffer = []
+        buffer.sort(key=_sequence_id)
+        if runs:
+            logging.debug('Merging {} sorted runs'.format(len(runs) + 1))
+            # heapq.merge keeps the order of its inputs for equal keys
+            yield from heapq.merge(*runs, buffer, key=_sequence_id)
+        else:
+            yield from buffer
+    finally:
+        for run in runs:
+            run.close()
+
+
+def iter_sequence_lines(lines, presorted=False, buffer_lines=DEFAULT_BUFFER_LINES, temp_dir=None):
+    """
+        Groups tblout lines by target sequence. Comment lines are skipped.
+
+    :param presorted: if True the input must be sorted (or grouped) by sequence and is streamed one sequence at
+                      a time, otherwise the input is sorted first and sequences are returned in sorted order
+    :param buffer_lines: maximum number of lines held in memory to sort unsorted input, sorted runs of this size
+                         are spilled to temporary files
+    :param temp_dir: directory of the temporary files, see tempfile
+    :return: generator of (sequence accession, list of lines)
+    """
+    if presorted:
+        seq_id = None
+        group = []
+        seen = set()
+        for line in lines:
+            if line.startswith('#') or not line.strip():
+                continue
+            line_seq_id = _sequence_id(line)
+            if line_seq_id != seq_id:
+                if group:
+                    yield seq_id, group
+                if line_seq_id in seen:
+                    raise ValueError('Input is not grouped by sequence, {} occurs in separate blocks'.format(
+                        line_seq_id))
+                seen.add(line_seq_id)
+                seq_id = line_seq_id
+                group = []
+            group.append(line)
+        if group:
+            yield seq_id, group
+    else:
+        for seq_id, group in itertools.groupby(_iter_sorted_lines(lines, buffer_lines, temp_dir), key=_sequence_id):
+            yield seq_id, list(group)
+
+
+def deoverlap(lines, clans=None, max_keep=False, presorted=False, buffer_lines=DEFAULT_BUFFER_LINES,
+              temp_dir=None):
+    """
+        Deoverlaps cmsearch tblout lines, equivalent to cmsearch-deoverlap.pl.
+    :return: generator of the kept lines, sorted by sequence and descending score
+    """
+    for _, sequence_lines in iter_sequence_lines(lines, presorted, buffer_lines, temp_dir):
+        yield from deoverlap_sequence_hits(sequence_lines, clans, max_keep)
+
+
+def deoverlap_file(input_file, output_file=None, clan_file=None, max_keep=False, presorted=False,
+                   buffer_lines=DEFAULT_BUFFER_LINES, temp_dir=None):
+    """
+        Writes the deoverlapped hits of a (possibly compressed) cmsearch tblout file, by default to
+        <input_file>.deoverlapped.
+    :return: tuple of (output file, number of input hits, number of kept hits)
+    """
+    output_file = output_file or input_file + DEOVERLAPPED_SUFFIX
+    clans = parse_clan_file(clan_file) if clan_file else None
+    total = 0
+    kept = 0
+    with open_input(input_file) as file, open(output_file, 'w') as out:
+        for _, sequence_lines in iter_sequence_lines(file, presorted, buffer_lines, temp_dir):
+            total += len(sequence_lines)
+            kept_lines = deoverlap_sequence_hits(sequence_lines, clans, max_keep)
+            kept += len(kept_lines)
+            out.writelines(line if line.endswith('\n') else line + '\n' for line in kept_lines)
+    return output_file, total, kept
+
+
+def parse_args(args):
+    parser = argparse.ArgumentParser(description='Tool to remove overlapping lower scoring cmsearch hits')
+    parser.add_argument('tblout_file', help='cmsearch --tblout output')
+    parser.add_argument('-o', '--output-file', help='Output file, defaults to <tblout_file>.deoverlapped')
+    parser.add_argument('--clanin', help='Only remove overlaps within clans, read clan info from this file')
+    parser.add_argument('--maxkeep', action='store_true',
+                        help='Keep hits that only overlap with other hits that are not kept')
+    parser.add_argument('--presorted', action='store_true',
+                        help='Input is grouped by sequence, stream it one sequence at a time')
+    parser.add_argument('--buffer-lines', type=int, default=DEFAULT_BUFFER_LINES,
+                        help='Lines held in memory to sort unsorted input, the rest is spilled to temporary files')
+    parser.add_argument('--temp-dir', help='Directory of the temporary files, defaults to the system one')
+    parser.add_argument('-v', '--verbose', action='store_true')
+    return parser.parse_args(args)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+
+    logging.basicConfig(level=logging.DEBUG if args.verbose else logging.INFO)
+
+    output_file, total, kept = deoverlap_file(args.tblout_file, args.output_file, args.clanin, args.maxkeep,
+                                              args.presorted, args.buffer_lines, args.temp_dir)
+    logging.info('Kept {} of {} hits, written to {}'.format(kept, total, output_file))
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
@@ -14,8 +14,22 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 import argparse
+import concurrent.futures
 import csv
+import heapq
+import itertools
+import logging
 import sys
+from array import array
+from collections import namedtuple
+from operator import itemgetter
+
+from mgnify_util.compression import open_input
+from mgnify_util.parser.cmsearch_deoverlap import DEFAULT_BUFFER_LINES, deoverlap, deoverlap_sequence_hits, \
+    iter_sequence_lines
+from mgnify_util.parser.cmsearch_tblout import read_tblout
+from mgnify_util.parser.rfam_catalogue import load_catalogue
+from mgnify_util.parser.interproscan_matches import StringPool
 
 __author__ = "Maxim Scheremetjew"
 __version__ = "0.1"
@@ -89,42 +103,265 @@ class DeoverlapResultParser:
         sequence accessions and cmsearch matches.
     """
 
+    MATCH_COLUMNS = ('target_name', 'query_name', 'query_accession', 'seq_from', 'seq_to', 'strand')
+
     def __init__(self, input_file):
         self._input_file = input_file
         self._annotations = {}  # map of sequence accessions and matches
+        self.columns = None  # CMSearchMatchColumns, populated by parse_file_columnar
 
-    def parse_file(self, rfam_parser=None):
-        with open(self._input_file) as file:
-            rows = csv.reader(file, delimiter=" ", quotechar='"')
-            for row in rows:
-                row = remove_empty_elements(row)
-                if row[16] == '?':
-                    continue
+    def parse_file(self, rfam_parser=None, deoverlap_hits=False):
+        """
+        :param deoverlap_hits: set if the input is raw cmsearch tblout, overlapping hits are removed while parsing
+        """
+        with open_input(self._input_file) as file:
+            lines = deoverlap(file) if deoverlap_hits else file
+            for row in read_tblout(lines, self.MATCH_COLUMNS, included_only=True):
                 seq_id = row[0]
-                type = row[2]
-                rfam_accession = row[3]
-                forward_strand = True if row[9] == "+" else False
-                start = row[7] if forward_strand else row[8]
-                end = row[8] if forward_strand else row[7]
-
-                description = None
-                feature_coordinates = None
-                if rfam_parser:
-                    description = rfam_parser.get_description(rfam_accession)
-                    feature_coordinates = rfam_parser.get_feature_coordinates(
-                        rfam_accession, int(start), int(end), forward_strand)
-
                 if seq_id not in self._annotations:
                     self._annotations[seq_id] = Annotations()
                 else:
-                    print(f'Found duplicate entry: {seq_id}')
+                    logging.debug(f'Found another match for sequence: {seq_id}')
+                self._add_match(self._annotations.get(seq_id), row, rfam_parser)
+
+    @staticmethod
+    def _add_match(annotations, row, rfam_parser=None):
+        seq_id, type, rfam_accession, seq_from, seq_to, strand = row
+        forward_strand = strand == "+"
+        start = seq_from if forward_strand else seq_to
+        end = seq_to if forward_strand else seq_from
+
+        description = None
+        feature_coordinates = None
+        if rfam_parser:
+            description = rfam_parser.get_description(rfam_accession)
+            feature_coordinates = rfam_parser.get_feature_coordinates(
+                rfam_accession, start, end, forward_strand)
+
+        annotations.add_annotation(type,
+                                   rfam_accession,
+                                   description,
+                                   start, end,
+                                   forward_strand,
+                                   feature_coordinates)
+
+    @classmethod
+    def merge_files(cls, input_files, rfam_parser=None, deoverlap_hits=False, presorted=False, max_groups=64,
+                    max_readers=8, buffer_lines=DEFAULT_BUFFER_LINES):
+        """
+            Parses many cmsearch outputs, e.g. one per FASTA chunk, in one pass. The files are read ahead by a pool
+            of max_readers threads, the per-sequence groups of all files are combined with a k-way merge by
+            sequence accession, so matches of a sequence found in several files end up in one group.
+
+            Only presorted=True streams the files, with memory bounded by max_groups groups per file. Otherwise
+            each file is sorted before its first group is returned, every reader thread then holds up to
+            buffer_lines lines in memory and spills the rest to temporary files.
+
+            Example:
+                for seq_id, annotations in DeoverlapResultParser.merge_files(glob.glob('chunk_*.tblout.gz'),
+                                                                              deoverlap_hits=True):
+                    ...
+
+        :param input_files: tblout or deoverlapped files, plain or compressed
+        :param rfam_parser: optional RfamEntriesFileParser to fill descriptions and feature coordinates
+        :param deoverlap_hits: set if the inputs are raw cmsearch tblout, overlapping hits are removed per sequence
+                               after merging
+        :param presorted: set if each file is sorted by sequence accession (in Python string order)
+        :param max_groups: number of sequence groups read ahead per file
+        :param max_readers: number of files read at the same time
+        :param buffer_lines: lines held in memory per reader to sort a file which is not presorted
+        :return: generator of (sequence accession, Annotations) in sequence accession order
+        """
+        with concurrent.futures.ThreadPoolExecutor(max_readers) as executor:
+            readers = [_SequenceGroupReader(input_file, executor, presorted, max_groups, buffer_lines)
+                       for input_file in input_files]
+            try:
+                merged = heapq.merge(*readers, key=itemgetter(0))
+                for seq_id, groups in itertools.groupby(merged, key=itemgetter(0)):
+                    lines = [line for _, group_lines in groups for line in group_lines]
+                    if deoverlap_hits:
+                        lines = deoverlap_sequence_hits(lines)
+                    annotations = Annotations()
+                    for row in read_tblout(lines, cls.MATCH_COLUMNS, included_only=True):
+                        cls._add_match(annotations, row, rfam_parser)
+                    if annotations.get_all_annotations():
+                        yield seq_id, annotations
+            finally:
+                for reader in readers:
+                    reader.close()
+
+    def parse_file_columnar(self, deoverlap_hits=False):
+        """
+            Parses the input file into typed arrays instead of one CMSearchMatch object per row.
+        :param deoverlap_hits: set if the input is raw cmsearch tblout, overlapping hits are removed while parsing
+        :return: CMSearchMatchColumns
+        """
+        columns = CMSearchMatchColumns()
+        with open_input(self._input_file) as file:
+            lines = deoverlap(file) if deoverlap_hits else file
+            for match in read_tblout(lines, CMSearchMatchColumns.TBLOUT_COLUMNS, included_only=True):
+                columns.add_match(*match)
+        columns.group_by_sequence()
+        self.columns = columns
+        return columns
+
+
+class _SequenceGroupReader:
+    """
+        Reads the per-sequence line groups of one cmsearch output file in chunks of max_groups groups. The next
+        chunk is read by a shared thread pool while the current one is consumed, so reading and decompressing many
+        files overlaps but no more files are read at once than the pool has threads.
+    """
+
+    def __init__(self, input_file, executor, presorted=False, max_groups=64, buffer_lines=DEFAULT_BUFFER_LINES):
+        self.input_file = input_file
+        self.presorted = presorted
+        self.max_groups = max_groups
+        self.buffer_lines = buffer_lines
+        self._executor = executor
+        self._groups = None
+        self._closed = False
+        self._future = executor.submit(self._read_chunk)
+
+    def _iter_groups(self):
+        with open_input(self.input_file) as file:
+            previous_seq_id = None
+            for seq_id, lines in iter_sequence_lines(file, self.presorted, self.buffer_lines):
+                if previous_seq_id is not None and seq_id < previous_seq_id:
+                    raise ValueError('{} is not sorted by sequence accession: {} after {}'.format(
+                        self.input_file, seq_id, previous_seq_id))
+                previous_seq_id = seq_id
+                yield seq_id, lines
+
+    def _read_chunk(self):
+        # Runs in the pool, at most one chunk of a file is read at a time
+        if self._closed:
+            return []
+        if self._groups is None:
+            self._groups = self._iter_groups()
+        return list(itertools.islice(self._groups, self.max_groups))
+
+    def __iter__(self):
+        while True:
+            chunk = self._future.result()
+            if not chunk:
+                return
+            self._future = self._executor.submit(self._read_chunk)
+            yield from chunk
+
+    def close(self):
+        self._closed = True
+        self._future.cancel()
+        concurrent.futures.wait([self._future])
+        if self._groups is not None:
+            self._groups.close()
+
+
+ColumnarMatch = namedtuple('ColumnarMatch', ['seq_id', 'rfam_acc', 'start', 'end', 'forward_strand', 'score',
+                                             'evalue', 'model_from', 'model_to'])
+
+
+class CMSearchMatchColumns:
+    """
+        Columnar storage of cmsearch matches. Sequence and Rfam accessions are interned, match n is made of
+        the n-th element of each column. As for CMSearchMatch, start <= end and the strand is kept separately
+        (1 forward, -1 reverse). model_from and model_to are the matched model positions.
 
-                self._annotations.get(seq_id).add_annotation(type,
-                                                             rfam_accession,
-                                                             description,
-                                                             start, end,
-                                                             forward_strand,
-                                                             feature_coordinates)
+        After group_by_sequence() the matches of a sequence are contiguous, see get_sequence_slice().
+        columns() returns zero-copy memoryviews, to_numpy() wraps them as NumPy arrays if NumPy is installed.
+    """
+
+    COLUMNS = ('seq', 'rfam', 'start', 'end', 'strand', 'score', 'evalue', 'model_from', 'model_to')
+    # Arguments of add_match
+    TBLOUT_COLUMNS = ('target_name', 'query_accession', 'seq_from', 'seq_to', 'strand', 'score', 'evalue',
+                      'mdl_from', 'mdl_to')
+
+    def __init__(self):
+        self.sequences = StringPool()
+        self.rfam_accessions = StringPool()
+        self.seq = array('I')
+        self.rfam = array('I')
+        self.start = array('I')
+        self.end = array('I')
+        self.strand = array('b')
+        self.score = array('d')
+        self.evalue = array('d')
+        self.model_from = array('I')
+        self.model_to = array('I')
+        self._slices = {}  # sequence id -> (lo, hi)
+
+    def add_match(self, seq_id: str, rfam_acc: str, seq_from: int, seq_to: int, strand: str, score: float,
+                  evalue: float, model_from: int, model_to: int):
+        forward_strand = strand == '+'
+        self.seq.append(self.sequences.get_id(seq_id))
+        self.rfam.append(self.rfam_accessions.get_id(rfam_acc))
+        self.start.append(seq_from if forward_strand else seq_to)
+        self.end.append(seq_to if forward_strand else seq_from)
+        self.strand.append(1 if forward_strand else -1)
+        self.score.append(score)
+        self.evalue.append(evalue)
+        self.model_from.append(model_from)
+        self.model_to.append(model_to)
+        self._slices = {}
+
+    def __len__(self):
+        return len(self.seq)
+
+    def group_by_sequence(self):
+        """
+            Reorders all columns so that the matches of each sequence are contiguous, keeping file order
+            within a sequence.
+        """
+        order = sorted(range(len(self)), key=self.seq.__getitem__)
+        for name in self.COLUMNS:
+            column = getattr(self, name)
+            setattr(self, name, array(column.typecode, (column[i] for i in order)))
+        self._slices = {}
+        lo = 0
+        for i in range(1, len(self) + 1):
+            if i == len(self) or self.seq[i] != self.seq[lo]:
+                self._slices[self.seq[lo]] = (lo, i)
+                lo = i
+
+    def get_sequence_slice(self, seq_id):
+        """
+        :return: (lo, hi) range of the matches of a sequence, (0, 0) if there are none
+        """
+        if not self._slices and len(self):
+            self.group_by_sequence()
+        index = self.sequences.find_id(seq_id)
+        return self._slices.get(index, (0, 0)) if index is not None else (0, 0)
+
+    def columns(self, lo=0, hi=None):
+        """
+        :return: dict of column name -> memoryview, optionally restricted to matches lo:hi
+        """
+        hi = len(self) if hi is None else hi
+        return {name: memoryview(getattr(self, name))[lo:hi] for name in self.COLUMNS}
+
+    def to_numpy(self, lo=0, hi=None):
+        """
+        :return: dict of column name -> NumPy array sharing memory with the columns
+        """
+        try:
+            import numpy
+        except ImportError:
+            raise ImportError('to_numpy requires the numpy package')
+        return {name: numpy.frombuffer(view, dtype=view.format) for name, view in self.columns(lo, hi).items()}
+
+    def get_match(self, index: int) -> ColumnarMatch:
+        return ColumnarMatch(self.sequences.values[self.seq[index]],
+                             self.rfam_accessions.values[self.rfam[index]],
+                             self.start[index],
+                             self.end[index],
+                             self.strand[index] == 1,
+                             self.score[index],
+                             self.evalue[index],
+                             self.model_from[index],
+                             self.model_to[index])
+
+    def get_sequence_matches(self, seq_id):
+        return [self.get_match(i) for i in range(*self.get_sequence_slice(seq_id))]
 
 
 class RfamEntry:
@@ -153,14 +390,20 @@ class RfamEntriesFileParser:
             "RF02540","Archaeal large subunit ribosomal RNA",2990
             "RF02541","Bacterial large subunit ribosomal RNA",2925
             "RF02462","Ascomycota telomerase RNA",1859
+
+        Without input file the entries are taken from the Rfam catalogue shipped with the package.
     """
 
-    def __init__(self, input_file):
+    def __init__(self, input_file=None):
         self._input_file = input_file
         self._rfam_entries = {}  # dict of Rfam entries
 
     def parse_file(self):
-        with open(self._input_file) as file:
+        if not self._input_file:
+            for family in load_catalogue():
+                self._rfam_entries[family.accession] = RfamEntry(family.accession, family.description, family.length)
+            return
+        with open_input(self._input_file) as file:
             # Skip header line
             next(file)
             rows = csv.reader(file, delimiter=",", quotechar='"')
@@ -213,8 +456,8 @@ def parse_args(args):
         description='Tool to parse cmsearch deoverlap outputs')
     parser.add_argument('deoverlap_file',
                         help='CMSearch deoverlap outputs')
-    parser.add_argument('rfam_entries',
-                        help='List of Rfam entries')
+    parser.add_argument('rfam_entries', nargs='?',
+                        help='List of Rfam entries, defaults to the Rfam catalogue shipped with the package')
     parser.add_argument('-v', '--verbose', action='store_true')
     return parser.parse_args(args)
 
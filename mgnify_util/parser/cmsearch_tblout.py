@@ -0,0 +1,93 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# Copyright 2018 EMBL - European Bioinformatics Institute
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+from operator import itemgetter
+
+from mgnify_util.compression import open_input
+
+__author__ = "Maxim Scheremetjew"
+__version__ = "0.1"
+__status__ = "Development"
+
+# cmsearch --tblout columns:
+# target name, accession, query name, accession, mdl, mdl from, mdl to, seq from, seq to, strand, trunc, pass, gc,
+# bias, score, E-value, inc, description of target
+TBLOUT_COLUMNS = ('target_name', 'target_accession', 'query_name', 'query_accession', 'mdl', 'mdl_from', 'mdl_to',
+                  'seq_from', 'seq_to', 'strand', 'trunc', 'pass', 'gc', 'bias', 'score', 'evalue', 'inc',
+                  'description')
+COLUMN_INDEX = {name: i for i, name in enumerate(TBLOUT_COLUMNS)}
+COLUMN_TYPES = {
+    'mdl_from': int,
+    'mdl_to': int,
+    'seq_from': int,
+    'seq_to': int,
+    'gc': float,
+    'bias': float,
+    'score': float,
+    'evalue': float,
+    # The description may contain spaces, it is the rest of the line
+    'description': str.rstrip,
+}
+
+
+def _get_indices(columns):
+    try:
+        return [COLUMN_INDEX[column] for column in columns]
+    except KeyError as e:
+        raise ValueError('Unknown tblout column {}'.format(e))
+
+
+def read_tblout(lines, columns=None, included_only=False):
+    """
+        Reads cmsearch tblout (or deoverlapped) lines, splitting each line once with str.split. Comment lines are
+        skipped, numeric columns are converted.
+
+        Example:
+            for seq_id, rfam_acc, seq_from, seq_to in read_tblout(file, ('target_name', 'query_accession',
+                                                                        'seq_from', 'seq_to')):
+                ...
+
+    :param lines: iterable of lines, e.g. an open file
+    :param columns: names (see TBLOUT_COLUMNS) of the columns to return, all columns by default
+    :param included_only: skip hits which are not above the inclusion threshold (inc column '?')
+    :return: generator of tuples with the requested columns
+    """
+    columns = TBLOUT_COLUMNS if columns is None else tuple(columns)
+    indices = _get_indices(columns)
+    project = itemgetter(*indices) if len(indices) > 1 else lambda row: (row[indices[0]],)
+    # Only the requested columns are converted, in place on the split line
+    converters = [(COLUMN_INDEX[column], COLUMN_TYPES[column]) for column in set(columns) if column in COLUMN_TYPES]
+    inc_index = COLUMN_INDEX['inc']
+    n_columns = len(TBLOUT_COLUMNS)
+
+    for line in lines:
+        if line[0] == '#' or line.isspace():
+            continue
+        row = line.split(None, n_columns - 1)
+        if len(row) != n_columns:
+            raise ValueError('Unexpected number of chunks: {}'.format(len(row)))
+        if included_only and row[inc_index] == '?':
+            continue
+        for index, convert in converters:
+            row[index] = convert(row[index])
+        yield project(row)
+
+
+def read_tblout_file(input_file, columns=None, included_only=False):
+    """
+        Same as read_tblout for a (possibly compressed) tblout file.
+    """
+    with open_input(input_file) as file:
+        yield from read_tblout(file, columns, included_only)
@@ -0,0 +1,238 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# Copyright 2018 EMBL - European Bioinformatics Institute
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+from array import array
+
+from mgnify_util.compression import open_input
+
+__author__ = "Maxim Scheremetjew"
+__version__ = "0.1"
+__status__ = "Development"
+
+DEFAULT_RELATIONSHIPS = ('is_a', 'part_of')
+
+
+def normalise_go_id(go_id: str) -> str:
+    """
+        The InterProScan parser stores GO terms without prefix, e.g. 0045454 for GO:0045454.
+    """
+    return go_id if go_id.startswith('GO:') else 'GO:' + go_id
+
+
+def parse_obo_file(obo_file, relationships=DEFAULT_RELATIONSHIPS):
+    """
+        Reads the [Term] stanzas of an OBO file.
+    :return: tuple of (dict of term -> list of parent terms, dict of alternative id -> term)
+    """
+    parents = {}
+    alt_ids = {}
+    with open_input(obo_file) as file:
+        term = None
+        stanza_parents = []
+        in_term = False
+        for line in file:
+            line = line.strip()
+            if line.startswith('['):
+                if in_term and term:
+                    parents[term] = stanza_parents
+                in_term = line == '[Term]'
+                term = None
+                stanza_parents = []
+                continue
+            if not in_term or ':' not in line:
+                continue
+            tag, value = line.split(':', 1)
+            value = value.split('!', 1)[0].strip()
+            if tag == 'id':
+                term = value
+            elif tag == 'alt_id':
+                alt_ids[value] = term
+            elif tag == 'is_a' and 'is_a' in relationships:
+                stanza_parents.append(value.split()[0])
+            elif tag == 'relationship':
+                relationship, parent = value.split()[:2]
+                if relationship in relationships:
+                    stanza_parents.append(parent)
+            elif tag == 'is_obsolete' and value == 'true':
+                term = None
+        if in_term and term:
+            parents[term] = stanza_parents
+    return parents, {alt_id: term for alt_id, term in alt_ids.items() if term in parents}
+
+
+class GeneOntology:
+    """
+        GO hierarchy with a precomputed transitive closure. Terms are mapped to integer ids, parents and
+        ancestors (including the term itself) are held in CSR layout: the ancestors of term i are
+        closure_indices[closure_indptr[i]:closure_indptr[i + 1]].
+
+        Example:
+            go = GeneOntology.from_obo('go-basic.obo')
+            go.roll_up(['0045454'])
+            go.roll_up_to_slim(['0045454'], go_slim_terms)
+    """
+
+    def __init__(self, parents: dict, alt_ids: dict = None):
+        self.terms = sorted(parents)
+        self.term_index = {term: i for i, term in enumerate(self.terms)}
+        for alt_id, term in (alt_ids or {}).items():
+            self.term_index.setdefault(alt_id, self.term_index[term])
+
+        self.parent_indptr = array('I', [0])
+        self.parent_indices = array('I')
+        for term in self.terms:
+            self.parent_indices.extend(sorted({self.term_index[parent] for parent in parents[term]
+                                               if parent in self.term_index}))
+            self.parent_indptr.append(len(self.parent_indices))
+
+        self.closure_indptr, self.closure_indices = self._build_closure()
+        self._slim_cache = {}
+
+    @classmethod
+    def from_obo(cls, obo_file, relationships=DEFAULT_RELATIONSHIPS):
+        return cls(*parse_obo_file(obo_file, relationships))
+
+    def _get_parents(self, index):
+        return self.parent_indices[self.parent_indptr[index]:self.parent_indptr[index + 1]]
+
+    def _build_closure(self):
+        # Iterative Tarjan walk over the child -> parent edges. A strongly connected component is finished only
+        # after all components it can reach, so the closures of its parents outside the component are known.
+        # The terms of a cycle share one closure.
+        n_terms = len(self.terms)
+        ancestors = [None] * n_terms
+        order = [-1] * n_terms
+        low = [0] * n_terms
+        on_stack = [False] * n_terms
+        component_stack = []
+        counter = 0
+        for root in range(n_terms):
+            if order[root] >= 0:
+                continue
+            order[root] = low[root] = counter
+            counter += 1
+            component_stack.append(root)
+            on_stack[root] = True
+            walk = [(root, 0)]
+            while walk:
+                index, next_parent = walk[-1]
+                parents = self._get_parents(index)
+                if next_parent < len(parents):
+                    walk[-1] = (index, next_parent + 1)
+                    parent = parents[next_parent]
+                    if order[parent] < 0:
+                        order[parent] = low[parent] = counter
+                        counter += 1
+                        component_stack.append(parent)
+                        on_stack[parent] = True
+                        walk.append((parent, 0))
+                    elif on_stack[parent]:
+                        low[index] = min(low[index], order[parent])
+                    continue
+                walk.pop()
+                if walk:
+                    child = walk[-1][0]
+                    low[child] = min(low[child], low[index])
+                if low[index] != order[index]:
+                    continue
+                component = []
+                while True:
+                    member = component_stack.pop()
+                    on_stack[member] = False
+                    component.append(member)
+                    if member == index:
+                        break
+                closure = set(component)
+                for member in component:
+                    for parent in self._get_parents(member):
+                        if ancestors[parent] is not None:
+                            closure.update(ancestors[parent])
+                closure = frozenset(closure)
+                for member in component:
+                    ancestors[member] = closure
+
+        indptr = array('I', [0])
+        indices = array('I')
+        for closure in ancestors:
+            indices.extend(sorted(closure))
+            indptr.append(len(indices))
+        return indptr, indices
+
+    def get_ancestor_indices(self, index: int):
+        return self.closure_indices[self.closure_indptr[index]:self.closure_indptr[index + 1]]
+
+    def get_index(self, go_id: str):
+        return self.term_index.get(normalise_go_id(go_id))
+
+    def roll_up(self, go_ids):
+        """
+        :return: set of the terms and all their ancestors, unknown terms are ignored
+        """
+        result = set()
+        for go_id in go_ids:
+            index = self.get_index(go_id)
+            if index is not None:
+                result.update(self.get_ancestor_indices(index))
+        return {self.terms[i] for i in result}
+
+    def _get_slim_indices(self, index: int, slim: frozenset):
+        key = (index, slim)
+        slim_indices = self._slim_cache.get(key)
+        if slim_indices is None:
+            slim_indices = self._slim_cache[key] = slim.intersection(self.get_ancestor_indices(index))
+        return slim_indices
+
+    def roll_up_to_slim(self, go_ids, slim_terms):
+        """
+        :return: set of the GO-slim terms which are ancestors of (or equal to) any of the terms
+        """
+        slim = frozenset(i for i in (self.get_index(term) for term in slim_terms) if i is not None)
+        result = set()
+        for go_id in go_ids:
+            index = self.get_index(go_id)
+            if index is not None:
+                result.update(self._get_slim_indices(index, slim))
+        return {self.terms[i] for i in result}
+
+    def roll_up_sequences(self, sequence_go_ids: dict, slim_terms=None):
+        """
+            Rolls up the GO terms of many sequences, the ancestors (or slim terms) of each distinct term
+            are computed once.
+
+        :param sequence_go_ids: dict of sequence accession -> iterable of GO ids
+        :param slim_terms: optional GO-slim, if given only slim terms are returned
+        :return: dict of sequence accession -> set of GO ids
+        """
+        slim = None
+        if slim_terms is not None:
+            slim = frozenset(i for i in (self.get_index(term) for term in slim_terms) if i is not None)
+        term_cache = {}
+        result = {}
+        for seq_id, go_ids in sequence_go_ids.items():
+            indices = set()
+            for go_id in go_ids:
+                rolled_up = term_cache.get(go_id)
+                if rolled_up is None:
+                    index = self.get_index(go_id)
+                    if index is None:
+                        rolled_up = frozenset()
+                    elif slim is None:
+                        rolled_up = frozenset(self.get_ancestor_indices(index))
+                    else:
+                        rolled_up = self._get_slim_indices(index, slim)
+                    term_cache[go_id] = rolled_up
+                indices.update(rolled_up)
+            result[seq_id] = {self.terms[i] for i in indices}
+        return result
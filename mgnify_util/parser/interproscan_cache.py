@@ -0,0 +1,193 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# Copyright 2018 EMBL - European Bioinformatics Institute
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+import json
+import sqlite3
+import time
+
+from mgnify_util.parser.interproscan_parser import FunctionalAnnotation, RowFilter, get_row_filter_fingerprint
+
+__author__ = "Maxim Scheremetjew"
+__version__ = "0.1"
+__status__ = "Development"
+
+# SQLite limits the number of parameters of a statement
+MAX_QUERY_PARAMETERS = 900
+# Number of looked up entries whose last use is written at once
+TOUCH_BATCH_SIZE = 10000
+
+
+def _chunks(values, size=MAX_QUERY_PARAMETERS):
+    values = list(values)
+    for i in range(0, len(values), size):
+        yield values[i:i + size]
+
+
+class InterProScanCache:
+    """
+        Local SQLite cache of InterProScan annotations keyed by protein sequence MD5 (i5 TSV column 2),
+        so identical proteins from different assemblies and studies are only parsed once.
+
+        Annotations depend on the InterProScan version and on the row filter applied while parsing, so entries
+        are stored per namespace of both. Caches opened with another version or filter do not see them.
+
+        The size cap is enforced by trim(), which is called on close. Least recently used entries are removed
+        first. The last use of looked up entries is written in batches of TOUCH_BATCH_SIZE.
+
+        Example:
+            with InterProScanCache('i5_cache.sqlite', '5.30-69.0', max_entries=50000000) as cache:
+                parser.parse_file_cached(cache)
+    """
+
+    def __init__(self, database_file, i5_version: str, max_entries=None, row_filter: RowFilter = None):
+        self.database_file = database_file
+        self.max_entries = max_entries
+        self.row_filter_fingerprint = get_row_filter_fingerprint(row_filter)
+        self.namespace = json.dumps([i5_version, self.row_filter_fingerprint])
+        self._touched = {}  # MD5 -> time of the last lookup, not written yet
+        self._connection = sqlite3.connect(database_file)
+        self._connection.execute('CREATE TABLE IF NOT EXISTS annotations '
+                                 '(namespace TEXT NOT NULL, md5 TEXT NOT NULL, annotations TEXT NOT NULL, '
+                                 'last_used REAL NOT NULL, PRIMARY KEY (namespace, md5))')
+        self._connection.execute('CREATE INDEX IF NOT EXISTS annotations_last_used ON annotations (last_used)')
+        self._connection.commit()
+
+    def __len__(self):
+        return self._connection.execute('SELECT COUNT(*) FROM annotations WHERE namespace = ?',
+                                        (self.namespace,)).fetchone()[0]
+
+    def contains(self, md5s):
+        """
+        :return: set of the given MD5s which are cached
+        """
+        found = set()
+        for chunk in _chunks(md5s):
+            query = 'SELECT md5 FROM annotations WHERE namespace = ? AND md5 IN ({})'.format(
+                ','.join('?' * len(chunk)))
+            found.update(row[0] for row in self._connection.execute(query, [self.namespace] + chunk))
+        return found
+
+    def bulk_insert(self, md5_annotations: dict):
+        """
+        :param md5_annotations: dict of MD5 -> iterable of (database, identifier)
+        """
+        self._write_touched()
+        now = time.time()
+        self._connection.executemany(
+            'INSERT OR REPLACE INTO annotations (namespace, md5, annotations, last_used) VALUES (?, ?, ?, ?)',
+            ((self.namespace, md5, json.dumps(sorted(pairs)), now) for md5, pairs in md5_annotations.items()))
+        self._connection.commit()
+
+    def bulk_lookup(self, md5s):
+        """
+        :return: dict of MD5 -> set of FunctionalAnnotation, MD5s which are not cached are left out
+        """
+        result = {}
+        for chunk in _chunks(set(md5s)):
+            query = 'SELECT md5, annotations FROM annotations WHERE namespace = ? AND md5 IN ({})'.format(
+                ','.join('?' * len(chunk)))
+            for md5, annotations in self._connection.execute(query, [self.namespace] + chunk):
+                result[md5] = {FunctionalAnnotation(database, identifier)
+                               for database, identifier in json.loads(annotations)}
+        now = time.time()
+        self._touched.update((md5, now) for md5 in result)
+        if len(self._touched) >= TOUCH_BATCH_SIZE:
+            self._write_touched()
+        return result
+
+    def _write_touched(self):
+        # Committed right away, so that no write transaction stays open between lookups
+        if self._touched:
+            self._connection.executemany('UPDATE annotations SET last_used = ? WHERE namespace = ? AND md5 = ?',
+                                         ((last_used, self.namespace, md5)
+                                          for md5, last_used in self._touched.items()))
+            self._connection.commit()
+            self._touched = {}
+
+    def get(self, md5):
+        return self.bulk_lookup([md5]).get(md5)
+
+    def trim(self):
+        """
+            Removes the least recently used entries above max_entries, over all namespaces.
+        """
+        self._write_touched()
+        if not self.max_entries:
+            return
+        total = self._connection.execute('SELECT COUNT(*) FROM annotations').fetchone()[0]
+        excess = total - self.max_entries
+        if excess > 0:
+            self._connection.execute('DELETE FROM annotations WHERE rowid IN '
+                                     '(SELECT rowid FROM annotations ORDER BY last_used, rowid LIMIT ?)', (excess,))
+            self._connection.commit()
+
+    def close(self):
+        if self._connection is not None:
+            self.trim()
+            self._connection.commit()
+            self._connection.close()
+            self._connection = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+
+class CachedAnnotations:
+    __slots__ = ('_annotations',)
+
+    def __init__(self, annotations: set):
+        self._annotations = annotations
+
+    def get_all_annotations(self):
+        return self._annotations
+
+
+class CachedAnnotationMap:
+    """
+        Map of sequence accessions and annotations which are looked up in an InterProScanCache by MD5.
+        Supports the dict operations used by FlatfileDecorator (in, get) and get_many, which looks up many
+        sequences with one query.
+    """
+
+    def __init__(self, md5s: dict, cache: InterProScanCache):
+        self._md5s = md5s  # map of sequence accessions and MD5s
+        self._cache = cache
+
+    def __contains__(self, seq_id):
+        return seq_id in self._md5s
+
+    def __len__(self):
+        return len(self._md5s)
+
+    def __iter__(self):
+        return iter(self._md5s)
+
+    def get(self, seq_id, default=None):
+        md5 = self._md5s.get(seq_id)
+        if md5 is None:
+            return default
+        annotations = self._cache.get(md5)
+        return CachedAnnotations(annotations) if annotations is not None else default
+
+    def get_many(self, seq_ids):
+        """
+        :return: dict of sequence accession -> CachedAnnotations, sequences which are not cached are left out
+        """
+        md5s = {seq_id: self._md5s[seq_id] for seq_id in seq_ids if seq_id in self._md5s}
+        found = self._cache.bulk_lookup(md5s.values())
+        return {seq_id: CachedAnnotations(found[md5]) for seq_id, md5 in md5s.items() if md5 in found}
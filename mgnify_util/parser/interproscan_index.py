@@ -0,0 +1,200 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# Copyright 2018 EMBL - European Bioinformatics Institute
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+import argparse
+import csv
+import mmap
+import os
+import sys
+from operator import itemgetter
+
+from mgnify_util.compression import is_compressed
+from mgnify_util.parser.interproscan_parser import Annotations, add_row_annotations
+
+__author__ = "Maxim Scheremetjew"
+__version__ = "0.1"
+__status__ = "Development"
+
+INDEX_SUFFIX = '.idx'
+INDEX_HEADER = '#interproscan_index'
+
+
+def get_index_file(input_tsv_file):
+    return input_tsv_file + INDEX_SUFFIX
+
+
+def build_index(input_tsv_file, index_file=None):
+    """
+        Writes a sidecar file mapping each sequence accession to the byte offset and length of its block of
+        consecutive rows. Sequences whose rows are not consecutive get one entry per block. Entries are sorted by
+        sequence accession, so that they can be binary searched without loading the index.
+
+        Format (tab separated):
+            #interproscan_index <size of the TSV file>
+            <seq_id> <offset> <length>
+    :return: path of the index file
+    """
+    if is_compressed(input_tsv_file):
+        raise ValueError('Cannot index compressed file {}'.format(input_tsv_file))
+    index_file = index_file or get_index_file(input_tsv_file)
+
+    blocks = []
+    with open(input_tsv_file, 'rb') as tsv:
+        current_seq_id = None
+        block_start = 0
+        position = 0
+        for line in tsv:
+            seq_id = line.split(b'\t', 1)[0]
+            if seq_id != current_seq_id:
+                if current_seq_id is not None:
+                    blocks.append((current_seq_id, block_start, position - block_start))
+                current_seq_id = seq_id
+                block_start = position
+            position += len(line)
+        if current_seq_id is not None:
+            blocks.append((current_seq_id, block_start, position - block_start))
+    # Stable sort, blocks of the same sequence stay in file order
+    blocks.sort(key=itemgetter(0))
+
+    with open(index_file, 'wb') as out:
+        out.write('{}\t{}\n'.format(INDEX_HEADER, os.path.getsize(input_tsv_file)).encode())
+        for seq_id, offset, length in blocks:
+            out.write(b'%s\t%d\t%d\n' % (seq_id, offset, length))
+    return index_file
+
+
+class InterProScanTSVIndex:
+    """
+        Random access to the annotations of single sequences in a large i5 TSV file, using the
+        sidecar index written by build_index. Both files are memory mapped and the index is binary searched,
+        so opening the index does not depend on its size.
+
+        Example:
+            with InterProScanTSVIndex('proteins.i5.tsv') as index:
+                annotations = index.get_annotations(['TRINITY-DN10052-c0-g1-i1.p1'])
+    """
+
+    def __init__(self, input_tsv_file, index_file=None):
+        self.input_tsv_file = input_tsv_file
+        self.index_file = index_file or get_index_file(input_tsv_file)
+        self._file = None
+        self._mmap = None
+        self._index = None
+        self._index_start = None  # offset of the first entry, after the header
+        self._check_index()
+
+    def _check_index(self):
+        with open(self.index_file) as file:
+            header = file.readline().rstrip('\n').split('\t')
+        if header[0] != INDEX_HEADER:
+            raise ValueError('{} is not an InterProScan index file'.format(self.index_file))
+        if int(header[1]) != os.path.getsize(self.input_tsv_file):
+            raise ValueError('Index {} is out of date, please rebuild it'.format(self.index_file))
+
+    def open(self):
+        if self._index is None:
+            with open(self.index_file, 'rb') as index_file:
+                self._index = mmap.mmap(index_file.fileno(), 0, access=mmap.ACCESS_READ)
+            self._index_start = self._index.find(b'\n') + 1
+            self._file = open(self.input_tsv_file, 'rb')
+            # Empty files cannot be memory mapped, their index has no entries to look up
+            if os.fstat(self._file.fileno()).st_size:
+                self._mmap = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+
+    def close(self):
+        if self._index is not None:
+            if self._mmap is not None:
+                self._mmap.close()
+            self._index.close()
+            self._file.close()
+            self._mmap = None
+            self._index = None
+            self._file = None
+
+    def __enter__(self):
+        self.open()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def __contains__(self, seq_id):
+        return bool(self.get_blocks(seq_id))
+
+    def get_blocks(self, seq_id):
+        """
+            Binary searches the index for the first entry of the sequence and reads its consecutive entries.
+
+        :return: list of (offset, length) of the row blocks of the sequence
+        """
+        self.open()
+        index = self._index
+        seq_id = seq_id.encode()
+        low, high = self._index_start, len(index)
+        while low < high:
+            middle = (low + high) // 2
+            line_start = index.rfind(b'\n', 0, middle) + 1
+            line_end = index.find(b'\n', line_start)
+            if index[line_start:index.find(b'\t', line_start, line_end)] < seq_id:
+                low = line_end + 1
+            else:
+                high = line_start
+        blocks = []
+        key = seq_id + b'\t'
+        while index[low:low + len(key)] == key:
+            line_end = index.find(b'\n', low)
+            _, offset, length = index[low:line_end].split(b'\t')
+            blocks.append((int(offset), int(length)))
+            low = line_end + 1
+        return blocks
+
+    def _read_rows(self, blocks):
+        for offset, length in blocks:
+            lines = self._mmap[offset:offset + length].decode().splitlines()
+            yield from csv.reader(lines, delimiter="\t", quotechar='"')
+
+    def get_rows(self, seq_id):
+        return self._read_rows(self.get_blocks(seq_id))
+
+    def get_annotations(self, seq_ids):
+        """
+        :return: dict of sequence accession -> Annotations, sequences without annotations are left out
+        """
+        result = {}
+        for seq_id in seq_ids:
+            blocks = self.get_blocks(seq_id)
+            if not blocks:
+                continue
+            annotations = Annotations()
+            for row in self._read_rows(blocks):
+                add_row_annotations(annotations, row)
+            result[seq_id] = annotations
+        return result
+
+
+def parse_args(args):
+    parser = argparse.ArgumentParser(description='Tool to index InterProScan TSV files by sequence accession')
+    parser.add_argument('i5_annotation_file', help='TSV formatted I5 annotation file')
+    parser.add_argument('-o', '--index-file', help='Index file, defaults to <i5_annotation_file>.idx')
+    return parser.parse_args(args)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    build_index(args.i5_annotation_file, args.index_file)
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
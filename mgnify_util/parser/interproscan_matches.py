@@ -0,0 +1,164 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# Copyright 2018 EMBL - European Bioinformatics Institute
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+import bisect
+import csv
+from array import array
+from collections import namedtuple
+
+from mgnify_util.compression import open_input
+from mgnify_util.parser.interproscan_parser import filter_rows
+
+__author__ = "Maxim Scheremetjew"
+__version__ = "0.1"
+__status__ = "Development"
+
+Match = namedtuple('Match', ['seq_id', 'database', 'signature', 'start', 'end', 'evalue', 'interpro'])
+
+NO_INTERPRO = -1
+
+
+class StringPool:
+    """
+        Interns strings into consecutive integer ids.
+    """
+
+    def __init__(self):
+        self._ids = {}
+        self.values = []
+
+    def get_id(self, value: str) -> int:
+        value_id = self._ids.get(value)
+        if value_id is None:
+            value_id = self._ids[value] = len(self.values)
+            self.values.append(value)
+        return value_id
+
+    def find_id(self, value: str):
+        return self._ids.get(value)
+
+    def __len__(self):
+        return len(self.values)
+
+
+class InterProScanMatches:
+    """
+        Columnar, array-backed record of every match in i5 TSV output: sequence, member database, signature,
+        start, end, e-value and InterPro entry. Strings are interned, match n is made of the n-th element of
+        each column.
+
+        Example:
+            matches = InterProScanMatches.from_file('proteins.i5.tsv')
+            for match in matches.overlapping('TRINITY-DN10052-c0-g1-i1.p1', 50, 100):
+                print(match.signature, match.start, match.end)
+    """
+
+    def __init__(self):
+        self.sequences = StringPool()
+        self.databases = StringPool()
+        self.signatures = StringPool()
+        self.interpro_entries = StringPool()
+
+        self.seq = array('I')
+        self.database = array('I')
+        self.signature = array('I')
+        self.start = array('I')
+        self.end = array('I')
+        self.evalue = array('d')  # NaN for matches without e-value
+        self.interpro = array('i')  # NO_INTERPRO for unintegrated signatures
+
+        self._groups = None  # sequence id -> (lo, hi) into the interval index arrays
+        self._order = None  # match indices grouped by sequence and sorted by start
+        self._starts = None
+        self._max_ends = None  # running maximum of the end positions within each sequence
+
+    @classmethod
+    def from_file(cls, input_tsv_file, row_filter=None):
+        matches = cls()
+        with open_input(input_tsv_file) as file:
+            rows = csv.reader(file, delimiter="\t", quotechar='"')
+            for row in filter_rows(rows, row_filter):
+                matches.add_row(row)
+        return matches
+
+    def add_row(self, row: list):
+        self.seq.append(self.sequences.get_id(row[0]))
+        self.database.append(self.databases.get_id(row[3]))
+        self.signature.append(self.signatures.get_id(row[4]))
+        self.start.append(int(row[6]))
+        self.end.append(int(row[7]))
+        self.evalue.append(float('nan') if row[8] == '-' else float(row[8]))
+        has_interpro = len(row) > 11 and row[11] not in ('', '-')
+        self.interpro.append(self.interpro_entries.get_id(row[11]) if has_interpro else NO_INTERPRO)
+        self._groups = None
+
+    def __len__(self):
+        return len(self.seq)
+
+    def get_match(self, index: int) -> Match:
+        interpro = self.interpro[index]
+        return Match(self.sequences.values[self.seq[index]],
+                     self.databases.values[self.database[index]],
+                     self.signatures.values[self.signature[index]],
+                     self.start[index],
+                     self.end[index],
+                     self.evalue[index],
+                     None if interpro == NO_INTERPRO else self.interpro_entries.values[interpro])
+
+    def build_interval_index(self):
+        order = sorted(range(len(self)), key=lambda i: (self.seq[i], self.start[i]))
+        self._order = array('I', order)
+        self._starts = array('I', (self.start[i] for i in order))
+        self._max_ends = array('I')
+        self._groups = {}
+        lo = 0
+        for position, index in enumerate(order):
+            seq = self.seq[index]
+            if position == lo or self.seq[order[position - 1]] != seq:
+                lo = position
+                self._max_ends.append(self.end[index])
+            else:
+                self._max_ends.append(max(self._max_ends[-1], self.end[index]))
+            self._groups[seq] = (lo, position + 1)
+
+    def _get_group(self, seq_id):
+        if self._groups is None:
+            self.build_interval_index()
+        seq = self.sequences.find_id(seq_id)
+        return self._groups.get(seq) if seq is not None else None
+
+    def get_sequence_matches(self, seq_id):
+        """
+        :return: list of Match ordered by start position
+        """
+        group = self._get_group(seq_id)
+        if group is None:
+            return []
+        return [self.get_match(self._order[i]) for i in range(*group)]
+
+    def overlapping(self, seq_id, start: int, end: int):
+        """
+            Finds the matches of a sequence which overlap residues start to end (inclusive).
+        :return: list of Match ordered by start position
+        """
+        group = self._get_group(seq_id)
+        if group is None:
+            return []
+        lo, hi = group
+        # Matches starting after the region cannot overlap it
+        hi = bisect.bisect_right(self._starts, end, lo, hi)
+        # Matches before the first position whose running maximum end reaches the region all end before it
+        lo = bisect.bisect_left(self._max_ends, start, lo, hi)
+        return [self.get_match(self._order[i]) for i in range(lo, hi) if self.end[self._order[i]] >= start]
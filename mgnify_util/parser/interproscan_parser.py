@@ -14,6 +14,14 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 import csv
+import json
+import logging
+import multiprocessing
+import os
+import sys
+from array import array
+
+from mgnify_util.compression import open_input, is_compressed
 
 __author__ = "Maxim Scheremetjew"
 __version__ = "0.1"
@@ -25,6 +33,8 @@ class FunctionalAnnotation:
         Describes a function annotation for instance InterPro:IPR004361 or GO:0004462.
     """
 
+    __slots__ = ('database', 'identifier')
+
     def __init__(self, database, identifier):
         self.database = database
         self.identifier = identifier
@@ -64,45 +74,412 @@ class Annotations:
         return self._annotations
 
 
+class AnnotationVocabulary:
+    """
+        Interns (database, identifier) pairs into integer ids. Each pair is backed by a single
+        FunctionalAnnotation which is shared by all sequences.
+    """
+
+    def __init__(self):
+        self._ids = {}  # (database, identifier) -> annotation id
+        self.annotations = []  # annotation id -> FunctionalAnnotation
+
+    def get_id(self, database: str, identifier: str) -> int:
+        key = (database, identifier)
+        annotation_id = self._ids.get(key)
+        if annotation_id is None:
+            annotation_id = len(self.annotations)
+            self._ids[key] = annotation_id
+            self.annotations.append(FunctionalAnnotation(sys.intern(database), sys.intern(identifier)))
+        return annotation_id
+
+    def __len__(self):
+        return len(self.annotations)
+
+
+class AnnotationIds:
+    """
+        Collects the interned annotation ids of a sequence, drop-in for Annotations while parsing.
+    """
+
+    __slots__ = ('_vocabulary', 'ids')
+
+    def __init__(self, vocabulary: AnnotationVocabulary):
+        self._vocabulary = vocabulary
+        self.ids = set()
+
+    def add_annotation(self, database: str, identifier: str):
+        self.ids.add(self._vocabulary.get_id(database, identifier))
+
+
+class CompactAnnotations:
+    """
+        Read-only view on the annotations of one sequence held by a CompactAnnotationStore.
+    """
+
+    __slots__ = ('_store', '_index')
+
+    def __init__(self, store, index: int):
+        self._store = store
+        self._index = index
+
+    def get_annotation_ids(self):
+        return self._store.get_annotation_ids(self._index)
+
+    def get_all_annotations(self):
+        annotations = self._store.vocabulary.annotations
+        return {annotations[annotation_id] for annotation_id in self.get_annotation_ids()}
+
+
+class CompactAnnotationStore:
+    """
+        Memory efficient replacement for the map of sequence accessions and Annotations.
+
+        Annotation ids of all sequences are held in one array, sequence n owns the slice
+        offsets[n]:offsets[n + 1]. Supports the dict operations used by consumers of
+        InterProScanTSVResultParser.annotations (in, get, [], keys, items, len).
+    """
+
+    def __init__(self):
+        self.vocabulary = AnnotationVocabulary()
+        self._seq_index = {}  # sequence accession -> sequence index
+        self._offsets = array('Q', [0])
+        self._annotation_ids = array('I')
+        self._extra_ids = {}  # sequence index -> ids of rows which were not consecutive with the first ones
+
+    def new_annotation_ids(self):
+        return AnnotationIds(self.vocabulary)
+
+    def add_sequence(self, seq_id: str, annotation_ids):
+        index = self._seq_index.get(seq_id)
+        if index is not None:
+            self._extra_ids.setdefault(index, set()).update(annotation_ids)
+            return
+        self._seq_index[seq_id] = len(self._offsets) - 1
+        self._annotation_ids.extend(sorted(annotation_ids))
+        self._offsets.append(len(self._annotation_ids))
+
+    def get_annotation_ids(self, index: int):
+        ids = self._annotation_ids[self._offsets[index]:self._offsets[index + 1]]
+        if index in self._extra_ids:
+            return sorted(self._extra_ids[index].union(ids))
+        return ids
+
+    def get(self, seq_id, default=None):
+        index = self._seq_index.get(seq_id)
+        if index is None:
+            return default
+        return CompactAnnotations(self, index)
+
+    def __getitem__(self, seq_id):
+        return CompactAnnotations(self, self._seq_index[seq_id])
+
+    def __contains__(self, seq_id):
+        return seq_id in self._seq_index
+
+    def __iter__(self):
+        return iter(self._seq_index)
+
+    def __len__(self):
+        return len(self._seq_index)
+
+    def keys(self):
+        return self._seq_index.keys()
+
+    def items(self):
+        for seq_id, index in self._seq_index.items():
+            yield seq_id, CompactAnnotations(self, index)
+
+
+ANNOTATION_TYPES = ("InterPro", "GO", "KEGG", "MetaCyc", "Reactome")
+
+
+class RowFilter:
+    """
+        Decides which i5 TSV rows and cross reference types are kept while parsing.
+
+        :param databases: member databases to keep (column 4), e.g. ['Pfam', 'TIGRFAM']
+        :param max_evalue: maximum e-value (column 9), rows without an e-value ('-') are kept
+        :param status: status flag to keep (column 10), e.g. 'T'
+        :param annotation_types: cross reference types to keep, any of ANNOTATION_TYPES
+    """
+
+    __slots__ = ('databases', 'max_evalue', 'status', 'annotation_types')
+
+    def __init__(self, databases=None, max_evalue=None, status=None, annotation_types=None):
+        self.databases = set(databases) if databases else None
+        self.max_evalue = max_evalue
+        self.status = status
+        if annotation_types:
+            unknown_types = set(annotation_types) - set(ANNOTATION_TYPES)
+            if unknown_types:
+                raise ValueError('Unknown annotation types {}. Valid choices are: {}'.format(
+                    ','.join(unknown_types), ','.join(ANNOTATION_TYPES)))
+            self.annotation_types = set(annotation_types)
+        else:
+            self.annotation_types = None
+
+    def fingerprint(self) -> str:
+        """
+            Stable description of the filter settings, equal for equivalent filters.
+        """
+        return json.dumps([sorted(self.databases) if self.databases else None, self.max_evalue, self.status,
+                           sorted(self.annotation_types) if self.annotation_types else None])
+
+    def keep_row(self, row: list) -> bool:
+        if self.databases is not None and row[3] not in self.databases:
+            return False
+        if self.status is not None and row[9] != self.status:
+            return False
+        if self.max_evalue is not None and row[8] != '-' and float(row[8]) > self.max_evalue:
+            return False
+        return True
+
+
+def get_row_filter_fingerprint(row_filter: RowFilter = None) -> str:
+    return (row_filter or RowFilter()).fingerprint()
+
+
+def add_row_annotations(annotations: Annotations, row: list, annotation_types=None):
+    """
+        Adds the InterPro, GO and pathway cross references of a single i5 TSV row.
+
+    :param annotation_types: set of cross reference types to add, defaults to all
+    """
+    for x in range(11, len(row)):
+        if "IPR" in row[x]:
+            if annotation_types is None or "InterPro" in annotation_types:
+                annotations.add_annotation("InterPro", row[x])
+        elif "GO" in row[x]:
+            if annotation_types is None or "GO" in annotation_types:
+                go_entries = row[x].split('|')
+                for go_entry in go_entries:
+                    annotations.add_annotation("GO", go_entry.replace('GO:', ''))
+        elif "KEGG" in row[x]:
+            pathway_entries = row[x].split('|')
+            for pathway_entry in pathway_entries:
+                if "KEGG" in pathway_entry:
+                    database = "KEGG"
+                elif "MetaCyc" in pathway_entry:
+                    database = "MetaCyc"
+                elif "Reactome" in pathway_entry:
+                    database = "Reactome"
+                else:
+                    continue
+                if annotation_types is None or database in annotation_types:
+                    annotations.add_annotation(database, pathway_entry.replace(database + ': ', ''))
+
+
+def filter_rows(rows, row_filter=None):
+    if row_filter is None:
+        return rows
+    return (row for row in rows if row_filter.keep_row(row))
+
+
+class AnnotationPairs:
+    """
+        Collects (database, identifier) tuples, used to store annotations in an InterProScanCache.
+    """
+
+    __slots__ = ('pairs',)
+
+    def __init__(self):
+        self.pairs = set()
+
+    def add_annotation(self, database: str, identifier: str):
+        self.pairs.add((database, identifier))
+
+
+def split_byte_ranges(input_file, chunks: int):
+    """
+        Splits a file into at most chunks byte ranges, each range starts at the beginning of a line.
+    :return: list of (start, end) tuples
+    """
+    file_size = os.path.getsize(input_file)
+    boundaries = [0]
+    with open(input_file, 'rb') as file:
+        for i in range(1, chunks):
+            file.seek(max(file_size * i // chunks, boundaries[-1]))
+            if file.tell() > 0:
+                # Move to the start of the next line, unless we already are at one
+                file.seek(file.tell() - 1)
+                file.readline()
+            boundaries.append(min(file.tell(), file_size))
+    boundaries.append(file_size)
+    return [(start, end) for start, end in zip(boundaries, boundaries[1:]) if end > start]
+
+
+def _read_byte_range(input_file, start: int, end: int):
+    with open(input_file, 'rb') as file:
+        file.seek(start)
+        position = start
+        for line in file:
+            if position >= end:
+                break
+            position += len(line)
+            yield line.decode()
+
+
+def parse_byte_range(args):
+    """
+        Parses the rows within a byte range of an i5 TSV file. Annotations are interned into a vocabulary
+        local to the range, which is sent back together with the ids.
+    :param args: tuple of (input file, start, end, RowFilter or None)
+    :return: tuple of (list of (database, identifier) by annotation id,
+                       dict of sequence accession -> array of annotation ids)
+    """
+    input_file, start, end, row_filter = args
+    annotation_types = row_filter.annotation_types if row_filter else None
+    vocabulary = AnnotationVocabulary()
+    annotations = {}
+    rows = csv.reader(_read_byte_range(input_file, start, end), delimiter="\t", quotechar='"')
+    for row in filter_rows(rows, row_filter):
+        seq_annotations = annotations.get(row[0])
+        if seq_annotations is None:
+            seq_annotations = annotations[row[0]] = AnnotationIds(vocabulary)
+        add_row_annotations(seq_annotations, row, annotation_types)
+    pairs = [(annotation.database, annotation.identifier) for annotation in vocabulary.annotations]
+    return pairs, {seq_id: array('I', seq_annotations.ids) for seq_id, seq_annotations in annotations.items()}
+
+
 class InterProScanTSVResultParser:
     """
         Parses TSV formatted input file and stores mappings between
         sequence accessions and functional annotations.
+
+        Rows and cross reference types can be filtered at parse time by passing a RowFilter.
     """
 
-    def __init__(self, input_tsv_file):
+    def __init__(self, input_tsv_file, row_filter: RowFilter = None):
         self.input_tsv_file = input_tsv_file
+        self.row_filter = row_filter
         self.annotations = {}  # map of sequence accessions and functional annotations
+        self.md5s = {}  # map of sequence accessions and MD5s, populated by parse_file_cached
 
-    def parse_file(self):
-        with open(self.input_tsv_file) as file:
+    @property
+    def _annotation_types(self):
+        return self.row_filter.annotation_types if self.row_filter else None
+
+    def parse_file(self, compact=False):
+        """
+        :param compact: If True, annotations are held in a CompactAnnotationStore instead of a dict of Annotations.
+        """
+        if compact:
+            store = CompactAnnotationStore()
+            for seq_id, annotation_ids in self._iter_sequence_annotations(store.new_annotation_ids):
+                store.add_sequence(seq_id, annotation_ids.ids)
+            self.annotations = store
+            return
+
+        with open_input(self.input_tsv_file) as file:
             rows = csv.reader(file, delimiter="\t", quotechar='"')
-            for row in rows:
+            annotation_types = self._annotation_types
+            for row in filter_rows(rows, self.row_filter):
                 seq_id = row[0]
                 if seq_id not in self.annotations:
                     self.annotations[seq_id] = Annotations()
-                for x in range(11, len(row)):
-                    if "IPR" in row[x]:
-                        self.annotations.get(seq_id).add_annotation("InterPro",
-                                                                    row[x])
-                    elif "GO" in row[x]:
-                        go_entries = row[x].split('|')
-                        for go_entry in go_entries:
-                            self.annotations.get(seq_id). \
-                                add_annotation("GO",
-                                               go_entry.replace('GO:', ''))
-                    elif "KEGG" in row[x]:
-                        pathway_entries = row[x].split('|')
-                        for pathway_entry in pathway_entries:
-                            if "KEGG" in pathway_entry:
-                                self.annotations.get(seq_id).add_annotation(
-                                    "KEGG",
-                                    pathway_entry.replace('KEGG: ', ''))
-                            elif "MetaCyc" in pathway_entry:
-                                self.annotations.get(seq_id).add_annotation(
-                                    "MetaCyc",
-                                    pathway_entry.replace('MetaCyc: ', ''))
-                            elif "Reactome" in pathway_entry:
-                                self.annotations.get(seq_id).add_annotation(
-                                    "Reactome",
-                                    pathway_entry.replace('Reactome: ', ''))
+                add_row_annotations(self.annotations.get(seq_id), row, annotation_types)
+
+    def parse_file_parallel(self, processes=None, chunks=None):
+        """
+            Splits the input file into byte ranges aligned to line boundaries and parses them in a process pool.
+            Annotations are held in a CompactAnnotationStore, rows of a sequence which are split between two
+            ranges are merged.
+
+        :param processes: Number of worker processes, defaults to the number of CPUs
+        :param chunks: Number of byte ranges, defaults to 4 per process
+        """
+        if is_compressed(self.input_tsv_file):
+            logging.info('Byte ranges cannot be mapped into compressed input, parsing {} serially'.format(
+                self.input_tsv_file))
+            self.parse_file(compact=True)
+            return
+        processes = processes or multiprocessing.cpu_count()
+        byte_ranges = split_byte_ranges(self.input_tsv_file, chunks or processes * 4)
+        store = CompactAnnotationStore()
+        with multiprocessing.Pool(processes) as pool:
+            results = pool.imap(parse_byte_range,
+                                [(self.input_tsv_file, start, end, self.row_filter) for start, end in byte_ranges])
+            for pairs, chunk_annotations in results:
+                # Ids of the range vocabulary -> ids of the store vocabulary
+                ids = [store.vocabulary.get_id(database, identifier) for database, identifier in pairs]
+                for seq_id, annotation_ids in chunk_annotations.items():
+                    store.add_sequence(seq_id, [ids[annotation_id] for annotation_id in annotation_ids])
+        self.annotations = store
+
+    def parse_file_cached(self, cache, batch_size=10000):
+        """
+            Loads the annotations of the input file into an InterProScanCache keyed by protein MD5 (column 2).
+            Rows of proteins which are already cached are not parsed. Instead of self.annotations,
+            self.md5s is populated with a map of sequence accessions and MD5s, which can be used with
+            CachedAnnotationMap.
+
+            The cache must have been opened with the row filter of this parser, cached annotations are filtered.
+
+            Assumes the rows of a sequence are consecutive, as written by i5.
+        """
+        if cache.row_filter_fingerprint != get_row_filter_fingerprint(self.row_filter):
+            raise ValueError('The row filter of the cache does not match the row filter of the parser')
+        annotation_types = self._annotation_types
+
+        def load_batch(blocks):
+            cached = cache.contains({md5 for md5, _ in blocks})
+            new_annotations = {}
+            for md5, block_rows in blocks:
+                if md5 in cached:
+                    continue
+                if md5 not in new_annotations:
+                    new_annotations[md5] = AnnotationPairs()
+                for block_row in block_rows:
+                    add_row_annotations(new_annotations[md5], block_row, annotation_types)
+            cache.bulk_insert({md5: annotations.pairs for md5, annotations in new_annotations.items()})
+
+        with open_input(self.input_tsv_file) as file:
+            rows = csv.reader(file, delimiter="\t", quotechar='"')
+            blocks = []  # (md5, rows) of consecutive rows of a sequence
+            current_seq_id = None
+            for row in filter_rows(rows, self.row_filter):
+                if row[0] != current_seq_id:
+                    if len(blocks) >= batch_size:
+                        load_batch(blocks)
+                        blocks = []
+                    current_seq_id = row[0]
+                    self.md5s[sys.intern(current_seq_id)] = row[1]
+                    blocks.append((row[1], []))
+                blocks[-1][1].append(row)
+            load_batch(blocks)
+
+    def iter_sequences(self):
+        """
+            Streams the input file and yields (seq_id, annotations) once all consecutive rows of a
+            sequence have been read. Memory is bounded by a single sequence, self.annotations is not populated.
+
+            i5 writes the rows of a sequence next to each other, if a sequence re-appears later in the file
+            it is yielded again.
+        """
+        return self._iter_sequence_annotations(Annotations)
+
+    def iter_sequence_annotation_ids(self, vocabulary: AnnotationVocabulary):
+        """
+            Same as iter_sequences, but yields (seq_id, set of annotation ids) interned in vocabulary,
+            without creating a FunctionalAnnotation per row.
+        """
+        for seq_id, annotation_ids in self._iter_sequence_annotations(lambda: AnnotationIds(vocabulary)):
+            yield seq_id, annotation_ids.ids
+
+    def _iter_sequence_annotations(self, new_annotations):
+        with open_input(self.input_tsv_file) as file:
+            rows = csv.reader(file, delimiter="\t", quotechar='"')
+            annotation_types = self._annotation_types
+            current_seq_id = None
+            annotations = None
+            for row in filter_rows(rows, self.row_filter):
+                seq_id = row[0]
+                if seq_id != current_seq_id:
+                    if annotations is not None:
+                        yield current_seq_id, annotations
+                    current_seq_id = seq_id
+                    annotations = new_annotations()
+                add_row_annotations(annotations, row, annotation_types)
+            if annotations is not None:
+                yield current_seq_id, annotations
@@ -0,0 +1,278 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# Copyright 2018 EMBL - European Bioinformatics Institute
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+import argparse
+import csv
+import functools
+import logging
+import os
+import pkgutil
+import struct
+import sys
+import zlib
+from array import array
+from collections import namedtuple
+from enum import Enum
+
+from mgnify_util.compression import open_input
+
+__author__ = "Maxim Scheremetjew"
+__version__ = "0.1"
+__status__ = "Development"
+
+CATALOGUE_RESOURCE = 'rfam_catalogue.bin'
+CATALOGUE_MAGIC = b'RFAMCAT1'
+FIELD_SEPARATOR = b'\0'
+
+_base = os.path.dirname(os.path.abspath(__file__))
+_flatfile_decorator = os.path.join(_base, os.pardir, os.pardir, 'ena', 'flatfile_decorator')
+DEFAULT_FAMILY_LOOKUP_FILE = os.path.join(_flatfile_decorator, 'rfam_family_lookup.tsv')
+DEFAULT_MODEL_LENGTHS_FILE = os.path.join(_flatfile_decorator, 'rfam_model_lengths.tsv')
+DEFAULT_QUERY_RESULT_FILE = os.path.join(_base, 'query_result.csv')
+DEFAULT_NC_RNA_CLASSES_FILE = os.path.join(_base, 'ncRNA_classes_map.tsv')
+
+
+class RNAType(Enum):
+    R_RNA = 'rRNA'
+    T_RNA = 'tRNA'
+    M_RNA = 'mRNA'
+    TM_RNA = 'tmRNA'
+    NC_RNA = 'ncRNA'
+    MISC_RNA = 'misc_RNA'
+    SN_RNA = 'snRNA'
+    SRP_RNA = 'ncRNA'
+
+
+RfamFamily = namedtuple('RfamFamily', ['accession', 'name', 'description', 'length', 'rna_type', 'nc_rna_class',
+                                       'rfam_type'])
+
+
+def classify_rna_type(rfam_name, rna_type):
+    """
+        Possible RNA type values are:
+            - Gene;
+            - Gene; rRNA;
+            - Gene; snRNA; splicing;
+            - Cis-reg; riboswitch;
+
+        Ribosomal RNA will go in as rRNA and transfer RNA will go in as tRNA. All remaining will go in as ncRNA.
+
+        Controlled vocabulary for ncRNA classes:
+        http://www.insdc.org/documents/ncrna-vocabulary
+
+    :param rfam_name: Rfam family name, e.g. 5S_rRNA
+    :param rna_type: Rfam type, e.g. Gene; rRNA;
+    :return: tuple of (RNAType, ncRNA class or None)
+    """
+    non_coding_rna_class = None
+    if 'tRNA' in rna_type:
+        rna_type_result = RNAType.T_RNA
+    elif 'rRNA' in rna_type:
+        rna_type_result = RNAType.R_RNA
+    else:
+        rna_type_result = RNAType.NC_RNA
+        if 'antisense' in rna_type:
+            non_coding_rna_class = 'antisense_RNA'
+        elif rna_type.startswith('Intron;'):
+            non_coding_rna_class = 'autocatalytically_spliced_intron'
+        elif 'ribozyme' in rna_type:
+            if 'Hammerhead' in rfam_name:
+                non_coding_rna_class = 'hammerhead_ribozyme'
+            elif 'RNase_MRP' in rfam_name:
+                non_coding_rna_class = 'RNase_MRP_RNA'
+            else:
+                non_coding_rna_class = 'ribozyme'
+        elif 'lncRNA' in rna_type:
+            non_coding_rna_class = 'lncRNA'
+        elif 'RNase' in rfam_name:
+            non_coding_rna_class = 'RNase_P_RNA'
+        elif 'Telomerase' in rfam_name:
+            non_coding_rna_class = 'telomerase_RNA'
+        elif 'miRNA' in rna_type:
+            non_coding_rna_class = 'miRNA'
+        elif rna_type.startswith('Gene; snRNA'):
+            non_coding_rna_class = 'snRNA'
+        elif 'Vault' in rfam_name:
+            non_coding_rna_class = 'vault_RNA'
+        elif 'Y_RNA' in rfam_name:
+            non_coding_rna_class = 'Y_RNA'
+        elif '_SRP' in rfam_name:
+            non_coding_rna_class = 'SRP_RNA'
+        else:
+            non_coding_rna_class = 'other'
+
+    return rna_type_result, non_coding_rna_class
+
+
+def _read_tsv(input_file):
+    with open_input(input_file) as file:
+        return [row for row in csv.reader(file, delimiter='\t') if row]
+
+
+def build_catalogue(family_lookup_file=DEFAULT_FAMILY_LOOKUP_FILE, model_lengths_file=DEFAULT_MODEL_LENGTHS_FILE,
+                    query_result_file=DEFAULT_QUERY_RESULT_FILE, nc_rna_classes_file=DEFAULT_NC_RNA_CLASSES_FILE):
+    """
+        Merges the Rfam text files into one record per family. The family lookup file is the reference, the other
+        files are checked against it.
+
+    :param family_lookup_file: TSV of accession, name, description, Rfam type and model length
+    :param model_lengths_file: optional TSV of accession and model length
+    :param query_result_file: optional CSV of rfam_acc, description and clen
+    :param nc_rna_classes_file: optional TSV of family name and ncRNA class, overrides the derived ncRNA class
+    :return: dict of accession -> RfamFamily
+    """
+    nc_rna_classes = dict(_read_tsv(nc_rna_classes_file)) if nc_rna_classes_file else {}
+
+    families = {}
+    for row in _read_tsv(family_lookup_file):
+        if len(row) != 5:
+            raise ValueError("Unexpected number of chunks: {}".format(len(row)))
+        accession, name, description, rfam_type, length = row
+        rna_type, nc_rna_class = classify_rna_type(name, rfam_type)
+        if rna_type == RNAType.NC_RNA and name in nc_rna_classes:
+            nc_rna_class = nc_rna_classes[name]
+        families[accession] = RfamFamily(accession, name, description, int(length), rna_type.value, nc_rna_class,
+                                         rfam_type)
+
+    other_lengths = []
+    if model_lengths_file:
+        other_lengths.extend((row[0], int(row[1])) for row in _read_tsv(model_lengths_file))
+    if query_result_file:
+        with open_input(query_result_file) as file:
+            rows = csv.reader(file, delimiter=",", quotechar='"')
+            # Skip header line
+            next(rows)
+            other_lengths.extend((row[0], int(row[2])) for row in rows)
+    for accession, length in other_lengths:
+        family = families.get(accession)
+        if family is None:
+            logging.warning('Rfam family {} is missing from {}'.format(accession, family_lookup_file))
+        elif family.length != length:
+            raise ValueError('Conflicting model lengths for {}: {} and {}'.format(accession, family.length, length))
+    return families
+
+
+def write_catalogue(families: dict, output_file):
+    """
+        Binary format: magic, then a zlib compressed payload of the number of families (uint32), the model
+        lengths (uint32, little-endian) and the NUL separated string fields of all families.
+    """
+    entries = [families[accession] for accession in sorted(families)]
+    lengths = array('I', (family.length for family in entries))
+    if sys.byteorder != 'little':
+        lengths.byteswap()
+    strings = FIELD_SEPARATOR.join(
+        FIELD_SEPARATOR.join(field.encode() for field in (family.accession, family.name, family.description,
+                                                          family.rna_type, family.nc_rna_class or '',
+                                                          family.rfam_type))
+        for family in entries)
+    payload = struct.pack('<I', len(entries)) + lengths.tobytes() + strings
+    with open(output_file, 'wb') as out:
+        out.write(CATALOGUE_MAGIC)
+        out.write(zlib.compress(payload, 9))
+
+
+def read_catalogue(data: bytes):
+    """
+    :param data: content of a file written by write_catalogue
+    :return: dict of accession -> RfamFamily
+    """
+    if not data.startswith(CATALOGUE_MAGIC):
+        raise ValueError('Not an Rfam catalogue')
+    payload = zlib.decompress(data[len(CATALOGUE_MAGIC):])
+    count, = struct.unpack_from('<I', payload)
+    lengths = array('I', payload[4:4 + 4 * count])
+    if sys.byteorder != 'little':
+        lengths.byteswap()
+    fields = payload[4 + 4 * count:].decode().split('\0')
+    if len(fields) != 6 * count:
+        raise ValueError('Corrupt Rfam catalogue')
+    families = {}
+    for i, length in enumerate(lengths):
+        accession, name, description, rna_type, nc_rna_class, rfam_type = fields[6 * i:6 * i + 6]
+        families[accession] = RfamFamily(accession, name, description, length, rna_type, nc_rna_class or None,
+                                         rfam_type)
+    return families
+
+
+class RfamCatalogue:
+    """
+        Rfam families by accession and by name.
+
+        Example:
+            catalogue = load_catalogue()
+            catalogue.get('RF00001').length
+    """
+
+    def __init__(self, families: dict):
+        self.families = families
+        self._by_name = {family.name: family for family in families.values()}
+
+    def __contains__(self, accession):
+        return accession in self.families
+
+    def __len__(self):
+        return len(self.families)
+
+    def __iter__(self):
+        return iter(self.families.values())
+
+    def get(self, accession: str):
+        return self.families.get(accession)
+
+    def get_by_name(self, name: str):
+        return self._by_name.get(name)
+
+    def get_rna_type(self, accession: str):
+        family = self.families.get(accession)
+        return RNAType(family.rna_type) if family else None
+
+
+@functools.lru_cache(maxsize=None)
+def load_catalogue():
+    """
+        Loads the catalogue shipped with the package, once per process.
+    :return: RfamCatalogue
+    """
+    data = pkgutil.get_data(__package__, CATALOGUE_RESOURCE)
+    if data is None:
+        raise IOError('Package resource {} not found'.format(CATALOGUE_RESOURCE))
+    return RfamCatalogue(read_catalogue(data))
+
+
+def parse_args(args):
+    parser = argparse.ArgumentParser(description='Tool to rebuild the Rfam catalogue shipped with the package')
+    parser.add_argument('--family-lookup-file', default=DEFAULT_FAMILY_LOOKUP_FILE,
+                        help='TSV of accession, name, description, Rfam type and model length')
+    parser.add_argument('--model-lengths-file', default=DEFAULT_MODEL_LENGTHS_FILE)
+    parser.add_argument('--query-result-file', default=DEFAULT_QUERY_RESULT_FILE)
+    parser.add_argument('--nc-rna-classes-file', default=DEFAULT_NC_RNA_CLASSES_FILE)
+    parser.add_argument('-o', '--output-file', default=os.path.join(_base, CATALOGUE_RESOURCE))
+    return parser.parse_args(args)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO)
+
+    families = build_catalogue(args.family_lookup_file, args.model_lengths_file, args.query_result_file,
+                               args.nc_rna_classes_file)
+    write_catalogue(families, args.output_file)
+    logging.info('Wrote {} Rfam families to {}'.format(len(families), args.output_file))
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
@@ -0,0 +1,240 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# Copyright 2018 EMBL - European Bioinformatics Institute
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+import argparse
+import logging
+import os
+import sys
+from collections import namedtuple
+
+import numpy
+
+from mgnify_util.parser.cmsearch_deoverlap_parser import DeoverlapResultParser
+from mgnify_util.parser.rfam_catalogue import load_catalogue
+
+__author__ = "Maxim Scheremetjew"
+__version__ = "0.1"
+__status__ = "Development"
+
+DEFAULT_COVERAGE_THRESHOLDS = (0.9,)
+DEFAULT_MISSING_THRESHOLDS = (5,)
+LEVELS = ('sample', 'family', 'rna_type')
+
+GroupStatistics = namedtuple('GroupStatistics', ['matches', 'mean_coverage', 'complete', 'partial', 'ends_complete',
+                                                 'ends_partial'])
+
+
+def count_at_least(sorted_values, thresholds):
+    """
+    :param sorted_values: values in ascending order
+    :return: dict of threshold -> number of values >= threshold
+    """
+    return {threshold: len(sorted_values) - int(numpy.searchsorted(sorted_values, threshold, 'left'))
+            for threshold in thresholds}
+
+
+def count_at_most(sorted_values, thresholds):
+    """
+    :param sorted_values: values in ascending order
+    :return: dict of threshold -> number of values <= threshold
+    """
+    return {threshold: int(numpy.searchsorted(sorted_values, threshold, 'right')) for threshold in thresholds}
+
+
+def get_model_lengths(columns, catalogue=None):
+    """
+    :param columns: CMSearchMatchColumns
+    :return: NumPy array of the model length of each match, 0 if the Rfam family is unknown
+    """
+    catalogue = catalogue or load_catalogue()
+    lengths = numpy.array([family.length if family else 0
+                           for family in (catalogue.get(accession) for accession in columns.rfam_accessions.values)]
+                          or [0], dtype=numpy.int64)
+    return lengths[columns.to_numpy()['rfam'].astype(numpy.int64)]
+
+
+def match_coverage(columns, catalogue=None):
+    """
+        Computes per match statistics over the columns.
+
+    :param columns: CMSearchMatchColumns
+    :return: tuple of NumPy arrays (coverage fraction, missing model positions at the start, missing model
+             positions at the end), the coverage fraction is NaN and the missing positions are -1 for unknown Rfam
+             families.
+    """
+    lengths = get_model_lengths(columns, catalogue)
+    model_columns = columns.to_numpy()
+    model_from = model_columns['model_from'].astype(numpy.int64)
+    model_to = model_columns['model_to'].astype(numpy.int64)
+    known = lengths > 0
+    coverage = numpy.full(len(lengths), numpy.nan)
+    coverage[known] = (model_to[known] - model_from[known] + 1) / lengths[known]
+    return coverage, numpy.where(known, model_from - 1, -1), numpy.where(known, lengths - model_to, -1)
+
+
+def end_completeness_flags(columns, max_missing=DEFAULT_MISSING_THRESHOLDS[0], catalogue=None):
+    """
+    :return: tuple of arrays (start complete, end complete) with 1 if at most max_missing model positions are
+             missing at that end of the match, 0 otherwise or if the Rfam family is unknown
+    """
+    _, missing_start, missing_end = match_coverage(columns, catalogue)
+    return (((missing_start >= 0) & (missing_start <= max_missing)).astype(numpy.int8),
+            ((missing_end >= 0) & (missing_end <= max_missing)).astype(numpy.int8))
+
+
+def summarise(coverages, max_missing, coverage_thresholds=DEFAULT_COVERAGE_THRESHOLDS,
+              missing_thresholds=DEFAULT_MISSING_THRESHOLDS):
+    """
+        Summarises a group of matches for all thresholds at once, the values are sorted once and each threshold
+        is a binary search.
+
+    :param coverages: coverage fraction of each match
+    :param max_missing: largest number of missing model positions at either end of each match
+    :return: GroupStatistics
+    """
+    coverages = numpy.sort(coverages)
+    max_missing = numpy.sort(max_missing)
+    total_coverage = float(coverages.sum())
+    n = len(coverages)
+    complete = count_at_least(coverages, coverage_thresholds)
+    ends_complete = count_at_most(max_missing, missing_thresholds)
+    return GroupStatistics(n,
+                           total_coverage / n if n else 0.0,
+                           complete,
+                           {threshold: n - count for threshold, count in complete.items()},
+                           ends_complete,
+                           {threshold: n - count for threshold, count in ends_complete.items()})
+
+
+def _add_group_values(groups, sample, columns, rna_types, coverage, missing_start, missing_end):
+    """
+        Adds the coverage and largest number of missing positions of the matches of one sample to their
+        groups, one array per group and sample.
+    :return: number of matches of unknown Rfam families
+    """
+    rna_type_names = sorted({rna_type for rna_type in rna_types if rna_type is not None})
+    rna_type_codes = numpy.array([rna_type_names.index(rna_type) if rna_type is not None else -1
+                                  for rna_type in rna_types] or [-1], dtype=numpy.int64)
+    rfam = columns.to_numpy()['rfam'].astype(numpy.int64)
+    known = rna_type_codes[rfam] >= 0
+    coverage = coverage[known]
+    missing = numpy.maximum(missing_start, missing_end)[known]
+    rfam = rfam[known]
+
+    def add(level, group, selection):
+        values = groups[level].setdefault(group, ([], []))
+        values[0].append(coverage[selection])
+        values[1].append(missing[selection])
+
+    if len(rfam):
+        add('sample', sample, slice(None))
+    for level, codes, names in (('family', rfam, columns.rfam_accessions.values),
+                                ('rna_type', rna_type_codes[rfam], rna_type_names)):
+        order = numpy.argsort(codes, kind='stable')
+        for selection in numpy.split(order, numpy.flatnonzero(numpy.diff(codes[order])) + 1):
+            if len(selection):
+                add(level, names[codes[selection[0]]], selection)
+    return int(len(known) - known.sum())
+
+
+def compute_statistics(samples: dict, coverage_thresholds=DEFAULT_COVERAGE_THRESHOLDS,
+                       missing_thresholds=DEFAULT_MISSING_THRESHOLDS, catalogue=None):
+    """
+        Computes model coverage and end completeness of the cmsearch matches of many samples, broken down per
+        sample, Rfam family and RNA type. Matches of unknown Rfam families are left out.
+
+        Example:
+            samples = {'ERR1': DeoverlapResultParser('ERR1.tbl.deoverlapped').parse_file_columnar()}
+            statistics = compute_statistics(samples, coverage_thresholds=(0.5, 0.9), missing_thresholds=(0, 5))
+            statistics['rna_type']['rRNA'].complete[0.9]
+
+    :param samples: dict of sample name -> CMSearchMatchColumns
+    :param coverage_thresholds: a match is complete if it covers at least this fraction of the model
+    :param missing_thresholds: a match has complete ends if at most this number of model positions are missing at
+                               either end
+    :return: dict of level (sample, family or rna_type) -> dict of group -> GroupStatistics
+    """
+    catalogue = catalogue or load_catalogue()
+    groups = {level: {} for level in LEVELS}  # level -> group -> (coverage arrays, max missing arrays)
+    for sample, columns in samples.items():
+        coverage, missing_start, missing_end = match_coverage(columns, catalogue)
+        rna_types = [family.rna_type if family else None
+                     for family in (catalogue.get(accession) for accession in columns.rfam_accessions.values)]
+        unknown = _add_group_values(groups, sample, columns, rna_types, coverage, missing_start, missing_end)
+        if unknown:
+            logging.warning('Skipped {} matches of unknown Rfam families in {}'.format(unknown, sample))
+
+    return {level: {group: summarise(numpy.concatenate(coverages), numpy.concatenate(max_missing),
+                                     coverage_thresholds, missing_thresholds)
+                    for group, (coverages, max_missing) in level_groups.items()}
+            for level, level_groups in groups.items()}
+
+
+def get_sample_name(input_file):
+    name = os.path.basename(input_file)
+    for suffix in ['.gz', '.bgz', '.zst', '.deoverlapped', '.tbl', '.tblout']:
+        if name.endswith(suffix):
+            name = name[:-len(suffix)]
+    return name
+
+
+def write_statistics(output_file, statistics, coverage_thresholds=DEFAULT_COVERAGE_THRESHOLDS,
+                     missing_thresholds=DEFAULT_MISSING_THRESHOLDS):
+    with open(output_file, 'w') as out:
+        header = ['level', 'group', 'matches', 'mean_coverage']
+        header.extend('{}_coverage_{}'.format(status, threshold) for threshold in coverage_thresholds
+                      for status in ('complete', 'partial'))
+        header.extend('{}_ends_{}'.format(status, threshold) for threshold in missing_thresholds
+                      for status in ('complete', 'partial'))
+        out.write('\t'.join(header) + '\n')
+        for level in LEVELS:
+            for group, stats in sorted(statistics[level].items()):
+                row = [level, group, stats.matches, '{:.4f}'.format(stats.mean_coverage)]
+                for threshold in coverage_thresholds:
+                    row.extend((stats.complete[threshold], stats.partial[threshold]))
+                for threshold in missing_thresholds:
+                    row.extend((stats.ends_complete[threshold], stats.ends_partial[threshold]))
+                out.write('\t'.join(str(value) for value in row) + '\n')
+
+
+def parse_args(args):
+    parser = argparse.ArgumentParser(
+        description='Tool to compute Rfam model coverage and completeness statistics of cmsearch matches')
+    parser.add_argument('deoverlap_files', nargs='+', help='CMSearch deoverlap outputs, one per sample')
+    parser.add_argument('-o', '--output-file', required=True, help='TSV report')
+    parser.add_argument('-c', '--coverage-thresholds', type=float, nargs='+', default=DEFAULT_COVERAGE_THRESHOLDS,
+                        help='Minimum model coverage of complete matches')
+    parser.add_argument('-m', '--missing-thresholds', type=int, nargs='+', default=DEFAULT_MISSING_THRESHOLDS,
+                        help='Maximum number of missing model positions at the ends of complete matches')
+    parser.add_argument('-v', '--verbose', action='store_true')
+    return parser.parse_args(args)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+
+    logging.basicConfig(level=logging.DEBUG if args.verbose else logging.INFO)
+
+    names = [get_sample_name(input_file) for input_file in args.deoverlap_files]
+    if len(set(names)) != len(names):
+        names = args.deoverlap_files
+    samples = {name: DeoverlapResultParser(input_file).parse_file_columnar()
+               for name, input_file in zip(names, args.deoverlap_files)}
+    statistics = compute_statistics(samples, args.coverage_thresholds, args.missing_thresholds)
+    write_statistics(args.output_file, statistics, args.coverage_thresholds, args.missing_thresholds)
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
@@ -26,11 +26,20 @@ setup(
     version=version,
     packages=['mgnify_backlog', 'mgnify_util', 'mgnify_util.parser', 'ena.flatfile_decorator'],
     install_requires=install_requirements,
+    extras_require={'zstd': ['zstandard>=0.15']},
     include_package_data=True,
+    package_data={'mgnify_util.parser': ['rfam_catalogue.bin']},
     install_requirements=['emg-backlog-schema>=0.12.3'],
     entry_points={
         'console_scripts': [
-            'flatfile_decorator=ena.flatfile_decorator.flatfile_decorator:main'
+            'flatfile_decorator=ena.flatfile_decorator.flatfile_decorator:main',
+            'backlog_job_state=mgnify_backlog.job_state_cli:main',
+            'backlog_study_summary=mgnify_backlog.study_summary_cli:main',
+            'ingest_studies=mgnify_backlog.study_ingestion:main',
+            'index_interproscan_tsv=mgnify_util.parser.interproscan_index:main',
+            'i5_abundance_matrix=mgnify_util.parser.abundance_matrix:main',
+            'cmsearch_deoverlap=mgnify_util.parser.cmsearch_deoverlap:main',
+            'rfam_coverage_stats=mgnify_util.parser.rfam_statistics:main'
         ],
     },
     tests_require=test_requirements,
@@ -0,0 +1,46 @@
+import shutil
+
+from mgnify_util.parser import abundance_matrix
+from mgnify_util.parser.interproscan_parser import InterProScanTSVResultParser
+
+from tests.test_interproscan_parser import I5_ANNOTATIONS
+
+
+class TestAbundanceMatrix(object):
+    def test_count_annotations_should_count_sequences_per_term(self):
+        parser = InterProScanTSVResultParser(I5_ANNOTATIONS)
+        parser.parse_file()
+        expected = {}
+        for annotations in parser.annotations.values():
+            for annotation in annotations.get_all_annotations():
+                key = (annotation.database, annotation.identifier)
+                expected[key] = expected.get(key, 0) + 1
+
+        counts = abundance_matrix.count_annotations(I5_ANNOTATIONS)
+        assert {(database, term): count for database, terms in counts.items()
+                for term, count in terms.items()} == expected
+
+    def test_main_should_write_matrix_market_files(self, tmpdir):
+        sample_a = str(tmpdir.join('sample_a.tsv'))
+        sample_b = str(tmpdir.join('sample_b.tsv'))
+        shutil.copy(I5_ANNOTATIONS, sample_a)
+        with open(I5_ANNOTATIONS) as f_in, open(sample_b, 'w') as f_out:
+            f_out.write(f_in.readline())
+        prefix = str(tmpdir.join('matrix'))
+
+        abundance_matrix.main([sample_a, sample_b, '-o', prefix, '-p', '2'])
+
+        with open(prefix + '.samples.tsv') as f:
+            assert f.read().split() == ['sample_a', 'sample_b']
+        with open(prefix + '.InterPro.terms.tsv') as f:
+            terms = f.read().split()
+        with open(prefix + '.InterPro.mtx') as f:
+            lines = f.read().splitlines()
+        assert lines[0] == '%%MatrixMarket matrix coordinate integer general'
+        n_rows, n_columns, nnz = map(int, lines[1].split())
+        assert (n_rows, n_columns, nnz) == (len(terms), 2, len(lines) - 2)
+        counts = abundance_matrix.count_annotations(I5_ANNOTATIONS)['InterPro']
+        for line in lines[2:]:
+            row, column, value = map(int, line.split())
+            if column == 1:
+                assert counts[terms[row - 1]] == value
@@ -0,0 +1,60 @@
+from mgnify_util import accession_parsers
+
+
+class TestAccessionParsers(object):
+    def test_classify_accessions_should_bucket_accessions_by_type(self):
+        accessions = ['PRJEB1787', 'ERP001736', 'ERR164407', 'SRR1234567', 'ERZ795049', 'SAMN05720147',
+                      'SRS1687472', 'foo']
+        buckets = accession_parsers.classify_accessions(accessions)
+        assert buckets == {
+            'primary_study': ['PRJEB1787'],
+            'secondary_study': ['ERP001736'],
+            'run': ['ERR164407', 'SRR1234567'],
+            'assembly': ['ERZ795049'],
+            'sample': ['SAMN05720147', 'SRS1687472'],
+            'unknown': ['foo']
+        }
+
+    def test_classify_accessions_should_deduplicate_and_strip_accessions(self):
+        buckets = accession_parsers.classify_accessions(['ERR164407\n', ' ERR164407', 'ERR164408'])
+        assert buckets['run'] == ['ERR164407', 'ERR164408']
+
+    def test_classify_accessions_should_not_match_partial_accessions(self):
+        buckets = accession_parsers.classify_accessions(['|RR164407', 'ERR164407_1', 'ERR12'])
+        assert buckets['run'] == []
+        assert len(buckets['unknown']) == 3
+
+    def test_is_run_accession_should_not_match_pipe(self):
+        assert accession_parsers.is_run_accession('ERR164407')
+        assert not accession_parsers.is_run_accession('|RR164407')
+
+    def test_parse_alias_runs_should_parse_single_and_delimited_runs(self):
+        assert accession_parsers.parse_alias_runs('ERR164407') == ['ERR164407']
+        assert accession_parsers.parse_alias_runs('ERR164407_ERR164408') == ['ERR164407', 'ERR164408']
+        assert accession_parsers.parse_alias_runs('SRR1234567,SRR1234568;SRR1234567') == ['SRR1234567',
+                                                                                          'SRR1234568']
+
+    def test_parse_alias_runs_should_expand_ranges(self):
+        expected = ['ERR164407', 'ERR164408', 'ERR164409']
+        assert accession_parsers.parse_alias_runs('ERR164407-ERR164409') == expected
+        assert accession_parsers.parse_alias_runs('ERR164407-164409') == expected
+        assert accession_parsers.parse_alias_runs('ERR164407-ERR164407') == ['ERR164407']
+
+    def test_parse_alias_runs_should_not_treat_other_suffixes_as_range_end(self):
+        assert accession_parsers.parse_alias_runs('SRR5678901-2') == ['SRR5678901']
+        assert accession_parsers.parse_alias_runs('ERR164407-09') == ['ERR164407']
+        assert accession_parsers.parse_alias_runs('ERR164407-20190101') == ['ERR164407']
+
+    def test_parse_alias_runs_should_skip_invalid_ranges(self):
+        assert accession_parsers.parse_alias_runs('ERR164409-ERR164407') == ['ERR164409']
+        assert accession_parsers.parse_alias_runs('ERR164407-SRR164409') == ['ERR164407']
+        assert accession_parsers.parse_alias_runs('ERR164407-ERR164409', max_range=2) == ['ERR164407']
+
+    def test_parse_alias_runs_should_ignore_aliases_not_starting_with_run(self):
+        assert accession_parsers.parse_alias_runs('assembly of ERR164407') == []
+        assert accession_parsers.parse_alias_runs('') == []
+
+    def test_resolve_assembly_aliases_should_map_assemblies_to_runs(self):
+        assemblies = [{'analysis_accession': 'ERZ795049', 'analysis_alias': 'ERR164407_ERR164408'},
+                      {'analysis_accession': 'ERZ795050', 'analysis_alias': 'activated sludge'}]
+        assert accession_parsers.resolve_assembly_aliases(assemblies) == {'ERZ795049': ['ERR164407', 'ERR164408']}
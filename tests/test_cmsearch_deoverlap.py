@@ -0,0 +1,107 @@
+import random
+
+from mgnify_util.parser.cmsearch_deoverlap import IntervalUnion, deoverlap, deoverlap_file, \
+    deoverlap_sequence_hits, iter_sequence_lines
+from mgnify_util.parser.cmsearch_deoverlap_parser import DeoverlapResultParser
+from tests.test_cmsearch_deoverlap_parser import DEOVERLAPPED_FILE
+
+LINE = '{seq} - {model} {rfam} hmm 1 100 {start} {end} {strand} - 6 0.50 0.0 {score} {evalue} ? -\n'
+
+
+def make_line(seq='seq1', model='5S_rRNA', rfam='RF00001', start=1, end=100, strand='+', score=50.0, evalue=1e-5):
+    return LINE.format(seq=seq, model=model, rfam=rfam, start=start, end=end, strand=strand, score=score,
+                       evalue=evalue)
+
+
+def read_lines(filename):
+    with open(filename) as file:
+        return file.readlines()
+
+
+class TestIntervalUnion(object):
+
+    def test_should_merge_overlapping_intervals(self):
+        union = IntervalUnion()
+        union.add(10, 20)
+        union.add(30, 40)
+        assert not union.overlaps(21, 29)
+        union.add(15, 35)
+        assert union.starts == [10] and union.ends == [40]
+        assert union.overlaps(40, 50)
+        assert not union.overlaps(41, 50)
+
+
+class TestDeoverlap(object):
+
+    def test_should_remove_lower_scoring_overlapping_hit(self):
+        best = make_line(start=1, end=100, score=80.0)
+        worse = make_line(start=90, end=200, score=40.0)
+        assert deoverlap_sequence_hits([worse, best]) == [best]
+
+    def test_should_keep_overlapping_hits_on_opposite_strands(self):
+        forward = make_line(start=1, end=100, score=80.0)
+        reverse = make_line(start=150, end=50, strand='-', score=40.0)
+        assert deoverlap_sequence_hits([reverse, forward]) == [forward, reverse]
+
+    def test_should_compare_with_removed_hits_unless_max_keep(self):
+        first = make_line(start=1, end=100, score=80.0)
+        second = make_line(start=90, end=200, score=60.0)
+        third = make_line(start=150, end=300, score=40.0)
+        assert deoverlap_sequence_hits([first, second, third]) == [first]
+        assert deoverlap_sequence_hits([first, second, third], max_keep=True) == [first, third]
+
+    def test_should_only_compare_hits_within_clans(self):
+        clans = {'SSU_rRNA_bacteria': 'CL00111', 'SSU_rRNA_archaea': 'CL00111'}
+        bacteria = make_line(model='SSU_rRNA_bacteria', rfam='RF00177', score=80.0)
+        archaea = make_line(model='SSU_rRNA_archaea', rfam='RF01959', score=60.0)
+        other = make_line(model='5S_rRNA', rfam='RF00001', score=40.0)
+        assert deoverlap_sequence_hits([other, archaea, bacteria], clans) == [bacteria, other]
+
+    def test_should_group_unsorted_input_by_sequence(self):
+        lines = ['# comment\n', make_line(seq='b'), make_line(seq='a'), make_line(seq='b', start=500, end=600)]
+        assert [(seq_id, len(group)) for seq_id, group in iter_sequence_lines(lines)] == [('a', 1), ('b', 2)]
+
+    def test_should_sort_unsorted_input_in_runs(self, tmpdir):
+        lines = [make_line(seq=seq, start=start, end=start + 50) for start, seq in enumerate('cabcbaacb')]
+        expected = list(iter_sequence_lines(lines))
+        grouped = list(iter_sequence_lines(lines, buffer_lines=2, temp_dir=str(tmpdir)))
+        assert grouped == expected
+        assert [seq_id for seq_id, _ in grouped] == ['a', 'b', 'c']
+        # Lines of a sequence keep their input order
+        assert grouped[0][1] == [line for line in lines if line.startswith('a ')]
+        assert tmpdir.listdir() == []
+
+    def test_presorted_input_should_be_grouped(self):
+        lines = [make_line(seq='a'), make_line(seq='b'), make_line(seq='a', start=500, end=600)]
+        try:
+            list(iter_sequence_lines(lines, presorted=True))
+            assert False
+        except ValueError:
+            pass
+
+    def test_should_reproduce_deoverlapped_file(self, tmpdir):
+        expected = read_lines(DEOVERLAPPED_FILE)
+        lines = list(expected)
+        # Lower scoring hits overlapping hits of the deoverlapped file on the same strand
+        for line in expected[:100:5]:
+            row = line.split()
+            lines.append(make_line(seq=row[0], start=row[7], end=row[8], strand=row[9], score=1.0, evalue=10))
+        random.Random(1).shuffle(lines)
+        tblout = tmpdir.join('matches.tbl')
+        tblout.write(''.join(lines))
+
+        output_file, total, kept = deoverlap_file(str(tblout))
+        assert output_file == str(tblout) + '.deoverlapped'
+        assert (total, kept) == (len(lines), len(expected))
+        assert read_lines(output_file) == expected
+        assert list(deoverlap(expected, presorted=True)) == expected
+
+        deoverlap_file(str(tblout), str(tmpdir.join('spilled.tbl')), buffer_lines=100)
+        assert read_lines(str(tmpdir.join('spilled.tbl'))) == expected
+
+    def test_parser_should_deoverlap_raw_tblout(self, tmpdir):
+        tblout = tmpdir.join('matches.tbl')
+        tblout.write(''.join(read_lines(DEOVERLAPPED_FILE) + [make_line(seq='TRINITY-DN11055-c0-g1-i1', start=30,
+                                                                               end=100, score=1.0)]))
+        columns = DeoverlapResultParser(str(tblout)).parse_file_columnar(deoverlap_hits=True)
+        assert len(columns) == len(DeoverlapResultParser(DEOVERLAPPED_FILE).parse_file_columnar())
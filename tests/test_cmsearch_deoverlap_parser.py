@@ -0,0 +1,137 @@
+import gzip
+import os
+import threading
+
+import pytest
+
+from mgnify_util.parser import cmsearch_deoverlap_parser
+from mgnify_util.parser.cmsearch_deoverlap_parser import DeoverlapResultParser, RfamEntriesFileParser
+
+DEOVERLAPPED_FILE = os.path.join(os.path.dirname(__file__), os.pardir, 'ena', 'flatfile_decorator', 'test-inputs',
+                                 'cat_cmsearch_matches.tbl.deoverlapped')
+
+
+class TestDeoverlapResultParser(object):
+
+    def test_parse_file_should_store_integer_coordinates(self):
+        parser = DeoverlapResultParser(DEOVERLAPPED_FILE)
+        parser.parse_file()
+        matches = parser._annotations['TRINITY-DN27474-c9-g2-i5'].get_all_annotations()
+        assert len(matches) == 5
+        assert all(isinstance(match.start, int) and match.start <= match.end for match in matches)
+
+    def test_parse_file_columnar_should_match_object_parser(self):
+        parser = DeoverlapResultParser(DEOVERLAPPED_FILE)
+        parser.parse_file()
+        columns = DeoverlapResultParser(DEOVERLAPPED_FILE).parse_file_columnar()
+        assert len(columns) == 256
+        assert len(columns.sequences) == len(parser._annotations)
+        for seq_id, annotations in parser._annotations.items():
+            expected = {(match.rfam_acc, match.start, match.end, match.forward_strand)
+                        for match in annotations.get_all_annotations()}
+            actual = {(match.rfam_acc, match.start, match.end, match.forward_strand)
+                      for match in columns.get_sequence_matches(seq_id)}
+            assert actual == expected
+
+    def test_columnar_matches_should_be_grouped_by_sequence(self):
+        columns = DeoverlapResultParser(DEOVERLAPPED_FILE).parse_file_columnar()
+        lo, hi = columns.get_sequence_slice('TRINITY-DN27474-c9-g2-i5')
+        assert hi - lo == 5
+        views = columns.columns(lo, hi)
+        assert set(views['seq']) == {columns.sequences.find_id('TRINITY-DN27474-c9-g2-i5')}
+        assert views['score'].format == 'd'
+        assert columns.get_sequence_slice('unknown') == (0, 0)
+
+    def test_columnar_should_swap_coordinates_on_reverse_strand(self):
+        columns = DeoverlapResultParser(DEOVERLAPPED_FILE).parse_file_columnar()
+        assert -1 in columns.strand
+        assert all(start <= end for start, end in zip(columns.start, columns.end))
+
+
+def write_shards(tmpdir, lines, n_shards, compress_first=False):
+    shards = [[] for _ in range(n_shards)]
+    for i, line in enumerate(lines):
+        shards[i % n_shards].append(line)
+    shard_files = []
+    for i, shard in enumerate(shards):
+        shard_file = tmpdir.join('chunk_{}.tbl{}'.format(i, '.gz' if compress_first and i == 0 else ''))
+        if compress_first and i == 0:
+            with gzip.open(str(shard_file), 'wt') as out:
+                out.writelines(shard)
+        else:
+            shard_file.write(''.join(shard))
+        shard_files.append(str(shard_file))
+    return shard_files
+
+
+def get_match_keys(annotations):
+    return {(match.rfam_acc, match.start, match.end, match.forward_strand)
+            for match in annotations.get_all_annotations()}
+
+
+class TestMergeFiles(object):
+
+    def _get_expected(self):
+        parser = DeoverlapResultParser(DEOVERLAPPED_FILE)
+        parser.parse_file()
+        return {seq_id: get_match_keys(annotations) for seq_id, annotations in parser._annotations.items()}
+
+    def test_should_merge_shards_by_sequence(self, tmpdir):
+        with open(DEOVERLAPPED_FILE) as file:
+            lines = file.readlines()
+        # Matches of a sequence are spread over several shards
+        shard_files = write_shards(tmpdir, lines[::-1], 7, compress_first=True)
+        merged = list(DeoverlapResultParser.merge_files(shard_files))
+        seq_ids = [seq_id for seq_id, _ in merged]
+        assert seq_ids == sorted(set(seq_ids))
+        assert {seq_id: get_match_keys(annotations) for seq_id, annotations in merged} == self._get_expected()
+
+    def test_should_cap_concurrent_readers(self, tmpdir, monkeypatch):
+        with open(DEOVERLAPPED_FILE) as file:
+            lines = file.readlines()
+        shard_files = write_shards(tmpdir, lines[::-1], 12)
+        expected = self._get_expected()
+        reader_threads = set()
+        open_input = cmsearch_deoverlap_parser.open_input
+
+        def recording_open_input(input_file):
+            reader_threads.add(threading.current_thread())
+            return open_input(input_file)
+
+        monkeypatch.setattr(cmsearch_deoverlap_parser, 'open_input', recording_open_input)
+        merged = DeoverlapResultParser.merge_files(shard_files, max_groups=4, max_readers=3, buffer_lines=10)
+        assert {seq_id: get_match_keys(annotations) for seq_id, annotations in merged} == expected
+        assert 0 < len(reader_threads) <= 3
+        assert threading.current_thread() not in reader_threads
+
+    def test_should_stream_presorted_shards(self, tmpdir):
+        with open(DEOVERLAPPED_FILE) as file:
+            lines = file.readlines()
+        shard_files = write_shards(tmpdir, lines, 3)
+        rfam_parser = RfamEntriesFileParser()
+        rfam_parser.parse_file()
+        merged = dict(DeoverlapResultParser.merge_files(shard_files, rfam_parser=rfam_parser, presorted=True))
+        assert {seq_id: get_match_keys(annotations) for seq_id, annotations in merged.items()} == \
+            self._get_expected()
+        match = next(iter(merged['TRINITY-DN1606-c0-g1-i1'].get_all_annotations()))
+        assert match.description == 'Bacterial large subunit ribosomal RNA'
+
+    def test_should_deoverlap_merged_groups(self, tmpdir):
+        with open(DEOVERLAPPED_FILE) as file:
+            lines = file.readlines()
+        # A lower scoring overlapping hit in another shard
+        row = next(line for line in lines if line.startswith('TRINITY-DN1606-c0-g1-i1 ')).split()
+        extra = tmpdir.join('extra.tbl')
+        extra.write(' '.join(row[:7] + ['150', '10'] + row[9:14] + ['1.0', '10', '!', '-']) + '\n')
+        input_files = [DEOVERLAPPED_FILE, str(extra)]
+        merged = dict(DeoverlapResultParser.merge_files(input_files))
+        assert len(merged[row[0]].get_all_annotations()) == 2
+        merged = dict(DeoverlapResultParser.merge_files(input_files, deoverlap_hits=True))
+        assert len(merged[row[0]].get_all_annotations()) == 1
+
+    def test_presorted_should_reject_unsorted_shard(self, tmpdir):
+        with open(DEOVERLAPPED_FILE) as file:
+            lines = file.readlines()
+        shard_files = write_shards(tmpdir, lines[::-1], 2)
+        with pytest.raises(ValueError):
+            list(DeoverlapResultParser.merge_files(shard_files, presorted=True))
@@ -0,0 +1,39 @@
+import gzip
+
+import pytest
+
+from mgnify_util.parser.cmsearch_tblout import TBLOUT_COLUMNS, read_tblout, read_tblout_file
+from tests.test_cmsearch_deoverlap_parser import DEOVERLAPPED_FILE
+
+LINE = 'seq1 - 5S_rRNA RF00001 cm 1 119 501 383 - no 1 0.55 0.1 85.3 2.1e-18 ! Escherichia coli 5S\n'
+
+
+class TestReadTblout(object):
+
+    def test_should_return_all_columns_converted(self):
+        row, = read_tblout(['#target name\n', LINE])
+        assert len(row) == len(TBLOUT_COLUMNS)
+        assert row[:5] == ('seq1', '-', '5S_rRNA', 'RF00001', 'cm')
+        assert row[5:9] == (1, 119, 501, 383)
+        assert row[14:] == (85.3, 2.1e-18, '!', 'Escherichia coli 5S')
+
+    def test_should_project_columns(self):
+        assert list(read_tblout([LINE], ('query_accession', 'seq_to'))) == [('RF00001', 383)]
+        assert list(read_tblout([LINE], ('strand',))) == [('-',)]
+
+    def test_should_skip_unincluded_hits(self):
+        assert list(read_tblout([LINE.replace(' ! ', ' ? ')], ('target_name',), included_only=True)) == []
+
+    def test_should_reject_bad_input(self):
+        with pytest.raises(ValueError):
+            list(read_tblout(['seq1 - 5S_rRNA RF00001\n']))
+        with pytest.raises(ValueError):
+            list(read_tblout([LINE], ('unknown',)))
+
+    def test_should_read_compressed_file(self, tmpdir):
+        compressed = tmpdir.join('matches.tbl.gz')
+        with open(DEOVERLAPPED_FILE, 'rb') as file, gzip.open(str(compressed), 'wb') as out:
+            out.write(file.read())
+        rows = list(read_tblout_file(str(compressed), ('target_name', 'inc')))
+        assert len(rows) == 550
+        assert len(list(read_tblout_file(DEOVERLAPPED_FILE, included_only=True))) == 256
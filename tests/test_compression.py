@@ -0,0 +1,78 @@
+import gzip
+import struct
+import zlib
+
+import pytest
+
+from mgnify_util import compression
+
+CONTENT = ''.join('seq{}\tIPR{:06d}\n'.format(i, i) for i in range(20000))
+
+
+def write_bgzip(filename, data, block_size=4096):
+    with open(filename, 'wb') as f:
+        for i in range(0, len(data) + 1, block_size):
+            block = data[i:i + block_size]
+            compressor = zlib.compressobj(6, zlib.DEFLATED, -zlib.MAX_WBITS)
+            deflated = compressor.compress(block) + compressor.flush()
+            bsize = 18 + len(deflated) + 8 - 1
+            f.write(b'\x1f\x8b\x08\x04' + b'\x00' * 4 + b'\x00\xff' + struct.pack('<H', 6) +
+                    b'BC' + struct.pack('<HH', 2, bsize))
+            f.write(deflated)
+            f.write(struct.pack('<II', zlib.crc32(block) & 0xffffffff, len(block)))
+
+
+class TestCompression(object):
+    def test_open_input_should_read_plain_files(self, tmpdir):
+        filename = str(tmpdir.join('plain.tsv'))
+        with open(filename, 'w') as f:
+            f.write(CONTENT)
+        assert compression.detect_compression(filename) is None
+        with compression.open_input(filename) as f:
+            assert f.read() == CONTENT
+
+    def test_open_input_should_read_gzip_files(self, tmpdir):
+        filename = str(tmpdir.join('input.tsv.gz'))
+        with gzip.open(filename, 'wt') as f:
+            f.write(CONTENT)
+        assert compression.detect_compression(filename) == compression.GZIP
+        with compression.open_input(filename) as f:
+            assert list(f) == CONTENT.splitlines(keepends=True)
+
+    def test_open_input_should_read_bgzip_files(self, tmpdir):
+        filename = str(tmpdir.join('input.tsv.bgz'))
+        write_bgzip(filename, CONTENT.encode())
+        assert compression.detect_compression(filename) == compression.BGZIP
+        with compression.open_input(filename, threads=3) as f:
+            assert f.read() == CONTENT
+        with compression.open_input(filename, 'rb') as f:
+            assert f.read() == CONTENT.encode()
+
+    def test_open_input_should_read_zstd_files(self, tmpdir):
+        zstandard = pytest.importorskip('zstandard')
+        filename = str(tmpdir.join('input.tsv.zst'))
+        with open(filename, 'wb') as f:
+            f.write(zstandard.ZstdCompressor().compress(CONTENT.encode()))
+        assert compression.detect_compression(filename) == compression.ZSTD
+        with compression.open_input(filename) as f:
+            assert f.read() == CONTENT
+
+    def test_open_input_should_read_all_zstd_frames(self, tmpdir):
+        zstandard = pytest.importorskip('zstandard')
+        filename = str(tmpdir.join('input.tsv.zst'))
+        lines = CONTENT.splitlines(keepends=True)
+        half = len(lines) // 2
+        with open(filename, 'wb') as f:
+            f.write(zstandard.ZstdCompressor().compress(''.join(lines[:half]).encode()))
+            f.write(zstandard.ZstdCompressor().compress(''.join(lines[half:]).encode()))
+        with open(filename, 'rb') as raw:
+            assert compression._open_zstd(raw).read(len(CONTENT) + 1) == CONTENT.encode()
+        with compression.open_input(filename) as f:
+            assert f.read() == CONTENT
+
+    def test_open_input_should_stop_reading_when_closed_early(self, tmpdir):
+        filename = str(tmpdir.join('input.tsv.gz'))
+        with gzip.open(filename, 'wt') as f:
+            f.write(CONTENT * 10)
+        with compression.open_input(filename) as f:
+            assert f.readline() == 'seq0\tIPR000000\n'
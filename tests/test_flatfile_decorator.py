@@ -0,0 +1,121 @@
+import gzip
+import io
+import os
+
+from ena.flatfile_decorator.embl_reader import EmblRecord, iter_records, iter_records_file
+from ena.flatfile_decorator.flatfile_decorator import FlatfileDecorator, parse_accession
+from mgnify_util.parser.interproscan_cache import InterProScanCache, CachedAnnotationMap
+from mgnify_util.parser.interproscan_parser import InterProScanTSVResultParser
+from tests.test_interproscan_parser import I5_ANNOTATIONS
+
+EMBL_FILE = os.path.join(os.path.dirname(I5_ANNOTATIONS), 'transcripts.fasta.embl')
+
+
+def decorate_line_by_line(embl_file, annotation_map, i5_version, tag_name):
+    """
+        Former line based implementation of FlatfileDecorator.add_func_annotations.
+    """
+    output = []
+    annotations = None
+    with open(embl_file) as infile:
+        for aline in infile:
+            if 'AC *' in aline:
+                annotations = FlatfileDecorator.lookup_seq_id(parse_accession(aline), annotation_map)
+            if tag_name in aline:
+                new_line_start = aline[0:aline.index(tag_name) - 1]
+                if annotations:
+                    output.append(aline)
+                    for annot in annotations.get_all_annotations():
+                        output.append(f'{new_line_start}/inference="protein motif:{annot.database}:'
+                                      f'{annot.identifier}"\n')
+                    output.append(f'{new_line_start}/inference="ab initio prediction:InterProScan:{i5_version}"\n')
+            else:
+                output.append(aline)
+    return ''.join(output)
+
+
+def get_annotations():
+    parser = InterProScanTSVResultParser(I5_ANNOTATIONS)
+    parser.parse_file()
+    return parser.annotations
+
+
+class TestEmblReader(object):
+
+    def test_should_split_records(self):
+        with open(EMBL_FILE) as file:
+            content = file.read()
+        for read_size in (7, 100, 1 << 20):
+            records = list(iter_records(io.StringIO(content), read_size))
+            assert len(records) == 5
+            assert ''.join(record.text for record in records) == content
+            assert all(record.text.endswith('\n//\n') for record in records)
+
+    def test_should_yield_unterminated_last_record(self):
+        records = list(iter_records(io.StringIO('ID   A\n//\nID   B\n//'), 4))
+        assert [record.text for record in records] == ['ID   A\n//\n', 'ID   B\n//']
+
+    def test_should_parse_record_lazily(self, tmpdir):
+        compressed = tmpdir.join('transcripts.fasta.embl.gz')
+        with open(EMBL_FILE, 'rb') as file, gzip.open(str(compressed), 'wb') as out:
+            out.write(file.read())
+        record = next(iter_records_file(str(compressed)))
+        assert record.accession == 'TRINITY-DN10011-c0-g1-i1'
+        assert [feature.key for feature in record.features] == ['source', 'gene', 'mRNA', 'exon', "3'UTR", 'CDS']
+        cds = record.features[-1]
+        assert cds.location == 'complement(216..>920)'
+        assert cds.get_qualifiers('codon_start') == ['1']
+        assert cds.get_qualifiers('translation')[0].startswith('FWLKWLAQTSAADRSPCDLPPKSSRGRMADSAVSTADSSEWDLLDARDAS')
+
+
+class TestFlatfileDecorator(object):
+
+    def test_should_match_line_based_decoration(self, tmpdir):
+        annotations = get_annotations()
+        output_file = tmpdir.join('transcripts.fasta.new.embl')
+        FlatfileDecorator(EMBL_FILE, str(output_file)).add_func_annotations(annotations, '5.28-67.0',
+                                                                            'transl_table')
+        decorated = output_file.read()
+        assert decorated == decorate_line_by_line(EMBL_FILE, annotations, '5.28-67.0', 'transl_table')
+        assert '/inference="ab initio prediction:InterProScan:5.28-67.0"' in decorated
+
+    def test_cached_annotations_should_be_looked_up_per_chunk(self, tmpdir, monkeypatch):
+        with InterProScanCache(str(tmpdir.join('cache.sqlite')), '5.28-67.0') as cache:
+            parser = InterProScanTSVResultParser(I5_ANNOTATIONS)
+            parser.parse_file_cached(cache)
+            annotation_map = CachedAnnotationMap(parser.md5s, cache)
+            expected = decorate_line_by_line(EMBL_FILE, annotation_map, '5.28-67.0', 'transl_table')
+
+            lookups = []
+            bulk_lookup = cache.bulk_lookup
+            monkeypatch.setattr(cache, 'bulk_lookup', lambda md5s: lookups.append(md5s) or bulk_lookup(md5s))
+            monkeypatch.setattr(cache, 'get', None)
+            output_file = tmpdir.join('transcripts.fasta.new.embl')
+            FlatfileDecorator(EMBL_FILE, str(output_file)).add_func_annotations(annotation_map, '5.28-67.0',
+                                                                                'transl_table')
+            assert output_file.read() == expected
+            assert len(lookups) == 1
+
+    def test_parallel_decoration_should_keep_record_order(self, tmpdir):
+        annotations = get_annotations()
+        expected_file = tmpdir.join('serial.embl')
+        FlatfileDecorator(EMBL_FILE, str(expected_file)).add_func_annotations(annotations, '5.28-67.0',
+                                                                              'transl_table')
+        output_file = tmpdir.join('parallel.embl')
+        decorator = FlatfileDecorator(EMBL_FILE, str(output_file))
+        with open(EMBL_FILE) as infile, open(str(output_file), 'w') as outfile:
+            decorator._add_func_annotations_parallel(iter_records(infile), outfile, annotations, '5.28-67.0',
+                                                     'transl_table', threads=2, chunk_size=1)
+        assert output_file.read() == expected_file.read()
+
+        decorator.add_func_annotations(annotations, '5.28-67.0', 'transl_table', threads=2)
+        assert output_file.read() == expected_file.read()
+
+    def test_chunks_should_only_carry_their_annotations(self):
+        annotations = get_annotations()
+        with open(EMBL_FILE) as infile:
+            chunks = list(FlatfileDecorator._iter_chunks(iter_records(infile), annotations, 2))
+        assert [len(texts) for texts, _ in chunks] == [2, 2, 1]
+        for texts, chunk_annotations in chunks:
+            accessions = {EmblRecord(text).accession for text in texts}
+            assert {seq_id.rsplit('.', 1)[0] for seq_id in chunk_annotations} <= accessions
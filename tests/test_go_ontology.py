@@ -0,0 +1,84 @@
+from mgnify_util.parser.go_ontology import GeneOntology
+
+OBO = """format-version: 1.2
+
+[Term]
+id: GO:0000001
+name: root
+namespace: biological_process
+
+[Term]
+id: GO:0000002
+name: child
+is_a: GO:0000001 ! root
+
+[Term]
+id: GO:0000003
+name: part
+alt_id: GO:0000033
+relationship: part_of GO:0000001 ! root
+
+[Term]
+id: GO:0000004
+name: grandchild
+is_a: GO:0000002 ! child
+is_a: GO:0000003 ! part
+
+[Term]
+id: GO:0000005
+name: obsolete
+is_obsolete: true
+
+[Typedef]
+id: part_of
+name: part of
+"""
+
+
+def load_ontology(tmpdir, **kwargs):
+    obo_file = tmpdir.join('go.obo')
+    obo_file.write(OBO)
+    return GeneOntology.from_obo(str(obo_file), **kwargs)
+
+
+class TestGeneOntology(object):
+    def test_roll_up_should_return_all_ancestors(self, tmpdir):
+        go = load_ontology(tmpdir)
+        assert go.terms == ['GO:0000001', 'GO:0000002', 'GO:0000003', 'GO:0000004']
+        assert go.roll_up(['0000004']) == {'GO:0000001', 'GO:0000002', 'GO:0000003', 'GO:0000004'}
+        assert go.roll_up(['GO:0000033', 'GO:0000005']) == {'GO:0000001', 'GO:0000003'}
+
+    def test_roll_up_should_only_follow_requested_relationships(self, tmpdir):
+        go = load_ontology(tmpdir, relationships=('is_a',))
+        assert go.roll_up(['0000003']) == {'GO:0000003'}
+
+    def test_roll_up_to_slim(self, tmpdir):
+        go = load_ontology(tmpdir)
+        slim = ['GO:0000002', 'GO:0000003']
+        assert go.roll_up_to_slim(['0000004'], slim) == {'GO:0000002', 'GO:0000003'}
+        assert go.roll_up_to_slim(['0000001'], slim) == set()
+
+    def test_roll_up_sequences(self, tmpdir):
+        go = load_ontology(tmpdir)
+        sequences = {'seq1': ['0000002'], 'seq2': ['0000004', '0000002'], 'seq3': []}
+        assert go.roll_up_sequences(sequences, slim_terms=['GO:0000002']) == {'seq1': {'GO:0000002'},
+                                                                              'seq2': {'GO:0000002'},
+                                                                              'seq3': set()}
+        assert go.roll_up_sequences(sequences)['seq1'] == {'GO:0000001', 'GO:0000002'}
+
+    def test_roll_up_should_follow_parents_which_are_also_ancestors(self):
+        # GO:0000001 reaches GO:0000002 directly and through its other parent GO:0000003
+        go = GeneOntology({'GO:0000001': ['GO:0000002', 'GO:0000003'],
+                           'GO:0000002': ['GO:0000004'],
+                           'GO:0000003': ['GO:0000002'],
+                           'GO:0000004': []})
+        assert go.roll_up(['GO:0000003']) == {'GO:0000002', 'GO:0000003', 'GO:0000004'}
+        assert go.roll_up(['GO:0000001']) == {'GO:0000001', 'GO:0000002', 'GO:0000003', 'GO:0000004'}
+
+    def test_roll_up_should_handle_cycles(self):
+        go = GeneOntology({'GO:0000001': ['GO:0000002'],
+                           'GO:0000002': ['GO:0000003'],
+                           'GO:0000003': ['GO:0000002', 'GO:0000004'],
+                           'GO:0000004': []})
+        assert go.roll_up(['GO:0000002']) == {'GO:0000002', 'GO:0000003', 'GO:0000004'}
+        assert go.roll_up(['GO:0000001']) == {'GO:0000001', 'GO:0000002', 'GO:0000003', 'GO:0000004'}
@@ -0,0 +1,76 @@
+import pytest
+
+from mgnify_util.parser.interproscan_cache import InterProScanCache, CachedAnnotationMap
+from mgnify_util.parser.interproscan_parser import InterProScanTSVResultParser, FunctionalAnnotation, RowFilter
+
+from tests.test_interproscan_parser import I5_ANNOTATIONS
+
+
+class TestInterProScanCache(object):
+    def test_bulk_insert_and_lookup(self, tmpdir):
+        with InterProScanCache(str(tmpdir.join('cache.sqlite')), '5.30-69.0') as cache:
+            cache.bulk_insert({'md5a': {('InterPro', 'IPR013766'), ('GO', '0045454')}, 'md5b': set()})
+            assert len(cache) == 2
+            assert cache.contains(['md5a', 'md5b', 'md5c']) == {'md5a', 'md5b'}
+            assert cache.bulk_lookup(['md5a', 'md5c']) == {
+                'md5a': {FunctionalAnnotation('InterPro', 'IPR013766'), FunctionalAnnotation('GO', '0045454')}}
+
+    def test_trim_should_remove_least_recently_used_entries(self, tmpdir):
+        cache_file = str(tmpdir.join('cache.sqlite'))
+        with InterProScanCache(cache_file, '5.30-69.0', max_entries=2) as cache:
+            for md5 in ['md5a', 'md5b', 'md5c']:
+                cache.bulk_insert({md5: {('InterPro', 'IPR013766')}})
+            cache.get('md5a')
+        with InterProScanCache(cache_file, '5.30-69.0') as cache:
+            assert cache.contains(['md5a', 'md5b', 'md5c']) == {'md5a', 'md5c'}
+
+    def test_lookups_should_not_keep_a_write_transaction_open(self, tmpdir, monkeypatch):
+        monkeypatch.setattr('mgnify_util.parser.interproscan_cache.TOUCH_BATCH_SIZE', 2)
+        with InterProScanCache(str(tmpdir.join('cache.sqlite')), '5.30-69.0') as cache:
+            cache.bulk_insert({md5: {('InterPro', 'IPR013766')} for md5 in ['md5a', 'md5b', 'md5c']})
+            cache.get('md5a')
+            assert not cache._connection.in_transaction
+            cache.bulk_lookup(['md5b', 'md5c'])
+            assert not cache._connection.in_transaction
+            assert cache._touched == {}
+
+    def test_parse_file_cached_should_match_parse_file(self, tmpdir):
+        parser = InterProScanTSVResultParser(I5_ANNOTATIONS)
+        parser.parse_file()
+
+        with InterProScanCache(str(tmpdir.join('cache.sqlite')), '5.30-69.0') as cache:
+            for _ in range(2):
+                cached_parser = InterProScanTSVResultParser(I5_ANNOTATIONS)
+                cached_parser.parse_file_cached(cache, batch_size=1)
+                annotation_map = CachedAnnotationMap(cached_parser.md5s, cache)
+                assert set(annotation_map) == set(parser.annotations)
+                for seq_id, annotations in parser.annotations.items():
+                    assert annotation_map.get(seq_id).get_all_annotations() == annotations.get_all_annotations()
+                found = annotation_map.get_many(list(parser.annotations) + ['unknown'])
+                assert {seq_id: annotations.get_all_annotations() for seq_id, annotations in found.items()} == \
+                    {seq_id: annotations.get_all_annotations() for seq_id, annotations in parser.annotations.items()}
+
+    def test_entries_should_be_separated_by_version_and_row_filter(self, tmpdir):
+        cache_file = str(tmpdir.join('cache.sqlite'))
+        go_filter = RowFilter(annotation_types=['GO'])
+        with InterProScanCache(cache_file, '5.30-69.0', row_filter=go_filter) as cache:
+            filtered_parser = InterProScanTSVResultParser(I5_ANNOTATIONS, go_filter)
+            filtered_parser.parse_file_cached(cache)
+
+        parser = InterProScanTSVResultParser(I5_ANNOTATIONS)
+        parser.parse_file()
+        with InterProScanCache(cache_file, '5.30-69.0') as cache:
+            assert len(cache) == 0
+            cached_parser = InterProScanTSVResultParser(I5_ANNOTATIONS)
+            cached_parser.parse_file_cached(cache)
+            annotation_map = CachedAnnotationMap(cached_parser.md5s, cache)
+            for seq_id, annotations in parser.annotations.items():
+                assert annotation_map.get(seq_id).get_all_annotations() == annotations.get_all_annotations()
+        with InterProScanCache(cache_file, '5.31-70.0') as cache:
+            assert len(cache) == 0
+
+    def test_parse_file_cached_should_reject_a_cache_of_another_row_filter(self, tmpdir):
+        with InterProScanCache(str(tmpdir.join('cache.sqlite')), '5.30-69.0') as cache:
+            parser = InterProScanTSVResultParser(I5_ANNOTATIONS, RowFilter(annotation_types=['GO']))
+            with pytest.raises(ValueError):
+                parser.parse_file_cached(cache)
@@ -0,0 +1,59 @@
+import shutil
+
+import pytest
+
+from mgnify_util.parser.interproscan_index import build_index, InterProScanTSVIndex
+from mgnify_util.parser.interproscan_parser import InterProScanTSVResultParser
+
+from tests.test_interproscan_parser import I5_ANNOTATIONS
+
+
+class TestInterProScanTSVIndex(object):
+    def test_index_should_return_same_annotations_as_parser(self, tmpdir):
+        tsv_file = str(tmpdir.join('i5_annotations.tsv'))
+        shutil.copy(I5_ANNOTATIONS, tsv_file)
+        build_index(tsv_file)
+
+        parser = InterProScanTSVResultParser(tsv_file)
+        parser.parse_file()
+
+        with InterProScanTSVIndex(tsv_file) as index:
+            annotations = index.get_annotations(list(parser.annotations) + ['unknown'])
+        assert annotations.keys() == parser.annotations.keys()
+        for seq_id, seq_annotations in parser.annotations.items():
+            assert annotations[seq_id].get_all_annotations() == seq_annotations.get_all_annotations()
+
+    def test_index_should_reject_out_of_date_index(self, tmpdir):
+        tsv_file = str(tmpdir.join('i5_annotations.tsv'))
+        shutil.copy(I5_ANNOTATIONS, tsv_file)
+        build_index(tsv_file)
+        with open(tsv_file, 'a') as f:
+            f.write('seq\tmd5\t10\tPfam\tPF00085\tThioredoxin\t1\t10\t1E-5\tT\t18-02-2019\n')
+
+        with pytest.raises(ValueError):
+            InterProScanTSVIndex(tsv_file)
+
+    def test_index_should_be_sorted_and_find_non_consecutive_blocks(self, tmpdir):
+        tsv_file = str(tmpdir.join('i5_annotations.tsv'))
+        rows = ['seq_b\tmd5\t10\tPfam\tPF00085\tThioredoxin\t1\t10\t1E-5\tT\t18-02-2019\n',
+                'seq_a\tmd5\t10\tPfam\tPF00085\tThioredoxin\t1\t10\t1E-5\tT\t18-02-2019\n',
+                'seq_b\tmd5\t10\tPfam\tPF00009\tGTP_EFTU\t1\t10\t1E-5\tT\t18-02-2019\n']
+        with open(tsv_file, 'w') as f:
+            f.writelines(rows)
+        index_file = build_index(tsv_file)
+        with open(index_file) as f:
+            assert [line.split('\t')[0] for line in f][1:] == ['seq_a', 'seq_b', 'seq_b']
+
+        with InterProScanTSVIndex(tsv_file) as index:
+            assert 'seq_a' in index
+            assert 'seq' not in index
+            assert 'seq_c' not in index
+            assert list(index.get_rows('seq_b')) == [rows[0].rstrip('\n').split('\t'),
+                                                     rows[2].rstrip('\n').split('\t')]
+
+    def test_index_should_handle_empty_files(self, tmpdir):
+        tsv_file = str(tmpdir.join('i5_annotations.tsv'))
+        open(tsv_file, 'w').close()
+        build_index(tsv_file)
+        with InterProScanTSVIndex(tsv_file) as index:
+            assert index.get_annotations(['seq_a']) == {}
@@ -0,0 +1,45 @@
+import math
+
+from mgnify_util.parser.interproscan_matches import InterProScanMatches
+
+from tests.test_interproscan_parser import I5_ANNOTATIONS
+
+
+def read_rows():
+    with open(I5_ANNOTATIONS) as f:
+        return [line.rstrip('\n').split('\t') for line in f]
+
+
+class TestInterProScanMatches(object):
+    def test_from_file_should_keep_coordinates_of_every_match(self):
+        rows = read_rows()
+        matches = InterProScanMatches.from_file(I5_ANNOTATIONS)
+        assert len(matches) == len(rows)
+        for index, row in enumerate(rows):
+            match = matches.get_match(index)
+            assert match.seq_id == row[0]
+            assert match.database == row[3]
+            assert match.signature == row[4]
+            assert (match.start, match.end) == (int(row[6]), int(row[7]))
+            if row[8] == '-':
+                assert math.isnan(match.evalue)
+            else:
+                assert match.evalue == float(row[8])
+            assert match.interpro == (row[11] if len(row) > 11 and row[11] else None)
+
+    def test_overlapping_should_match_brute_force_search(self):
+        rows = read_rows()
+        matches = InterProScanMatches.from_file(I5_ANNOTATIONS)
+        for seq_id in {row[0] for row in rows}:
+            for start, end in [(1, 10), (50, 70), (100, 100), (150, 400), (1000, 2000)]:
+                expected = sorted((row[4], int(row[6]), int(row[7])) for row in rows
+                                  if row[0] == seq_id and int(row[6]) <= end and int(row[7]) >= start)
+                found = sorted((m.signature, m.start, m.end) for m in matches.overlapping(seq_id, start, end))
+                assert found == expected
+        assert matches.overlapping('unknown', 1, 100) == []
+
+    def test_get_sequence_matches_should_order_by_start(self):
+        matches = InterProScanMatches.from_file(I5_ANNOTATIONS)
+        seq_matches = matches.get_sequence_matches('TRINITY-DN10052-c0-g1-i1.p1')
+        assert seq_matches
+        assert [m.start for m in seq_matches] == sorted(m.start for m in seq_matches)
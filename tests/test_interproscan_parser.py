@@ -0,0 +1,136 @@
+import gzip
+import logging
+import os
+
+import pytest
+
+from mgnify_util.parser.interproscan_parser import InterProScanTSVResultParser, FunctionalAnnotation, \
+    CompactAnnotationStore, AnnotationVocabulary, RowFilter, split_byte_ranges
+
+I5_ANNOTATIONS = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'ena',
+                              'flatfile_decorator', 'test-inputs', 'transcripts.fasta.i5_annotations')
+
+
+class TestInterProScanTSVResultParser(object):
+    def test_parse_file_should_map_sequences_to_annotations(self):
+        parser = InterProScanTSVResultParser(I5_ANNOTATIONS)
+        parser.parse_file()
+        annotations = parser.annotations['TRINITY-DN10052-c0-g1-i1.p1'].get_all_annotations()
+        assert FunctionalAnnotation('InterPro', 'IPR013766') in annotations
+        assert FunctionalAnnotation('GO', '0045454') in annotations
+
+    def test_iter_sequences_should_yield_same_annotations_as_parse_file(self):
+        parser = InterProScanTSVResultParser(I5_ANNOTATIONS)
+        parser.parse_file()
+
+        streamed = {}
+        for seq_id, annotations in InterProScanTSVResultParser(I5_ANNOTATIONS).iter_sequences():
+            assert seq_id not in streamed
+            streamed[seq_id] = annotations.get_all_annotations()
+
+        assert streamed.keys() == parser.annotations.keys()
+        for seq_id, annotations in parser.annotations.items():
+            assert streamed[seq_id] == annotations.get_all_annotations()
+
+    def test_iter_sequence_annotation_ids_should_yield_same_annotations_as_iter_sequences(self):
+        vocabulary = AnnotationVocabulary()
+        streamed = [(seq_id, {vocabulary.annotations[annotation_id] for annotation_id in annotation_ids})
+                    for seq_id, annotation_ids in
+                    InterProScanTSVResultParser(I5_ANNOTATIONS).iter_sequence_annotation_ids(vocabulary)]
+        assert streamed == [(seq_id, annotations.get_all_annotations()) for seq_id, annotations in
+                            InterProScanTSVResultParser(I5_ANNOTATIONS).iter_sequences()]
+
+    def test_parse_file_compact_should_support_get_all_annotations(self):
+        parser = InterProScanTSVResultParser(I5_ANNOTATIONS)
+        parser.parse_file()
+
+        compact_parser = InterProScanTSVResultParser(I5_ANNOTATIONS)
+        compact_parser.parse_file(compact=True)
+        store = compact_parser.annotations
+
+        assert len(store) == len(parser.annotations)
+        assert 'unknown' not in store
+        assert store.get('unknown') is None
+        for seq_id, annotations in parser.annotations.items():
+            assert seq_id in store
+            assert store.get(seq_id).get_all_annotations() == annotations.get_all_annotations()
+
+    def test_compact_annotation_store_should_merge_non_consecutive_rows(self):
+        store = CompactAnnotationStore()
+        first = store.new_annotation_ids()
+        first.add_annotation('InterPro', 'IPR013766')
+        store.add_sequence('seq1', first.ids)
+        second = store.new_annotation_ids()
+        second.add_annotation('GO', '0045454')
+        second.add_annotation('InterPro', 'IPR013766')
+        store.add_sequence('seq1', second.ids)
+
+        assert len(store.vocabulary) == 2
+        assert store['seq1'].get_all_annotations() == {FunctionalAnnotation('InterPro', 'IPR013766'),
+                                                        FunctionalAnnotation('GO', '0045454')}
+
+    def test_split_byte_ranges_should_align_ranges_to_lines(self):
+        byte_ranges = split_byte_ranges(I5_ANNOTATIONS, 7)
+        assert byte_ranges[0][0] == 0
+        assert byte_ranges[-1][1] == os.path.getsize(I5_ANNOTATIONS)
+        with open(I5_ANNOTATIONS, 'rb') as f:
+            content = f.read()
+        for (start, end), (next_start, _) in zip(byte_ranges, byte_ranges[1:]):
+            assert end == next_start
+            assert content[start - 1:start] in (b'', b'\n')
+
+    def test_parse_file_parallel_should_match_serial_parse(self):
+        parser = InterProScanTSVResultParser(I5_ANNOTATIONS)
+        parser.parse_file()
+
+        parallel_parser = InterProScanTSVResultParser(I5_ANNOTATIONS)
+        parallel_parser.parse_file_parallel(processes=2, chunks=5)
+
+        assert isinstance(parallel_parser.annotations, CompactAnnotationStore)
+        assert parallel_parser.annotations.keys() == parser.annotations.keys()
+        for seq_id, annotations in parser.annotations.items():
+            assert parallel_parser.annotations[seq_id].get_all_annotations() == annotations.get_all_annotations()
+
+    def test_parse_file_should_read_gzip_input(self, tmpdir, caplog):
+        parser = InterProScanTSVResultParser(I5_ANNOTATIONS)
+        parser.parse_file()
+
+        compressed_file = str(tmpdir.join('i5_annotations.gz'))
+        with open(I5_ANNOTATIONS, 'rb') as f_in, gzip.open(compressed_file, 'wb') as f_out:
+            f_out.write(f_in.read())
+        gzip_parser = InterProScanTSVResultParser(compressed_file)
+        with caplog.at_level(logging.INFO):
+            gzip_parser.parse_file_parallel(processes=2)
+        assert 'parsing {} serially'.format(compressed_file) in caplog.text
+
+        assert gzip_parser.annotations.keys() == parser.annotations.keys()
+        for seq_id, annotations in parser.annotations.items():
+            assert gzip_parser.annotations[seq_id].get_all_annotations() == annotations.get_all_annotations()
+
+    def test_row_filter_should_drop_rows_and_annotation_types_while_parsing(self):
+        row_filter = RowFilter(databases=['Pfam'], max_evalue=1e-5, status='T', annotation_types=['GO'])
+        parser = InterProScanTSVResultParser(I5_ANNOTATIONS, row_filter)
+        parser.parse_file()
+
+        expected = {}
+        with open(I5_ANNOTATIONS) as f:
+            for line in f:
+                row = line.rstrip('\n').split('\t')
+                if row[3] == 'Pfam' and float(row[8]) <= 1e-5 and row[9] == 'T':
+                    annotations = expected.setdefault(row[0], set())
+                    for column in row[11:]:
+                        if column.startswith('GO:'):
+                            annotations.update(FunctionalAnnotation('GO', go.replace('GO:', ''))
+                                               for go in column.split('|'))
+        assert expected
+        assert {seq_id: annotations.get_all_annotations()
+                for seq_id, annotations in parser.annotations.items()} == expected
+
+        parallel_parser = InterProScanTSVResultParser(I5_ANNOTATIONS, row_filter)
+        parallel_parser.parse_file_parallel(processes=2)
+        assert {seq_id: annotations.get_all_annotations()
+                for seq_id, annotations in parallel_parser.annotations.items()} == expected
+
+    def test_row_filter_should_reject_unknown_annotation_types(self):
+        with pytest.raises(ValueError):
+            RowFilter(annotation_types=['Pfam'])
@@ -1,7 +1,8 @@
+import csv
 from datetime import datetime
 import pytest
 
-from mgnify_backlog import mgnify_handler
+from mgnify_backlog import mgnify_handler, job_state_cli, study_summary_cli
 
 from backlog.models import Study, Run, RunAssembly, AssemblyJob, Assembler, AssemblyJobStatus, RunAssemblyJob, \
     User, Pipeline, UserRequest, Assembly, AnnotationJob, AnnotationJobStatus
@@ -194,6 +195,15 @@ class TestBacklogHandler(object):
         assert run_assembly.run.pk == run.pk
         assert run_assembly.assembly.pk == assembly.pk
 
+    def test_create_assembly_obj_should_link_first_run_of_invalid_alias_range(self):
+        study = mgnify.create_study_obj(study_data)
+        run = mgnify.create_run_obj(study, run_data)
+        for alias in ['{}-20190101', '{}-ERR999999999']:
+            assembly_data_w_range = dict(assembly_data, analysis_alias=alias.format(run.primary_accession))
+            assembly = mgnify.create_assembly_obj(ena, study, assembly_data_w_range, public=True)
+            assert [link.run.pk for link in RunAssembly.objects.filter(assembly=assembly)] == [run.pk]
+            assembly.delete()
+
     def test_create_assembly_job_should_set_latest_assembler(self):
         study = mgnify.create_study_obj(study_data)
         run = mgnify.create_run_obj(study, run_data)
@@ -817,3 +827,190 @@ class TestBacklogHandler(object):
         assert 3 == len(AnnotationJob.objects.all())
         jobs = mgnify.get_annotation_jobs(status_descriptions=['RUNNING'])
         assert 0 == len(jobs)
+
+    def test_get_study_summary_should_count_runs_and_annotation_jobs(self):
+        study, _ = create_annotation_jobs_without_ena_services()
+        version = Pipeline.objects.first().version
+
+        summary = mgnify_handler.MgnifyHandler('default').get_study_summary(study)
+        assert summary['runs'] == 3
+        assert summary['assemblies'] == 0
+        assert summary['annotation_jobs'] == {(version, 'SCHEDULED'): 3}
+        assert summary['assembly_jobs'] == {}
+
+    def test_get_study_summary_should_see_writes_of_other_handlers(self):
+        handler = mgnify_handler.MgnifyHandler('default')
+        study, runs = create_annotation_jobs_without_ena_services()
+        version = Pipeline.objects.first().version
+        assert handler.get_study_summary(study)['annotation_jobs'] == {(version, 'SCHEDULED'): 3}
+
+        request = UserRequest.objects.first()
+        mgnify.create_annotation_job(request, runs[0], 1)
+        assert handler.get_study_summary(study)['annotation_jobs'] == {(version, 'SCHEDULED'): 4}
+
+        mgnify.update_annotation_jobs_status(mgnify.get_annotation_jobs(run_or_assembly_accessions=['ERR164407']),
+                                             'RUNNING')
+        assert handler.get_study_summary(study)['annotation_jobs'] == {(version, 'SCHEDULED'): 2,
+                                                                       (version, 'RUNNING'): 2}
+
+        data = copy.deepcopy(run_data)
+        data['run_accession'] = 'ERR164410'
+        mgnify.create_run_obj(study, data)
+        assert handler.get_study_summary(study)['runs'] == 4
+
+    def test_rebuild_study_summary_should_recount_changes_outside_the_handler(self):
+        study, _ = create_annotation_jobs_without_ena_services()
+        assert mgnify.get_study_summary(study)['runs'] == 3
+
+        Run.objects.filter(primary_accession='ERR164409').delete()
+        assert mgnify.get_study_summary(study)['runs'] == 3
+        assert study_summary_cli.rebuild_study_summary(mgnify, [study.secondary_accession]) == 1
+        assert mgnify.get_study_summary(study)['runs'] == 2
+
+    def test_write_study_summary_should_write_counts_per_study(self, tmpdir):
+        study, _ = create_annotation_jobs_without_ena_services()
+        version = Pipeline.objects.first().version
+        summary_file = str(tmpdir.join('summary.tsv'))
+
+        assert study_summary_cli.write_study_summary(mgnify, summary_file) == 1
+        with open(summary_file) as fh:
+            rows = list(csv.DictReader(fh, delimiter='\t'))
+        assert rows == [{'study': study.secondary_accession, 'runs': '3', 'assemblies': '0',
+                         'job_type': 'annotation', 'pipeline': str(version), 'status': 'SCHEDULED', 'jobs': '3'}]
+
+    def test_create_annotation_jobs_bulk_should_create_jobs_for_all_runs(self):
+        study = mgnify.create_study_obj(study_data)
+        runs = []
+        for run_acc in ['ERR164407', 'ERR164408', 'ERR164409']:
+            data = copy.deepcopy(run_data)
+            data['run_accession'] = run_acc
+            runs.append(mgnify.create_run_obj(study, data))
+        Pipeline(version=4.1).save()
+        user = mgnify.create_user(user_data['webin_id'], user_data['email_address'], user_data['first_name'],
+                                  user_data['surname'])
+        request = mgnify.create_user_request(user, 1, 0)
+
+        jobs = mgnify.create_annotation_jobs_bulk(request, runs, 1)
+        assert len(jobs) == 3
+        assert len(AnnotationJob.objects.all()) == 3
+        for run in runs:
+            job = AnnotationJob.objects.get(runannotationjob__run=run)
+            assert job.status.description == 'SCHEDULED'
+            assert job.priority == 1
+
+    def test_create_annotation_jobs_bulk_should_skip_runs_with_existing_jobs(self):
+        study, runs = create_annotation_jobs_without_ena_services()
+        assert len(AnnotationJob.objects.all()) == 3
+
+        data = copy.deepcopy(run_data)
+        data['run_accession'] = 'ERR164410'
+        new_run = mgnify.create_run_obj(study, data)
+
+        jobs = mgnify.create_annotation_jobs_bulk(UserRequest.objects.first(), runs + [new_run], 1)
+        assert len(jobs) == 1
+        assert len(AnnotationJob.objects.all()) == 4
+        assert AnnotationJob.objects.get(runannotationjob__run=new_run).pk == jobs[0].pk
+
+    def test_create_annotation_jobs_bulk_should_select_ids_without_returning_bulk_insert(self, monkeypatch):
+        study, runs = create_annotation_jobs_without_ena_services()
+        request = UserRequest.objects.first()
+        new_runs = []
+        for run_acc in ['ERR164410', 'ERR164411', 'ERR164412']:
+            data = copy.deepcopy(run_data)
+            data['run_accession'] = run_acc
+            new_runs.append(mgnify.create_run_obj(study, data))
+        assert mgnify._can_return_bulk_insert_ids() in (True, False)
+        monkeypatch.setattr(mgnify, '_can_return_bulk_insert_ids', lambda: False)
+
+        jobs = mgnify.create_annotation_jobs_bulk(request, iter(runs + new_runs + new_runs[:1]), 1, batch_size=2)
+        assert len(jobs) == 3
+        assert len(AnnotationJob.objects.all()) == 6
+        for run, job in zip(new_runs, jobs):
+            assert AnnotationJob.objects.get(runannotationjob__run=run).pk == job.pk
+
+    @pytest.mark.parametrize('file_format', ['tsv', 'columnar'])
+    def test_job_state_export_and_import_should_apply_edited_state(self, tmpdir, file_format):
+        create_annotation_jobs_without_ena_services()
+        export_file = str(tmpdir.join('jobs'))
+        job_state_cli.export_job_states(mgnify, export_file, file_format)
+
+        with job_state_cli.open_job_state_file(export_file, file_format, 'r') as fh:
+            rows = list(job_state_cli.get_format(file_format).read(fh))
+        assert len(rows) == 3
+        for row in rows:
+            assert row['status'] == 'SCHEDULED'
+            row['status'] = 'RUNNING'
+            row['priority'] = 3
+
+        with job_state_cli.open_job_state_file(export_file, file_format, 'w') as fh:
+            job_state_cli.get_format(file_format).write(fh, [[row[c] for c in job_state_cli.COLUMNS] for row in rows])
+
+        assert job_state_cli.import_job_states(mgnify, export_file, file_format, chunk_size=2) == 3
+        for job in AnnotationJob.objects.all():
+            assert job.status.description == 'RUNNING'
+            assert job.priority == 3
+
+    def test_job_state_import_should_only_apply_changed_fields(self, tmpdir):
+        create_annotation_jobs_without_ena_services()
+        export_file = str(tmpdir.join('jobs.tsv'))
+        job_state_cli.export_job_states(mgnify, export_file)
+
+        with job_state_cli.open_job_state_file(export_file, 'tsv', 'r') as fh:
+            rows = list(job_state_cli.TSVJobStateFormat.read(fh))
+        rows[0]['status'] = 'RUNNING'
+        rows[1]['priority'] = ''
+        rows[2]['pipeline'] = ''
+        with job_state_cli.open_job_state_file(export_file, 'tsv', 'w') as fh:
+            job_state_cli.TSVJobStateFormat.write(fh, [[row[c] for c in job_state_cli.COLUMNS] for row in rows])
+
+        assert job_state_cli.import_job_states(mgnify, export_file) == 1
+        assert AnnotationJob.objects.get(pk=rows[0]['job_id']).status.description == 'RUNNING'
+        for row in rows[1:]:
+            job = AnnotationJob.objects.get(pk=row['job_id'])
+            assert job.status.description == 'SCHEDULED'
+            assert job.priority == 4
+
+    def test_job_state_import_should_reject_edits_to_other_columns(self, tmpdir):
+        create_annotation_jobs_without_ena_services()
+        export_file = str(tmpdir.join('jobs.tsv'))
+        job_state_cli.export_job_states(mgnify, export_file)
+
+        with job_state_cli.open_job_state_file(export_file, 'tsv', 'r') as fh:
+            rows = list(job_state_cli.TSVJobStateFormat.read(fh))
+        rows[0]['status'] = 'RUNNING'
+        rows[2]['pipeline'] = '5.0'
+        with job_state_cli.open_job_state_file(export_file, 'tsv', 'w') as fh:
+            job_state_cli.TSVJobStateFormat.write(fh, [[row[c] for c in job_state_cli.COLUMNS] for row in rows])
+
+        with pytest.raises(ValueError):
+            job_state_cli.import_job_states(mgnify, export_file, chunk_size=2)
+        for job in AnnotationJob.objects.all():
+            assert job.status.description == 'SCHEDULED'
+
+    @pytest.mark.parametrize('chunk_size', [None, 2])
+    def test_update_runs_library_strategy_should_update_runs_of_jobs(self, chunk_size):
+        create_annotation_jobs_without_ena_services()
+        jobs = mgnify.get_annotation_jobs(run_or_assembly_accessions=['ERR164407', 'ERR164408'])
+
+        assert mgnify.update_runs_library_strategy(jobs, 'AMPLICON', chunk_size) == 2
+        for run in Run.objects.all():
+            if run.primary_accession in ('ERR164407', 'ERR164408'):
+                assert run.library_strategy == 'AMPLICON'
+            else:
+                assert run.library_strategy == 'WGS'
+
+    def test_create_assembly_run_links_should_skip_existing_links(self):
+        study = mgnify.create_study_obj(study_data)
+        runs = []
+        for run_acc in ['ERR164407', 'ERR164408']:
+            data = copy.deepcopy(run_data)
+            data['run_accession'] = run_acc
+            runs.append(mgnify.create_run_obj(study, data))
+        assembly = mgnify.create_assembly_obj(ena, study, assembly_data, public=True)
+        assert len(RunAssembly.objects.all()) == 1
+
+        links = mgnify.create_assembly_run_links(ena, {assembly.primary_accession: ['ERR164407', 'ERR164408'],
+                                                       'ERZ000000': ['ERR164407']})
+        assert len(links) == 1
+        assert links[0].run.pk == runs[1].pk
+        assert len(RunAssembly.objects.filter(assembly=assembly)) == 2
@@ -0,0 +1,59 @@
+import pytest
+
+from ena.flatfile_decorator.prototype_rna_webin_feature_builder import build_rfam_lookup, parse_rfam_lookup_file
+from mgnify_util.parser.cmsearch_deoverlap_parser import RfamEntriesFileParser
+from mgnify_util.parser.rfam_catalogue import DEFAULT_FAMILY_LOOKUP_FILE, DEFAULT_QUERY_RESULT_FILE, RNAType, \
+    build_catalogue, classify_rna_type, load_catalogue, read_catalogue, write_catalogue
+
+
+class TestRfamCatalogue(object):
+
+    def test_classify_rna_type(self):
+        assert classify_rna_type('5S_rRNA', 'Gene; rRNA;') == (RNAType.R_RNA, None)
+        assert classify_rna_type('tRNA', 'Gene; tRNA;') == (RNAType.T_RNA, None)
+        assert classify_rna_type('U1', 'Gene; snRNA; splicing;') == (RNAType.NC_RNA, 'snRNA')
+        assert classify_rna_type('FMN', 'Cis-reg; riboswitch;') == (RNAType.NC_RNA, 'other')
+
+    def test_shipped_catalogue_should_match_text_files(self):
+        catalogue = load_catalogue()
+        assert catalogue is load_catalogue()
+        assert catalogue.families == build_catalogue()
+        assert len(catalogue) == 3016
+
+        family = catalogue.get('RF00001')
+        assert (family.name, family.description, family.length, family.rna_type) == \
+               ('5S_rRNA', '5S ribosomal RNA', 119, 'rRNA')
+        assert catalogue.get_by_name('Archaea_SRP').nc_rna_class == 'SRP_RNA'
+        assert catalogue.get_rna_type('RF00005') == RNAType.T_RNA
+        assert catalogue.get('RF99999') is None
+
+    def test_write_and_read_catalogue(self, tmpdir):
+        families = build_catalogue(DEFAULT_FAMILY_LOOKUP_FILE, None, None, None)
+        output_file = tmpdir.join('rfam.bin')
+        write_catalogue(families, str(output_file))
+        assert read_catalogue(output_file.read_binary()) == families
+        with pytest.raises(ValueError):
+            read_catalogue(b'not a catalogue')
+
+    def test_conflicting_lengths_should_fail(self, tmpdir):
+        lengths = tmpdir.join('lengths.tsv')
+        lengths.write('RF00001\t120\n')
+        with pytest.raises(ValueError):
+            build_catalogue(DEFAULT_FAMILY_LOOKUP_FILE, str(lengths), None, None)
+
+    def test_parsers_should_default_to_catalogue(self):
+        from_catalogue = build_rfam_lookup()
+        from_file = parse_rfam_lookup_file(DEFAULT_FAMILY_LOOKUP_FILE)
+        assert from_catalogue.keys() == from_file.keys()
+        # The curated ncRNA class map corrects the RNase P families, derived as ribozyme from their Rfam type
+        assert from_file['RF00010'].nc_rna_class == 'ribozyme'
+        assert from_catalogue['RF00010'].nc_rna_class == 'RNase_P_RNA'
+        for accession, entry in from_file.items():
+            if entry.name not in ('RNaseP_nuc', 'RNaseP_bact_a', 'RNaseP_bact_b', 'RNaseP_arch', 'RNase_P'):
+                assert vars(from_catalogue[accession]) == vars(entry)
+
+        from_catalogue = RfamEntriesFileParser()
+        from_catalogue.parse_file()
+        from_file = RfamEntriesFileParser(DEFAULT_QUERY_RESULT_FILE)
+        from_file.parse_file()
+        assert from_catalogue.get_all_entries() == from_file.get_all_entries()
@@ -0,0 +1,66 @@
+import math
+
+from mgnify_util.parser.cmsearch_deoverlap_parser import CMSearchMatchColumns, DeoverlapResultParser
+from mgnify_util.parser.rfam_statistics import compute_statistics, end_completeness_flags, get_sample_name, \
+    match_coverage, main
+from tests.test_cmsearch_deoverlap_parser import DEOVERLAPPED_FILE
+
+
+def make_columns():
+    # RF00001 (5S_rRNA, rRNA) has a model length of 119, RF00005 (tRNA) of 71
+    columns = CMSearchMatchColumns()
+    columns.add_match('seq1', 'RF00001', 1, 119, '+', 90.0, 1e-20, 1, 119)
+    columns.add_match('seq2', 'RF00001', 500, 441, '-', 40.0, 1e-8, 3, 62)
+    columns.add_match('seq3', 'RF00005', 10, 75, '+', 50.0, 1e-10, 1, 66)
+    columns.add_match('seq4', 'RF99999', 10, 75, '+', 50.0, 1e-10, 1, 66)
+    return columns
+
+
+class TestRfamStatistics(object):
+
+    def test_match_coverage(self):
+        coverage, missing_start, missing_end = match_coverage(make_columns())
+        assert list(coverage[:3]) == [1.0, 60 / 119, 66 / 71]
+        assert math.isnan(coverage[3])
+        assert list(missing_start) == [0, 2, 0, -1]
+        assert list(missing_end) == [0, 57, 5, -1]
+
+    def test_end_completeness_flags(self):
+        start_complete, end_complete = end_completeness_flags(make_columns(), max_missing=5)
+        assert list(start_complete) == [1, 1, 1, 0]
+        assert list(end_complete) == [1, 0, 1, 0]
+
+    def test_compute_statistics_for_many_thresholds(self):
+        statistics = compute_statistics({'sample1': make_columns()}, coverage_thresholds=(0.5, 0.95),
+                                        missing_thresholds=(0, 5))
+        sample = statistics['sample']['sample1']
+        assert sample.matches == 3
+        assert sample.complete == {0.5: 3, 0.95: 1}
+        assert sample.partial == {0.5: 0, 0.95: 2}
+        assert sample.ends_complete == {0: 1, 5: 2}
+        assert sample.ends_partial == {0: 2, 5: 1}
+
+        assert set(statistics['family']) == {'RF00001', 'RF00005'}
+        assert statistics['family']['RF00001'].matches == 2
+        rrna = statistics['rna_type']['rRNA']
+        assert rrna.complete == {0.5: 2, 0.95: 1}
+        assert math.isclose(rrna.mean_coverage, (1.0 + 60 / 119) / 2)
+        assert statistics['rna_type']['tRNA'].ends_complete == {0: 0, 5: 1}
+
+    def test_compute_statistics_per_sample(self):
+        columns = DeoverlapResultParser(DEOVERLAPPED_FILE).parse_file_columnar()
+        statistics = compute_statistics({'a': columns, 'b': make_columns()})
+        assert statistics['sample']['a'].matches == len(columns)
+        assert sum(stats.matches for stats in statistics['rna_type'].values()) == len(columns) + 3
+        assert sum(stats.matches for stats in statistics['family'].values()) == len(columns) + 3
+
+    def test_main_should_write_report(self, tmpdir):
+        output_file = tmpdir.join('report.tsv')
+        main([DEOVERLAPPED_FILE, '-o', str(output_file), '-c', '0.5', '0.9', '-m', '5'])
+        lines = output_file.readlines()
+        assert lines[0].rstrip('\n').split('\t') == ['level', 'group', 'matches', 'mean_coverage',
+                                                     'complete_coverage_0.5', 'partial_coverage_0.5',
+                                                     'complete_coverage_0.9', 'partial_coverage_0.9',
+                                                     'complete_ends_5', 'partial_ends_5']
+        assert lines[1].startswith('sample\tcat_cmsearch_matches\t256\t')
+        assert get_sample_name('ERR1.tbl.deoverlapped.gz') == 'ERR1'
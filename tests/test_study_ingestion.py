@@ -0,0 +1,96 @@
+import os
+import threading
+import time
+from unittest import mock
+
+import pytest
+
+from mgnify_backlog import study_ingestion
+
+
+@pytest.fixture
+def workers(monkeypatch):
+    # Worker processes are forked, so they inherit the patched handlers
+    monkeypatch.setattr(study_ingestion.django.db, 'connections', mock.Mock())
+    monkeypatch.setattr(study_ingestion, 'MgnifyHandler', mock.Mock())
+    monkeypatch.setattr(study_ingestion.ena_handler, 'EnaApiHandler', mock.Mock())
+
+    def patch_ingest_study(ingest_study):
+        monkeypatch.setattr(study_ingestion, 'ingest_study', ingest_study)
+
+    return patch_ingest_study
+
+
+def first_call(tmpdir, study_accession):
+    """
+        True the first time it is called for a study, across worker processes.
+    """
+    marker = tmpdir.join(study_accession)
+    try:
+        fd = os.open(str(marker), os.O_CREAT | os.O_EXCL)
+    except FileExistsError:
+        return False
+    os.close(fd)
+    return True
+
+
+def total(stats, attribute):
+    return sum(getattr(worker_stats, attribute) for worker_stats in stats.values())
+
+
+class TestIngestStudies(object):
+    def test_should_ingest_all_studies(self, workers):
+        workers(lambda mgnify, ena, study_accession: None)
+        studies = ['ERP{}'.format(i) for i in range(10)]
+        stats, failed = study_ingestion.ingest_studies(studies + studies[:3], processes=3)
+        assert failed == {}
+        assert total(stats, 'ingested') == 10
+        assert total(stats, 'failed') == 0
+        assert set(stats) == {0, 1, 2}
+
+    def test_should_retry_failed_studies_up_to_max_attempts(self, workers, tmpdir):
+        def ingest_study(mgnify, ena, study_accession):
+            if study_accession == 'ERP_BROKEN':
+                raise ValueError('broken study')
+            if study_accession == 'ERP_FLAKY' and first_call(tmpdir, study_accession):
+                raise IOError('timeout')
+
+        workers(ingest_study)
+        stats, failed = study_ingestion.ingest_studies(['ERP1', 'ERP_BROKEN', 'ERP_FLAKY'], processes=2,
+                                                       max_attempts=3)
+        assert failed == {'ERP_BROKEN': 'ValueError: broken study'}
+        assert total(stats, 'ingested') == 2
+        assert total(stats, 'failed') == 4
+
+    def test_should_replace_dead_workers(self, workers, tmpdir):
+        def ingest_study(mgnify, ena, study_accession):
+            if study_accession == 'ERP_KILLED':
+                os._exit(1)
+            if study_accession == 'ERP_KILLED_ONCE' and first_call(tmpdir, study_accession):
+                os._exit(1)
+
+        workers(ingest_study)
+        stats, failed = study_ingestion.ingest_studies(['ERP1', 'ERP_KILLED', 'ERP_KILLED_ONCE', 'ERP2'],
+                                                       processes=2, max_attempts=2)
+        assert failed == {'ERP_KILLED': 'Worker exited with code 1'}
+        assert total(stats, 'ingested') == 3
+        assert total(stats, 'failed') == 3
+
+    def test_should_restart_workers_which_died_while_idle(self, workers, tmpdir):
+        def ingest_study(mgnify, ena, study_accession):
+            if study_accession == 'ERP_EXIT':
+                # Exits once the result has been sent and the worker waits for its next study
+                threading.Timer(0.1, os._exit, [0]).start()
+            if study_accession == 'ERP_SLOW' and first_call(tmpdir, study_accession):
+                time.sleep(1)
+                raise IOError('timeout')
+
+        workers(ingest_study)
+        stats, failed = study_ingestion.ingest_studies(['ERP_EXIT', 'ERP_SLOW'], processes=2)
+        assert failed == {}
+        assert total(stats, 'ingested') == 2
+        assert total(stats, 'failed') == 1
+
+    def test_should_require_a_worker_process(self, workers):
+        with pytest.raises(ValueError):
+            study_ingestion.ingest_studies(['ERP1'], processes=0)
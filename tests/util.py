@@ -1,5 +1,7 @@
 from backlog.models import *
 
+from mgnify_backlog.mgnify_handler import MgnifyHandler
+
 
 def clean_db():
     AssemblyJob.objects.all().delete()
@@ -19,6 +21,9 @@ def clean_db():
     Pipeline.objects.all().delete()
     Assembler.objects.all().delete()
 
+    # Drops the summary rows of the deleted studies
+    MgnifyHandler('default').rebuild_study_summaries()
+
 
 study_data = {
     'study_accession': 'PRJEB1787',